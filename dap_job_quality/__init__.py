@@ -1,17 +1,27 @@
-"""dap_job_quality."""
+"""dap_job_quality.
+
+Importing the package doesn't read any files: the root logger is given the
+console handler of config/logging.yaml straight away (unless it already has
+handlers), the package logger is configured from config/logging.yaml when its
+first record is logged, and the base config is read when
+`dap_job_quality.config` is first accessed.
+"""
+from functools import lru_cache
 import logging
 import logging.config
 from pathlib import Path
+import sys
+import threading
 from typing import Optional
 
-import yaml
-
 BUCKET_NAME = "open-jobs-lake"
 PRINZ_BUCKET_NAME = "prinz-green-jobs"
 
 
 def get_yaml_config(file_path: Path) -> Optional[dict]:
     """Fetch yaml config and return as dict if it exists."""
+    import yaml
+
     if file_path.exists():
         with open(file_path, "rt") as f:
             return yaml.load(f.read(), Loader=yaml.FullLoader)
@@ -24,15 +34,64 @@ PROJECT_DIR = Path(__file__).resolve().parents[1]
 info_out = str(PROJECT_DIR / "info.log")
 error_out = str(PROJECT_DIR / "errors.log")
 
-# Read log config file
 _log_config_path = Path(__file__).parent.resolve() / "config/logging.yaml"
-_logging_config = get_yaml_config(_log_config_path)
-if _logging_config:
-    logging.config.dictConfig(_logging_config)
+_base_config_path = Path(__file__).parent.resolve() / "config/base.yaml"
+_logging_lock = threading.Lock()
+_logging_configured = False
+
+
+def configure_logging():
+    """Configure logging from config/logging.yaml, once."""
+    global _logging_configured
+    with _logging_lock:
+        if _logging_configured:
+            return
+        _logging_configured = True
+        logging_config = get_yaml_config(_log_config_path)
+        if logging_config:
+            logging.config.dictConfig(logging_config)
+        else:
+            logger.handlers = [logging.StreamHandler()]
+
+
+class _ConfigureOnFirstRecord(logging.Handler):
+    """Placeholder handler that configures logging when the first record is
+    logged, then passes the record on to the configured handlers."""
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        configure_logging()
+        for handler in logger.handlers:
+            if handler is not self and record.levelno >= handler.level:
+                handler.handle(record)
+        return True
+
+    def emit(self, record: logging.LogRecord):
+        pass
+
+
+# Configure the root logger as config/logging.yaml does, without reading it, so
+# that records of other loggers (eg. of libraries) are shown before the package
+# logs anything. This does nothing if the root logger already has handlers.
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    stream=sys.stdout,
+)
 
 # Define module logger
 logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+logger.addHandler(_ConfigureOnFirstRecord())
 
-# base/global config
-_base_config_path = Path(__file__).parent.resolve() / "config/base.yaml"
-config = get_yaml_config(_base_config_path)
+
+@lru_cache(maxsize=None)
+def _get_base_config() -> Optional[dict]:
+    return get_yaml_config(_base_config_path)
+
+
+def __getattr__(name: str):
+    # base/global config, read on first access
+    if name == "config":
+        return _get_base_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
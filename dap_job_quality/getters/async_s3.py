@@ -0,0 +1,303 @@
+"""
+Async getters of many small S3 objects (eg. per-day or per-partition JSON files).
+
+Loading objects one at a time with load_s3_data() is dominated by the round
+trip of each request. AsyncS3 runs many requests at once: each boto3 call runs in
+a thread pool, sharing the connection pool of get_s3_client(), with at most
+max_concurrency requests in flight (an asyncio semaphore). Throttled requests,
+server errors and dropped connections are retried with exponential backoff and
+jitter. Objects are decoded and encoded by their file extension, as
+load_s3_data() and save_to_s3() do.
+
+From async code:
+
+    async with AsyncS3(max_concurrency=32) as s3:
+        data = await s3.load_many(BUCKET_NAME, file_names)
+
+From sync code (including notebooks, whose event loop is already running):
+
+    data = load_s3_objects(BUCKET_NAME, file_names)
+    save_s3_objects(BUCKET_NAME, {"path/to/file.json": data})
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import random
+from typing import Any, Callable, Coroutine, Dict, List, Optional
+
+from dap_job_quality import logger
+from dap_job_quality.getters.data_getters import (
+    S3_MAX_POOL_CONNECTIONS,
+    decode_object,
+    encode_object,
+    get_s3_client,
+)
+from dap_job_quality.utils.instrumentation import increment
+
+# Error codes of S3 requests worth retrying
+RETRYABLE_ERROR_CODES = {
+    "SlowDown",
+    "Throttling",
+    "ThrottlingException",
+    "RequestTimeout",
+    "RequestTimeTooSkewed",
+    "InternalError",
+    "ServiceUnavailable",
+}
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Whether a failed S3 request is worth retrying: throttling, server errors
+    and connection errors, but not eg. a missing key or denied access."""
+    from botocore.exceptions import (
+        ClientError,
+        ConnectionClosedError,
+        ConnectTimeoutError,
+        EndpointConnectionError,
+        ReadTimeoutError,
+    )
+
+    if isinstance(error, ClientError):
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        code = error.response.get("Error", {}).get("Code")
+        return status >= 500 or code in RETRYABLE_ERROR_CODES
+    return isinstance(
+        error,
+        (
+            ConnectionClosedError,
+            ConnectTimeoutError,
+            EndpointConnectionError,
+            ReadTimeoutError,
+        ),
+    )
+
+
+def _get_object_bytes(client, bucket_name: str, file_name: str) -> bytes:
+    """Download the body of an S3 object, in a worker thread."""
+    response = client.get_object(Bucket=bucket_name, Key=file_name)
+    body = response["Body"].read()
+    increment("s3_objects_read")
+    increment("s3_bytes_read", len(body))
+    return body
+
+
+def _put_object_bytes(client, bucket_name: str, file_name: str, body: bytes):
+    """Upload the body of an S3 object, in a worker thread."""
+    client.put_object(Bucket=bucket_name, Key=file_name, Body=body)
+    increment("s3_objects_written")
+    increment("s3_bytes_written", len(body))
+
+
+class AsyncS3:
+    """
+    Load and save S3 objects concurrently from asyncio.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 32,
+        retries: int = 3,
+        retry_wait: float = 0.5,
+        client=None,
+    ):
+        """
+        Args:
+            max_concurrency (int, optional): maximum number of requests in flight.
+                More than S3_MAX_POOL_CONNECTIONS would wait for a connection.
+                Defaults to 32.
+            retries (int, optional): number of times a failed request is retried.
+                Defaults to 3.
+            retry_wait (float, optional): seconds before the first retry, about
+                doubled before each of the next. Defaults to 0.5.
+            client (optional): S3 client, eg. of a local S3 stand-in. Defaults
+                to get_s3_client().
+        """
+        if max_concurrency > S3_MAX_POOL_CONNECTIONS:
+            logger.warning(
+                f"max_concurrency {max_concurrency} is more than the "
+                f"{S3_MAX_POOL_CONNECTIONS} connections of the S3 client"
+            )
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.retry_wait = retry_wait
+        self.client = client or get_s3_client()
+        self._semaphore = None
+        self._executor = None
+
+    async def __aenter__(self) -> "AsyncS3":
+        # created in the running event loop
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._executor = ThreadPoolExecutor(
+            self.max_concurrency, thread_name_prefix="async_s3"
+        )
+        return self
+
+    async def __aexit__(self, *_):
+        self._executor.shutdown(wait=True)
+        self._semaphore, self._executor = None, None
+
+    async def _call(self, fn: Callable, *args) -> Any:
+        """Run a blocking S3 request in the thread pool, retrying it if it fails."""
+        if self._executor is None:
+            raise RuntimeError("Use AsyncS3 as `async with AsyncS3() as s3:`")
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            async with self._semaphore:
+                try:
+                    return await loop.run_in_executor(self._executor, fn, *args)
+                except Exception as e:
+                    if attempt == self.retries or not _is_retryable(e):
+                        raise
+                    error = e
+            # wait without holding the semaphore, so other requests can run
+            wait = self.retry_wait * 2**attempt * random.uniform(0.5, 1.5)
+            logger.warning(f"S3 request failed ({error!r}), retrying in {wait:.1f}s")
+            increment("async_s3.retries")
+            await asyncio.sleep(wait)
+
+    async def get_bytes(self, bucket_name: str, file_name: str) -> bytes:
+        """Download the body of an S3 object."""
+        return await self._call(_get_object_bytes, self.client, bucket_name, file_name)
+
+    async def put_bytes(self, bucket_name: str, file_name: str, body: bytes):
+        """Upload the body of an S3 object."""
+        await self._call(_put_object_bytes, self.client, bucket_name, file_name, body)
+
+    async def load(
+        self, bucket_name: str, file_name: str, columns: Optional[List[str]] = None
+    ) -> Any:
+        """Load an S3 object by its file extension, as load_s3_data() does.
+
+        Args:
+            bucket_name (str): Name of the S3 bucket.
+            file_name (str): Path to the file in the S3 bucket.
+            columns (Optional[List[str]], optional): Columns to load, for "*.csv"
+                and "*.parquet" files. Defaults to None (all columns).
+
+        Returns:
+            Loaded data.
+        """
+        return decode_object(
+            file_name, await self.get_bytes(bucket_name, file_name), columns
+        )
+
+    async def load_json(self, bucket_name: str, file_name: str) -> Any:
+        """Load an S3 object as JSON whatever its extension, as load_s3_json() does."""
+        return decode_object(".json", await self.get_bytes(bucket_name, file_name))
+
+    async def save(self, bucket_name: str, output_var, file_name: str):
+        """Save a variable to S3 by its file extension, as save_to_s3() does.
+
+        Args:
+            bucket_name (str): Name of the S3 bucket.
+            output_var (_type_): Output variable to save.
+            file_name (str): Path to save the file to.
+        """
+        await self.put_bytes(
+            bucket_name, file_name, encode_object(output_var, file_name)
+        )
+
+    async def load_many(
+        self,
+        bucket_name: str,
+        file_names: List[str],
+        columns: Optional[List[str]] = None,
+    ) -> List[Any]:
+        """Load many S3 objects concurrently.
+
+        Args:
+            bucket_name (str): Name of the S3 bucket.
+            file_names (List[str]): Paths to the files in the S3 bucket.
+            columns (Optional[List[str]], optional): Columns to load, for "*.csv"
+                and "*.parquet" files. Defaults to None (all columns).
+
+        Returns:
+            List[Any]: the loaded data of each file, in the order of file_names
+        """
+        return await asyncio.gather(
+            *(self.load(bucket_name, file_name, columns) for file_name in file_names)
+        )
+
+    async def save_many(self, bucket_name: str, objects: Dict[str, Any]):
+        """Save many variables to S3 concurrently.
+
+        Args:
+            bucket_name (str): Name of the S3 bucket.
+            objects (Dict[str, Any]): path to save each variable to, and the variable
+        """
+        await asyncio.gather(
+            *(
+                self.save(bucket_name, output_var, file_name)
+                for file_name, output_var in objects.items()
+            )
+        )
+
+
+def run_sync(coroutine: Coroutine) -> Any:
+    """Run a coroutine from sync code, in a new thread if an event loop is
+    already running in this one (eg. in a notebook)."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+def load_s3_objects(
+    bucket_name: str,
+    file_names: List[str],
+    columns: Optional[List[str]] = None,
+    max_concurrency: int = 32,
+    retries: int = 3,
+    client=None,
+) -> List[Any]:
+    """Load many S3 objects concurrently, from sync code.
+
+    Args:
+        bucket_name (str): Name of the S3 bucket.
+        file_names (List[str]): Paths to the files in the S3 bucket, eg. from
+            get_s3_data_paths().
+        columns (Optional[List[str]], optional): Columns to load, for "*.csv"
+            and "*.parquet" files. Defaults to None (all columns).
+        max_concurrency (int, optional): maximum number of requests in flight.
+            Defaults to 32.
+        retries (int, optional): number of times a failed request is retried.
+            Defaults to 3.
+        client (optional): S3 client. Defaults to get_s3_client().
+
+    Returns:
+        List[Any]: the loaded data of each file, in the order of file_names
+    """
+
+    async def load():
+        async with AsyncS3(max_concurrency, retries, client=client) as s3:
+            return await s3.load_many(bucket_name, file_names, columns)
+
+    return run_sync(load())
+
+
+def save_s3_objects(
+    bucket_name: str,
+    objects: Dict[str, Any],
+    max_concurrency: int = 32,
+    retries: int = 3,
+    client=None,
+):
+    """Save many variables to S3 concurrently, from sync code.
+
+    Args:
+        bucket_name (str): Name of the S3 bucket.
+        objects (Dict[str, Any]): path to save each variable to, and the variable
+        max_concurrency (int, optional): maximum number of requests in flight.
+            Defaults to 32.
+        retries (int, optional): number of times a failed request is retried.
+            Defaults to 3.
+        client (optional): S3 client. Defaults to get_s3_client().
+    """
+
+    async def save():
+        async with AsyncS3(max_concurrency, retries, client=client) as s3:
+            await s3.save_many(bucket_name, objects)
+
+    run_sync(save())
+    logger.info(f"Saved {len(objects)} objects to s3://{bucket_name}")
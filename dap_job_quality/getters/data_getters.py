@@ -1,22 +1,96 @@
-import boto3
-from botocore.exceptions import NoCredentialsError, ClientError
+import codecs
 from decimal import Decimal
-from fnmatch import fnmatch
+from fnmatch import fnmatch, translate as fnmatch_translate
+from functools import partial
+import fsspec
 import gzip
+import io
 import json
+import mmap
 import numpy
 import os
 import pandas as pd
 from pandas import DataFrame
 from pathlib import Path
 import pickle
+import re
+import pyarrow as pa
+import pyarrow.parquet as pq
 import srsly
-from typing import List, Dict, Optional
+import threading
+from typing import (
+    Any,
+    Callable,
+    Iterator,
+    List,
+    Dict,
+    Optional,
+    Pattern,
+    Tuple,
+    Union,
+)
 import yaml
 
 from dap_job_quality import BUCKET_NAME, PROJECT_DIR, logger
+from dap_job_quality.utils.chunk import map_chunks
+from dap_job_quality.utils.instrumentation import increment, stage
 
-s3 = boto3.resource("s3")
+# boto3 is imported and the S3 client and resources are created on first use,
+# rather than when this module is imported
+_s3_lock = threading.Lock()
+_s3_client = None
+_s3_client_pid = None
+_s3_resources = threading.local()
+# Size of the connection pool of the shared S3 client
+S3_MAX_POOL_CONNECTIONS = 50
+
+
+def get_s3_client():
+    """Get the S3 client shared by every thread of this process, creating it on
+    first use. boto3 clients are thread-safe, but can't be shared with forked
+    worker processes, which create their own.
+
+    Returns:
+        botocore.client.S3: S3 client
+    """
+    global _s3_client, _s3_client_pid
+    if _s3_client is None or _s3_client_pid != os.getpid():
+        with _s3_lock:
+            if _s3_client is None or _s3_client_pid != os.getpid():
+                import boto3
+
+                from botocore.config import Config
+
+                # enough connections for the threads of load_s3_objects()
+                _s3_client = boto3.session.Session().client(
+                    "s3", config=Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS)
+                )
+                _s3_client_pid = os.getpid()
+    return _s3_client
+
+
+def get_s3_resource():
+    """Get the S3 resource of the current thread, creating it on first use.
+    boto3 resources are not thread-safe, so each thread (and process) gets its own.
+
+    Returns:
+        boto3.resources.base.ServiceResource: S3 resource
+    """
+    if getattr(_s3_resources, "pid", None) != os.getpid():
+        import boto3
+
+        with _s3_lock:
+            # sessions are not thread-safe to create concurrently
+            _s3_resources.resource = boto3.session.Session().resource("s3")
+        _s3_resources.pid = os.getpid()
+    return _s3_resources.resource
+
+
+def __getattr__(name: str):
+    # `from dap_job_quality.getters.data_getters import s3` still works
+    if name == "s3":
+        return get_s3_resource()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class CustomJsonEncoder(json.JSONEncoder):
@@ -67,7 +141,7 @@ def load_jsonl(file_path: str) -> List[Dict]:
     Loads a JSON Lines (JSONL) file into a list of dictionaries.
 
     Each line in the JSONL file should be a valid JSON object. Lines that are not valid JSON
-    objects will be skipped, and an error message will be printed.
+    objects will be skipped, and an error message will be logged (see scan_jsonl()).
 
     Args:
         file_path (str): The path to the JSONL file.
@@ -79,19 +153,190 @@ def load_jsonl(file_path: str) -> List[Dict]:
     Raises:
         ValueError: If a line in the file is not a valid JSON object.
     """
-    data = []
-    with open(file_path, "r", encoding="utf-8-sig") as file:
-        for line_number, line in enumerate(file, 1):
-            line = line.strip()  # Remove leading/trailing whitespace
-            if not line:
-                # Skip empty lines
+    return scan_jsonl(file_path)
+
+
+def _json_parser() -> Callable:
+    """Get the fastest JSON parser installed: orjson if it is, else srsly's ujson."""
+    try:
+        import orjson
+
+        return orjson.loads
+    except ImportError:
+        return srsly.json_loads
+
+
+def _get_field(record: dict, field: str, default=None):
+    """Get a field of a record, where "meta.job_id" is record["meta"]["job_id"]."""
+    for key in field.split("."):
+        if not isinstance(record, dict) or key not in record:
+            return default
+        record = record[key]
+    return record
+
+
+def _jsonl_ranges(file_path: str, range_size: int) -> List[Tuple[int, int]]:
+    """Split a JSONL file into byte ranges of about range_size bytes, each
+    ending at a newline, skipping any UTF-8 byte order mark."""
+    with open(file_path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 3 if mm[:3] == codecs.BOM_UTF8 else 0
+            boundaries = [start]
+            while boundaries[-1] < len(mm):
+                newline = mm.find(b"\n", boundaries[-1] + range_size)
+                boundaries.append(len(mm) if newline == -1 else newline + 1)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _scan_jsonl_range(
+    byte_range: Tuple[int, int],
+    file_path: str,
+    where: Optional[Union[Dict[str, Any], Callable[[dict], bool]]],
+    fields: Optional[List[str]],
+) -> List[dict]:
+    """Parse, filter and project the lines of a byte range of a JSONL file."""
+    json_loads = _json_parser()
+    # lines without the value of every string equality condition are skipped
+    # without being parsed, if the value is written the same way in any JSON
+    needles = []
+    if isinstance(where, dict):
+        needles = [
+            value.encode()
+            for value in where.values()
+            if isinstance(value, str) and json.dumps(value)[1:-1] == value
+        ]
+    records = []
+    start, end = byte_range
+    with open(file_path, "rb") as file, mmap.mmap(
+        file.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        while start < end:
+            line_end = mm.find(b"\n", start, end)
+            line_end = end if line_end == -1 else line_end
+            line = mm[start:line_end].strip()
+            line_start, start = start, line_end + 1
+            if not line or not all(needle in line for needle in needles):
                 continue
             try:
-                data.append(srsly.json_loads(line))
-            except ValueError as e:  # srsly raises ValueError for JSON errors
-                print(f"Error parsing JSON on line {line_number}: {e}")
-                # Optionally, continue to next line or handle error differently
-    return data
+                record = json_loads(line)
+            except ValueError as e:
+                logger.error(
+                    f"Error parsing JSON at byte {line_start} of {file_path}: {e}"
+                )
+                continue
+            if isinstance(where, dict):
+                if any(_get_field(record, f) != v for f, v in where.items()):
+                    continue
+            elif where is not None and not where(record):
+                continue
+            if fields is not None:
+                record = {field: _get_field(record, field) for field in fields}
+            records.append(record)
+    return records
+
+
+def scan_jsonl(
+    file_path: str,
+    where: Optional[Union[Dict[str, Any], Callable[[dict], bool]]] = None,
+    fields: Optional[List[str]] = None,
+    as_table: bool = False,
+    n_jobs: Optional[int] = 1,
+    range_size: int = 64 * 2**20,
+) -> Union[List[Dict], pa.Table]:
+    """
+    Loads the records of a local JSON Lines (JSONL) file that match a condition, in parallel.
+
+    The file is memory-mapped and split into byte ranges at newlines, and the ranges are
+    parsed in parallel processes (with orjson if it is installed). Only the records matching
+    `where` and only their `fields` are kept, so large Prodigy or OJO dumps can be filtered
+    without holding every record in memory. Lines that are not valid JSON are skipped, and
+    an error is logged.
+
+    For example, the accepted Prodigy annotations with only their text and spans:
+
+        scan_jsonl(file_path, where={"answer": "accept"}, fields=["text", "spans"])
+
+    Args:
+        file_path (str): The path to the JSONL file.
+        where (Optional[Union[Dict[str, Any], Callable[[dict], bool]]], optional): Field to
+            value conditions that every record kept must meet (eg. {"answer": "accept"}, where
+            fields can be nested like "meta.job_id"), or a function of a record (which must be
+            picklable, ie. a top level function, if n_jobs is not 1). Lines without the string
+            values of the conditions are skipped before being parsed. Defaults to None, ie. every record.
+        fields (Optional[List[str]], optional): Fields to keep (missing fields are None), where
+            "meta.job_id" is kept as the "meta.job_id" field. Defaults to None, ie. every field.
+        as_table (bool, optional): Whether to return a pyarrow Table instead of a list of
+            dictionaries. Defaults to False.
+        n_jobs (Optional[int], optional): Number of processes, where None is the number of
+            cores. Defaults to 1.
+        range_size (int, optional): Approximate number of bytes parsed at a time by each
+            process. Defaults to 64MB.
+
+    Returns:
+        Union[List[Dict], pa.Table]: The records, in the order of the file.
+    """
+    records = [
+        record
+        for range_records in map_chunks(
+            partial(_scan_jsonl_range, file_path=file_path, where=where, fields=fields),
+            _jsonl_ranges(file_path, range_size),
+            n_jobs=n_jobs,
+            executor="process",
+        )
+        for record in range_records
+    ]
+    increment("scan_jsonl.records", len(records))
+    if as_table:
+        return records_to_table(records)
+    return records
+
+
+def records_to_table(records: List[Dict]) -> pa.Table:
+    """Convert records to a pyarrow Table with a column for every key of any record
+    (in the order they first appear), where records without a key are null.
+    Unlike pa.Table.from_pylist(), which only keeps the keys of the first record.
+
+    Args:
+        records (List[Dict]): The records.
+
+    Returns:
+        pa.Table: One row per record.
+    """
+    columns = dict.fromkeys(key for record in records for key in record)
+    return pa.Table.from_pydict(
+        {column: [record.get(column) for record in records] for column in columns}
+    )
+
+
+def load_labelled_spans(labelled_files: List[str]) -> pd.DataFrame:
+    """Load the accepted labelled spans from Prodigy output files.
+
+    Args:
+        labelled_files (List[str]): paths to Prodigy .jsonl output files
+
+    Returns:
+        pd.DataFrame: one row per labelled span with the job_id, text of the
+            job ad, span text and label
+    """
+    spans = []
+    for file in labelled_files:
+        for record in scan_jsonl(
+            file,
+            where={"answer": "accept"},
+            fields=["meta.job_id", "text", "spans"],
+        ):
+            for span in record["spans"] or []:
+                spans.append(
+                    {
+                        "job_id": record["meta.job_id"],
+                        "text": record["text"],
+                        "span": record["text"][span["start"] : span["end"]],
+                        "label": span["label"],
+                    }
+                )
+    return pd.DataFrame(spans, columns=["job_id", "text", "span", "label"])
 
 
 def save_json_dict(dictionary: dict, file_name: str):
@@ -120,6 +365,92 @@ def load_txt_lines(file_name: str) -> list:
     return txt_list
 
 
+def _put_object(obj, body: bytes):
+    """Upload the body of an S3 object and count the bytes written."""
+    obj.put(Body=body)
+    increment("s3_bytes_written", len(body))
+
+
+def _get_object_body(obj):
+    """Get the body stream of an S3 object and count the bytes read."""
+    response = obj.get()
+    increment("s3_bytes_read", response["ContentLength"])
+    return response["Body"]
+
+
+def encode_object(output_var, file_name: str) -> bytes:
+    """Serialise a variable as the bytes of an S3 object, by its file extension,
+    as save_to_s3() does.
+
+    Args:
+        output_var (_type_): Output variable to save.
+        file_name (str): Path of the file, whose extension sets the format.
+
+    Returns:
+        bytes: the body of the object
+    """
+    if fnmatch(file_name, "*.csv"):
+        return output_var.to_csv(index=False).encode()
+    elif fnmatch(file_name, "*.parquet"):
+        return output_var.to_parquet(index=False)
+    elif fnmatch(file_name, "*.pkl") or fnmatch(file_name, "*.pickle"):
+        return pickle.dumps(output_var)
+    elif fnmatch(file_name, "*.jsonl") or fnmatch(file_name, "*.jsonl.gz"):
+        # one record per line, as decode_object() loads them, unless the
+        # variable is already a JSONL string
+        if isinstance(output_var, str):
+            body = output_var.encode()
+        elif isinstance(output_var, bytes):
+            body = output_var
+        else:
+            body = "".join(
+                json.dumps(record, cls=CustomJsonEncoder) + "\n"
+                for record in output_var
+            ).encode()
+        return gzip.compress(body) if file_name.endswith(".gz") else body
+    elif fnmatch(file_name, "*.gz"):
+        return gzip.compress(json.dumps(output_var).encode())
+    elif fnmatch(file_name, "*.txt"):
+        return output_var.encode() if isinstance(output_var, str) else output_var
+    else:
+        return json.dumps(output_var, cls=CustomJsonEncoder).encode()
+
+
+def decode_object(file_name: str, body: bytes, columns: Optional[List[str]] = None):
+    """Load the bytes of an S3 object, by its file extension, as load_s3_data() does.
+
+    Args:
+        file_name (str): Path of the file, whose extension sets the format.
+        body (bytes): the body of the object
+        columns (Optional[List[str]], optional): Columns to load, for "*.csv"
+            and "*.parquet" files. Defaults to None (all columns).
+
+    Returns:
+        Loaded data.
+    """
+    if fnmatch(file_name, "*.jsonl.gz"):
+        return [json.loads(line) for line in gzip.decompress(body).splitlines()]
+    if fnmatch(file_name, "*.yml") or fnmatch(file_name, "*.yaml"):
+        return yaml.safe_load(body.decode())
+    elif fnmatch(file_name, "*.jsonl"):
+        return [json.loads(line) for line in body.splitlines() if line.strip()]
+    elif fnmatch(file_name, "*.json.gz"):
+        return json.loads(gzip.decompress(body))
+    elif fnmatch(file_name, "*.json"):
+        return json.loads(body)
+    elif fnmatch(file_name, "*.csv"):
+        return pd.read_csv(io.BytesIO(body), usecols=columns)
+    elif fnmatch(file_name, "*.parquet"):
+        return pd.read_parquet(io.BytesIO(body), columns=columns)
+    elif fnmatch(file_name, "*.pkl") or fnmatch(file_name, "*.pickle"):
+        return pickle.loads(body)
+    else:
+        logger.error(
+            'Function not supported for file type other than "*.csv", "*.parquet", "*.jsonl.gz", "*.jsonl", or "*.json"'
+        )
+
+
+@stage("save_to_s3", log=False)
 def save_to_s3(bucket_name: str, output_var, output_file_dir: str):
     """Saves a file to S3.
 
@@ -129,7 +460,7 @@ def save_to_s3(bucket_name: str, output_var, output_file_dir: str):
         output_file_dir (str): Path to save the file to.
     """
 
-    obj = s3.Object(bucket_name, output_file_dir)
+    obj = get_s3_resource().Object(bucket_name, output_file_dir)
 
     if fnmatch(output_file_dir, "*.csv"):
         output_var.to_csv("s3://" + bucket_name + "/" + output_file_dir, index=False)
@@ -137,14 +468,9 @@ def save_to_s3(bucket_name: str, output_var, output_file_dir: str):
         output_var.to_parquet(
             "s3://" + bucket_name + "/" + output_file_dir, index=False
         )
-    elif fnmatch(output_file_dir, "*.pkl") or fnmatch(output_file_dir, "*.pickle"):
-        obj.put(Body=pickle.dumps(output_var))
-    elif fnmatch(output_file_dir, "*.gz"):
-        obj.put(Body=gzip.compress(json.dumps(output_var).encode()))
-    elif fnmatch(output_file_dir, "*.txt"):
-        obj.put(Body=output_var)
     else:
-        obj.put(Body=json.dumps(output_var, cls=CustomJsonEncoder))
+        _put_object(obj, encode_object(output_var, output_file_dir))
+    increment("s3_objects_written")
 
     logger.info(f"Saved to s3://{bucket_name} + {output_file_dir} ...")
 
@@ -162,8 +488,8 @@ def load_s3_json(bucket_name, file_name):
         Loaded data.
     """
 
-    obj = s3.Object(bucket_name, file_name)
-    file = obj.get()["Body"].read().decode()
+    obj = get_s3_resource().Object(bucket_name, file_name)
+    file = _get_object_body(obj).read().decode()
     return json.loads(file)
 
 
@@ -185,8 +511,9 @@ def load_s3_jsonl(
         FileNotFoundError: Raised if the specified file in the S3 bucket is not found OR the local path can't be found.
         NoCredentialsError: Raised if AWS credentials are not available.
     """
-    # Create an S3 client
-    s3 = boto3.client("s3")
+    from botocore.exceptions import ClientError, NoCredentialsError
+
+    s3 = get_s3_client()
 
     output_file = None
 
@@ -214,65 +541,291 @@ def load_s3_jsonl(
     return output_file
 
 
-def load_s3_data(bucket_name: str, file_name: str):
+@stage("load_s3_data", log=False)
+def load_s3_data(bucket_name: str, file_name: str, columns: Optional[List[str]] = None):
     """Load a file from an S3 location.
 
     Args:
         bucket_name (str): Name of the S3 bucket.
         file_name (str): Path to the file in the S3 bucket.
+        columns (Optional[List[str]], optional): Columns to load, for "*.csv"
+            and "*.parquet" files. Defaults to None (all columns).
 
     Returns:
         Loaded data.
     """
-    obj = s3.Object(bucket_name, file_name)
-    if fnmatch(file_name, "*.jsonl.gz"):
-        with gzip.GzipFile(fileobj=obj.get()["Body"]) as file:
-            return [json.loads(line) for line in file]
-    if fnmatch(file_name, "*.yml") or fnmatch(file_name, "*.yaml"):
-        file = obj.get()["Body"].read().decode()
-        return yaml.safe_load(file)
-    elif fnmatch(file_name, "*.jsonl"):
-        file = obj.get()["Body"].read().decode()
-        return [json.loads(line) for line in file]
-    elif fnmatch(file_name, "*.json.gz"):
-        with gzip.GzipFile(fileobj=obj.get()["Body"]) as file:
-            return json.load(file)
-    elif fnmatch(file_name, "*.json"):
-        file = obj.get()["Body"].read().decode()
-        return json.loads(file)
-    elif fnmatch(file_name, "*.csv"):
-        return pd.read_csv("s3://" + bucket_name + "/" + file_name)
+    increment("s3_objects_read")
+    obj = get_s3_resource().Object(bucket_name, file_name)
+    if fnmatch(file_name, "*.csv") or fnmatch(file_name, "*.parquet"):
+        with fsspec.open("s3://" + bucket_name + "/" + file_name, "rb") as file:
+            # the size of the file, which is more than is read if only some
+            # columns of a parquet file are loaded
+            increment("s3_bytes_read", file.size)
+            if fnmatch(file_name, "*.csv"):
+                df = pd.read_csv(file, usecols=columns)
+            else:
+                df = pd.read_parquet(file, columns=columns)
+        increment("load_s3_data.rows_out", len(df))
+        return df
+    return decode_object(file_name, _get_object_body(obj).read())
+
+
+def get_s3_parquet_columns(bucket_name: str, file_name: str) -> List[str]:
+    """Get the column names of a parquet file in S3 from its footer, without
+    downloading the data.
+
+    Args:
+        bucket_name (str): Name of the S3 bucket.
+        file_name (str): Path to the parquet file in the S3 bucket.
+
+    Returns:
+        List[str]: Column names.
+    """
+    with fsspec.open("s3://" + bucket_name + "/" + file_name, "rb") as file:
+        return pq.read_schema(file).names
+
+
+def get_s3_object_fingerprint(bucket_name: str, file_name: str) -> str:
+    """Get a fingerprint of an S3 object that changes whenever the object does,
+    without downloading it.
+
+    Args:
+        bucket_name (str): Name of the S3 bucket.
+        file_name (str): Path to the file in the S3 bucket.
+
+    Returns:
+        str: The object's ETag and size.
+    """
+    response = get_s3_client().head_object(Bucket=bucket_name, Key=file_name)
+    etag = response["ETag"].strip('"')
+    return f"{etag}-{response['ContentLength']}"
+
+
+def load_s3_data_chunks(
+    bucket_name: str,
+    file_name: str,
+    chunksize: int = 10000,
+    columns: Optional[List[str]] = None,
+) -> Iterator[DataFrame]:
+    """Stream a tabular file from an S3 location in chunks, so that the whole
+    file never has to be held in memory.
+
+    Args:
+        bucket_name (str): Name of the S3 bucket.
+        file_name (str): Path to the file in the S3 bucket.
+        chunksize (int, optional): Number of rows per chunk. Defaults to 10000.
+        columns (Optional[List[str]], optional): Columns to load.
+            Defaults to None (all columns).
+
+    Yields:
+        Iterator[DataFrame]: Consecutive chunks of the file.
+    """
+    s3_path = "s3://" + bucket_name + "/" + file_name
+    increment("s3_objects_read")
+    if fnmatch(file_name, "*.csv"):
+        with fsspec.open(s3_path, "rb") as file:
+            increment("s3_bytes_read", file.size)
+            for chunk in pd.read_csv(file, chunksize=chunksize, usecols=columns):
+                increment("load_s3_data.rows_out", len(chunk))
+                yield chunk
     elif fnmatch(file_name, "*.parquet"):
-        return pd.read_parquet("s3://" + bucket_name + "/" + file_name)
-    elif fnmatch(file_name, "*.pkl") or fnmatch(file_name, "*.pickle"):
-        file = obj.get()["Body"].read().decode()
-        return pickle.loads(file)
+        with fsspec.open(s3_path, "rb") as file:
+            increment("s3_bytes_read", file.size)
+            parquet_file = pq.ParquetFile(file)
+            for batch in parquet_file.iter_batches(
+                batch_size=chunksize, columns=columns
+            ):
+                increment("load_s3_data.rows_out", batch.num_rows)
+                yield batch.to_pandas()
     else:
         logger.error(
-            'Function not supported for file type other than "*.csv", "*.parquet", "*.jsonl.gz", "*.jsonl", or "*.json"'
+            'Function not supported for file type other than "*.csv" or "*.parquet"'
+        )
+
+
+S3_MANIFEST_DIR = PROJECT_DIR / "outputs/cache/s3_manifests"
+MANIFEST_COLUMNS = ["key", "size", "etag", "last_modified"]
+
+
+def compile_globs(patterns: Union[str, List[str]]) -> Pattern:
+    """Compile glob patterns (eg. "*.jsonl") into one regular expression, so that
+    keys are matched against every pattern at once.
+
+    Args:
+        patterns (Union[str, List[str]]): glob pattern, or list of them
+
+    Returns:
+        Pattern: regular expression matching any of the patterns, with fullmatch()
+    """
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    return re.compile("|".join(f"(?:{fnmatch_translate(p)})" for p in patterns))
+
+
+def _list_prefix(
+    prefix: str,
+    client,
+    bucket_name: str,
+    delimiter: str = "",
+    start_after: str = "",
+) -> Tuple[List[dict], List[str]]:
+    """List the objects (and, with a delimiter, the sub-prefixes) under a prefix,
+    after start_after."""
+    objects, prefixes = [], []
+    kwargs = {"Bucket": bucket_name, "Prefix": prefix, "Delimiter": delimiter}
+    if start_after:
+        kwargs["StartAfter"] = start_after
+    for page in client.get_paginator("list_objects_v2").paginate(**kwargs):
+        increment("s3_list_requests")
+        objects.extend(
+            {
+                "key": obj["Key"],
+                "size": obj["Size"],
+                "etag": obj["ETag"].strip('"'),
+                "last_modified": obj["LastModified"],
+            }
+            for obj in page.get("Contents", [])
         )
+        prefixes.extend(p["Prefix"] for p in page.get("CommonPrefixes", []))
+    return objects, prefixes
+
+
+def s3_manifest_path(bucket_name: str, root: str) -> Path:
+    """Get the path of the local manifest of the objects under an S3 prefix."""
+    name = root.strip("/").replace("/", "__") or "_root"
+    return S3_MANIFEST_DIR / bucket_name / f"{name}.parquet"
+
+
+def _last_key_under(keys: numpy.ndarray, prefix: str) -> str:
+    """Get the last of the sorted keys under a prefix, or ""."""
+    # the code point order of str is the UTF-8 byte order that S3 lists keys in
+    i = numpy.searchsorted(keys, prefix + chr(0x10FFFF)) - 1
+    return keys[i] if i >= 0 and keys[i].startswith(prefix) else ""
+
+
+@stage("list_s3_objects")
+def list_s3_objects(
+    bucket_name: str,
+    root: str,
+    file_types: Optional[Union[str, List[str]]] = None,
+    depth: int = 1,
+    max_workers: int = 16,
+    use_manifest: bool = False,
+    refresh: bool = False,
+    client=None,
+) -> DataFrame:
+    """List the objects under an S3 prefix, listing its sub-prefixes in parallel.
 
+    The sub-prefixes `depth` levels of "/" below root (eg. the partitions of an
+    OJO table) are found with delimited listings, then listed in parallel threads.
 
-def get_s3_data_paths(bucket_name: str, root: str, file_types=["*.jsonl"]):
+    With use_manifest, the listing is saved to a local manifest (see
+    s3_manifest_path()) and later listings of each sub-prefix only fetch the keys
+    after the last key already in the manifest (S3 lists keys in order, so new
+    date partitions are found). Objects changed or deleted under a sub-prefix
+    still in the manifest are only found with refresh, which lists everything again.
+
+    Args:
+        bucket_name (str): The S3 bucket name
+        root (str): The prefix to list
+        file_types (Optional[Union[str, List[str]]], optional): glob patterns of
+            the keys to return, eg. "*.jsonl". Defaults to None (every key).
+        depth (int, optional): levels of sub-prefixes to list in parallel.
+            Defaults to 1.
+        max_workers (int, optional): maximum number of listing threads. Defaults to 16.
+        use_manifest (bool, optional): whether to read and update the local
+            manifest. Defaults to False.
+        refresh (bool, optional): whether to ignore the manifest's keys and list
+            everything again. Defaults to False.
+        client (optional): S3 client, eg. of a local S3 stand-in. Defaults to
+            get_s3_client() (whose endpoint can also be set with the
+            AWS_ENDPOINT_URL environment variable).
+
+    Returns:
+        DataFrame: key, size, etag and last_modified of each object, sorted by key
+    """
+    client = client or get_s3_client()
+    manifest_path = s3_manifest_path(bucket_name, root)
+    known = pd.DataFrame(columns=MANIFEST_COLUMNS)
+    if use_manifest and not refresh and manifest_path.exists():
+        known = pd.read_parquet(manifest_path)
+    known_keys = known["key"].to_numpy(dtype=object)
+
+    # find the sub-prefixes, keeping the objects between them and root
+    prefixes, objects = [root], []
+    for _ in range(depth):
+        sub_prefixes = []
+        for level_objects, level_prefixes in map_chunks(
+            partial(
+                _list_prefix, client=client, bucket_name=bucket_name, delimiter="/"
+            ),
+            prefixes,
+            n_jobs=max_workers,
+            retries=2,
+        ):
+            objects.extend(level_objects)
+            sub_prefixes.extend(level_prefixes)
+        prefixes = sub_prefixes
+        if not prefixes:
+            break
+
+    # list the objects of each sub-prefix after those already known
+    for prefix, (prefix_objects, _) in zip(
+        prefixes,
+        map_chunks(
+            lambda prefix: _list_prefix(
+                prefix,
+                client,
+                bucket_name,
+                start_after=_last_key_under(known_keys, prefix),
+            ),
+            prefixes,
+            n_jobs=max_workers,
+            retries=2,
+        ),
+    ):
+        objects.extend(prefix_objects)
+
+    # keep the known objects of sub-prefixes that still exist
+    listing = pd.DataFrame(objects, columns=MANIFEST_COLUMNS)
+    listing["last_modified"] = pd.to_datetime(listing["last_modified"], utc=True)
+    if len(known) and prefixes:
+        known = known[known["key"].str.startswith(tuple(prefixes))]
+        listing = pd.concat([known, listing], ignore_index=True)
+    listing = (
+        listing.drop_duplicates("key", keep="last")
+        .sort_values("key")
+        .reset_index(drop=True)
+    )
+    increment("list_s3_objects.objects", len(listing))
+    if use_manifest:
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        listing.to_parquet(manifest_path, index=False)
+
+    if file_types is not None:
+        pattern = compile_globs(file_types)
+        listing = listing[[bool(pattern.fullmatch(key)) for key in listing["key"]]]
+    return listing.reset_index(drop=True)
+
+
+def get_s3_data_paths(
+    bucket_name: str,
+    root: str,
+    file_types=["*.jsonl"],
+    use_manifest: bool = False,
+):
     """
     Get all paths to particular file types in a S3 root location
 
     bucket_name: The S3 bucket name
     root: The root folder to look for files in
     file_types: List of file types to look for, or one
+    use_manifest: Whether to only list the keys added since the last listing
+        saved locally, see list_s3_objects()
     """
-    if isinstance(file_types, str):
-        file_types = [file_types]
-
-    bucket = s3.Bucket(bucket_name)
-
-    s3_keys = []
-    for files in bucket.objects.filter(Prefix=root):
-        key = files.key
-        if any([fnmatch(key, pattern) for pattern in file_types]):
-            s3_keys.append(key)
-
-    return s3_keys
+    return list_s3_objects(bucket_name, root, file_types, use_manifest=use_manifest)[
+        "key"
+    ].tolist()
 
 
 def load_s3_excel(bucket_name: str, file_name: str, sheet_name: str = "All"):
@@ -2,12 +2,17 @@
 Getters to retrieve OJO data from the database.
 """
 from dap_job_quality import PRINZ_BUCKET_NAME
-from dap_job_quality.getters.data_getters import load_s3_data
+from dap_job_quality.getters.data_getters import load_s3_data, load_s3_data_chunks
 
 import os
-from typing import Dict, List
+from typing import Dict, Iterator, List
 import pandas as pd
 
+OJO_SAMPLE_S3 = "outputs/data/ojo_application/deduplicated_sample/ojo_sample.csv"
+JOB_TITLE_SAMPLE_S3 = (
+    "outputs/data/ojo_application/deduplicated_sample/job_title_data_sample.csv"
+)
+
 
 # Let's currently get a sample of the data from PRINZ to work with
 # for labelling etc.
@@ -23,10 +28,20 @@ def get_ojo_sample() -> pd.DataFrame:
             - itl_3_code: ITL 3 code for the location of the job
             - itl_3_name: ITL 3 name for the location of the job
     """
-    return load_s3_data(
-        PRINZ_BUCKET_NAME,
-        "outputs/data/ojo_application/deduplicated_sample/ojo_sample.csv",
-    )
+    return load_s3_data(PRINZ_BUCKET_NAME, OJO_SAMPLE_S3)
+
+
+def get_ojo_sample_chunks(chunksize: int = 10000) -> Iterator[pd.DataFrame]:
+    """Streams the ojo sample data (100,000 job ads) from s3 in chunks.
+
+    Args:
+        chunksize (int, optional): Number of job ads per chunk. Defaults to 10000.
+
+    Yields:
+        Iterator[pd.DataFrame]: chunks of the ojo sample data with the same
+            fields as get_ojo_sample()
+    """
+    return load_s3_data_chunks(PRINZ_BUCKET_NAME, OJO_SAMPLE_S3, chunksize=chunksize)
 
 
 def get_ojo_job_title_sample() -> pd.DataFrame:
@@ -46,10 +61,7 @@ def get_ojo_job_title_sample() -> pd.DataFrame:
             - knowledge_domain: eg "Engineering", "Legal"
             - occupation: standardised job title eg "Manager consultant"
     """
-    return load_s3_data(
-        PRINZ_BUCKET_NAME,
-        "outputs/data/ojo_application/deduplicated_sample/job_title_data_sample.csv",
-    )
+    return load_s3_data(PRINZ_BUCKET_NAME, JOB_TITLE_SAMPLE_S3)
 
 
 def get_ojo_location_sample() -> pd.DataFrame:
@@ -0,0 +1,82 @@
+"""
+This script builds a sparse job ad x job quality subcategory matrix from the keyword search results and,
+optionally, NER spans and classifier scores, so that downstream analysis (eg. regressions, or aggregations
+by region and occupation) can use one structured table of which job ads mention which subcategories.
+
+To build the matrix from the keyword search results of every sentence (see keyword_search.py -i True),
+run the following command from the root directory:
+
+python dap_job_quality/pipeline/build_feature_matrix.py
+
+To also add labelled or predicted NER spans (Prodigy .jsonl) and classifier scores (a parquet file with
+an id column and one score column per subcategory), run:
+
+python dap_job_quality/pipeline/build_feature_matrix.py -n <path to spans .jsonl> -c <path to scores .parquet>
+
+The matrix is saved to outputs/data/features/ as job_quality_features.npz, with the job ids of the rows
+and the subcategories of the columns in job_quality_features_index.npz. Load it with FeatureMatrix.load().
+"""
+import plac
+
+from dap_job_quality import PROJECT_DIR, logger
+from dap_job_quality.getters.data_getters import load_labelled_spans
+from dap_job_quality.pipeline.keyword_search import PARTITIONS_DIR
+from dap_job_quality.utils.feature_matrix import FeatureMatrix, FeatureMatrixBuilder
+from dap_job_quality.utils.incremental import load_partitions
+
+import pandas as pd
+
+FEATURE_MATRIX_PATH = PROJECT_DIR / "outputs/data/features/job_quality_features.npz"
+
+
+@plac.annotations(
+    keyword_dir=("directory of the keyword search results", "option", "k", str),
+    ner_spans_file=("Prodigy .jsonl file of NER spans", "option", "n", str),
+    classifier_file=("parquet file of classifier scores", "option", "c", str),
+)
+def build_feature_matrix(
+    keyword_dir: str = str(PARTITIONS_DIR),
+    ner_spans_file: str = "",
+    classifier_file: str = "",
+) -> FeatureMatrix:
+    """Build and save the job ad x job quality subcategory matrix.
+
+    Args:
+        keyword_dir (str, optional): directory of the keyword search results of
+            every sentence. Defaults to PARTITIONS_DIR.
+        ner_spans_file (str, optional): Prodigy .jsonl file of NER spans, whose
+            labels are added as features prefixed "ner_". Defaults to "".
+        classifier_file (str, optional): parquet file of classifier scores, with
+            an id column and a score column per subcategory, added as features
+            prefixed "clf_". Defaults to "".
+
+    Returns:
+        FeatureMatrix: the job ad x subcategory matrix
+    """
+    builder = FeatureMatrixBuilder()
+
+    keyword_hits = load_partitions(keyword_dir)
+    builder.add_keyword_hits(keyword_hits)
+    # every job ad searched gets a row, even if it has no keyword hits
+    ids = [keyword_hits["job_id"]]
+
+    if ner_spans_file:
+        spans = load_labelled_spans([ner_spans_file])
+        builder.add_ner_spans(spans, prefix="ner_")
+        ids.append(spans["job_id"])
+    if classifier_file:
+        scores = pd.read_parquet(classifier_file)
+        builder.add_classifier_scores(scores, prefix="clf_")
+        ids.append(scores["id"])
+
+    features = builder.build(ids=pd.concat(ids, ignore_index=True).unique())
+    features.save(FEATURE_MATRIX_PATH)
+    logger.info(
+        f"Saved {len(features)} job ads x {len(features.features)} features "
+        f"({features.matrix.nnz} non-zero) to {FEATURE_MATRIX_PATH}"
+    )
+    return features
+
+
+if __name__ == "__main__":
+    plac.call(build_feature_matrix)
@@ -0,0 +1,340 @@
+"""
+This script tags every sentence of the OJO sample with job quality predictions, so the full corpus can be
+scored overnight on CPU instead of only the job ads shown in Prodigy (see prodigy/custom_recipe.py).
+
+Job ads are streamed in chunks, cleaned and split into sentences (as in keyword_search.py), and each sentence gets
+the following predictions, made once per unique sentence of the chunk (see utils/sentence_dictionary.py):
+    - the entities (label, text and character offsets) of the NER model, run with nlp.pipe over several processes
+    - optionally, the job quality label and probability of an embedding-based classifier: sentences are embedded
+        with BertVectorizer and compared to the mean embedding of the labelled spans of each label
+        (see utils/active_learning.py)
+
+The predictions of each chunk are saved as a parquet file as soon as it is done, and a manifest records the chunks
+that have been processed (see utils/incremental.py). If the run is interrupted, running it again resumes from the
+first chunk that has not been processed. Changing the model, labelled files or chunk size starts again.
+Throughput (ads/sec and sentences/sec) is logged for every chunk and for the whole run.
+
+To run the NER model (see prodigy/README.md to download it) over the OJO sample with 4 processes, run the
+following command from the root directory:
+
+python dap_job_quality/pipeline/job_quality_inference.py -np 4
+
+To also run the embedding classifier, trained on the spans labelled in Prodigy, run:
+
+python dap_job_quality/pipeline/job_quality_inference.py -np 4 \
+    -lf dap_job_quality/pipeline/prodigy/labelled_data/20240119_ads_labelled.jsonl
+
+The predictions are saved to outputs/data/job_quality_inference/ and can be loaded with load_partitions().
+"""
+import plac
+
+from dap_job_quality import PROJECT_DIR, logger
+from dap_job_quality.getters.data_getters import load_labelled_spans
+from dap_job_quality.getters.ojo_getters import get_ojo_sample_chunks
+from dap_job_quality.pipeline.prodigy.select_candidates import (
+    NER_MODEL_FOLDER,
+    embed_texts,
+)
+from dap_job_quality.utils.active_learning import (
+    label_prototypes,
+    prototype_probabilities,
+)
+from dap_job_quality.utils.bert_vectorizer import BertVectorizer
+from dap_job_quality.utils.incremental import (
+    PartitionManifest,
+    hash_dataframe,
+    hash_object,
+    partition_path,
+)
+from dap_job_quality.utils.sentence_dictionary import (
+    SentenceDictionary,
+    build_sentence_dictionary,
+)
+
+import fsspec
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import spacy
+import time
+from typing import Dict, Iterable, List, Optional
+
+OUTPUT_DIR = PROJECT_DIR / "outputs/data/job_quality_inference"
+STAGE = "job_quality_inference"
+
+ENTITY_TYPE = pa.list_(
+    pa.struct(
+        [
+            ("label", pa.string()),
+            ("text", pa.string()),
+            ("start", pa.int32()),
+            ("end", pa.int32()),
+        ]
+    )
+)
+
+
+def prediction_schema(with_classifier: bool) -> pa.Schema:
+    """Schema of the saved predictions, so that chunks without any entities
+    are saved with the same column types as the others."""
+    fields = [
+        ("job_id", pa.string()),
+        ("sentence_id", pa.int32()),
+        ("sentence", pa.string()),
+        ("entities", ENTITY_TYPE),
+    ]
+    if with_classifier:
+        fields += [("clf_label", pa.string()), ("clf_probability", pa.float32())]
+    return pa.schema(fields)
+
+
+def make_sentence_dictionary(job_ads: pd.DataFrame) -> SentenceDictionary:
+    """Clean job ads, split them into sentences and find their unique sentences.
+
+    Args:
+        job_ads (pd.DataFrame): job ads with id and description columns
+
+    Returns:
+        SentenceDictionary: the unique sentences, and the sentences of each job ad
+    """
+    return build_sentence_dictionary(
+        job_ads.assign(description=job_ads["description"].fillna(""))
+    )
+
+
+def predict_entities(
+    nlp: spacy.language.Language,
+    sentences: Iterable[str],
+    n_process: int = 1,
+    batch_size: int = 256,
+) -> List[List[dict]]:
+    """Run the NER model over sentences.
+
+    Args:
+        nlp (spacy.language.Language): NER model
+        sentences (Iterable[str]): sentences to tag
+        n_process (int, optional): number of processes. Defaults to 1.
+        batch_size (int, optional): number of sentences per batch. Defaults to 256.
+
+    Returns:
+        List[List[dict]]: the entities of each sentence, with their label, text
+            and character offsets
+    """
+    return [
+        [
+            {
+                "label": ent.label_,
+                "text": ent.text,
+                "start": ent.start_char,
+                "end": ent.end_char,
+            }
+            for ent in doc.ents
+        ]
+        for doc in nlp.pipe(sentences, n_process=n_process, batch_size=batch_size)
+    ]
+
+
+def classify_sentences(
+    sentences: List[str],
+    bert_model: BertVectorizer,
+    prototypes: Dict[str, np.ndarray],
+) -> pd.DataFrame:
+    """Label sentences with the closest labelled span prototype.
+
+    Args:
+        sentences (List[str]): sentences to classify
+        bert_model (BertVectorizer): fitted sentence embedding model
+        prototypes (Dict[str, np.ndarray]): label to prototype embedding, as
+            output by label_prototypes()
+
+    Returns:
+        pd.DataFrame: clf_label and clf_probability of each sentence
+    """
+    probs = prototype_probabilities(bert_model.transform(sentences), prototypes)
+    labels = np.array(list(prototypes))
+    return pd.DataFrame(
+        {
+            "clf_label": labels[probs.argmax(axis=1)],
+            "clf_probability": probs.max(axis=1).astype(np.float32),
+        }
+    )
+
+
+def predict_chunk(
+    job_ads: pd.DataFrame,
+    nlp: spacy.language.Language,
+    bert_model: Optional[BertVectorizer] = None,
+    prototypes: Optional[Dict[str, np.ndarray]] = None,
+    n_process: int = 1,
+    batch_size: int = 256,
+) -> pd.DataFrame:
+    """Split a chunk of job ads into sentences and predict their job quality tags.
+
+    Args:
+        job_ads (pd.DataFrame): job ads with id and description columns
+        nlp (spacy.language.Language): NER model
+        bert_model (Optional[BertVectorizer], optional): fitted sentence
+            embedding model of the embedding classifier. Defaults to None.
+        prototypes (Optional[Dict[str, np.ndarray]], optional): label prototypes
+            of the embedding classifier, or None to only run the NER model
+        n_process (int, optional): number of NER processes. Defaults to 1.
+        batch_size (int, optional): number of sentences per NER batch. Defaults to 256.
+
+    Returns:
+        pd.DataFrame: one row per sentence with its predictions
+    """
+    dictionary = make_sentence_dictionary(job_ads)
+    predictions = dictionary.to_frame(id_col="job_id").drop(columns="sentence_key")
+    predictions["job_id"] = predictions["job_id"].astype(str)
+    sentences = dictionary.sentences.tolist()
+    predictions["entities"] = dictionary.broadcast(
+        predict_entities(nlp, sentences, n_process=n_process, batch_size=batch_size)
+    )
+    if prototypes is not None:
+        classifier_predictions = classify_sentences(sentences, bert_model, prototypes)
+        predictions[classifier_predictions.columns] = dictionary.broadcast(
+            classifier_predictions
+        )
+    # Filter out sentence splitting errors, as in keyword_search.py
+    return predictions[predictions["sentence"].str.len() > 1].reset_index(drop=True)
+
+
+def run_inference(
+    chunks: Iterable[pd.DataFrame],
+    nlp: spacy.language.Language,
+    output_dir: str,
+    version: str,
+    bert_model: Optional[BertVectorizer] = None,
+    prototypes: Optional[Dict[str, np.ndarray]] = None,
+    n_process: int = 1,
+    batch_size: int = 256,
+) -> dict:
+    """Predict the job quality tags of streamed chunks of job ads, saving the
+    predictions of each chunk and skipping the chunks already processed.
+
+    Args:
+        chunks (Iterable[pd.DataFrame]): chunks of job ads, in the same order on every run
+        nlp (spacy.language.Language): NER model
+        output_dir (str): local or s3:// directory of the predictions
+        version (str): version of the run's settings. Chunks processed with
+            another version are processed again.
+        bert_model (Optional[BertVectorizer], optional): fitted sentence
+            embedding model of the embedding classifier. Defaults to None.
+        prototypes (Optional[Dict[str, np.ndarray]], optional): label prototypes
+            of the embedding classifier. Defaults to None.
+        n_process (int, optional): number of NER processes. Defaults to 1.
+        batch_size (int, optional): number of sentences per NER batch. Defaults to 256.
+
+    Returns:
+        dict: number of job ads and sentences processed, and their throughput
+    """
+    manifest = PartitionManifest(output_dir, STAGE, version)
+    fs, fs_path = fsspec.core.url_to_fs(str(output_dir))
+    fs.makedirs(fs_path, exist_ok=True)
+    schema = prediction_schema(with_classifier=prototypes is not None)
+    n_ads, n_sentences, n_skipped, seconds = 0, 0, 0, 0.0
+    for i, job_ads in enumerate(chunks):
+        partition = f"chunk_{i:05d}"
+        input_hash = hash_dataframe(job_ads[["id", "description"]])
+        if manifest.is_current(partition, input_hash):
+            n_skipped += 1
+            continue
+
+        start_time = time.perf_counter()
+        predictions = predict_chunk(
+            job_ads,
+            nlp,
+            bert_model,
+            prototypes,
+            n_process=n_process,
+            batch_size=batch_size,
+        )
+        predictions.to_parquet(
+            partition_path(output_dir, partition), index=False, schema=schema
+        )
+        manifest.record(partition, input_hash, len(job_ads))
+        manifest.save()
+
+        chunk_seconds = time.perf_counter() - start_time
+        n_ads += len(job_ads)
+        n_sentences += len(predictions)
+        seconds += chunk_seconds
+        logger.info(
+            f"{partition}: {len(job_ads) / chunk_seconds:.1f} ads/sec, "
+            f"{len(predictions) / chunk_seconds:.1f} sentences/sec "
+            f"({n_ads} ads processed this run)"
+        )
+
+    throughput = {
+        "n_ads": n_ads,
+        "n_sentences": n_sentences,
+        "n_chunks_skipped": n_skipped,
+        "seconds": round(seconds, 1),
+        "ads_per_second": round(n_ads / seconds, 1) if seconds else None,
+        "sentences_per_second": round(n_sentences / seconds, 1) if seconds else None,
+    }
+    logger.info(f"{STAGE} finished: {throughput}")
+    return throughput
+
+
+@plac.annotations(
+    labelled_files=("comma separated Prodigy output files", "option", "lf", str),
+    n_process=("n_process", "option", "np", int),
+    batch_size=("batch_size", "option", "bs", int),
+    chunk_size=("chunk_size", "option", "cs", int),
+    output_dir=("output_dir", "option", "o", str),
+)
+def main(
+    labelled_files: str = "",
+    n_process: int = 1,
+    batch_size: int = 256,
+    chunk_size: int = 10000,
+    output_dir: str = str(OUTPUT_DIR),
+) -> dict:
+    """Tag every sentence of the OJO sample with the NER model and, if labelled
+    files are given, the embedding classifier.
+
+    Args:
+        labelled_files (str, optional): comma separated Prodigy output files to
+            train the embedding classifier on. Defaults to "", ie. no classifier.
+        n_process (int, optional): number of NER processes. Defaults to 1.
+        batch_size (int, optional): number of sentences per NER batch. Defaults to 256.
+        chunk_size (int, optional): number of job ads per saved chunk. Defaults to 10000.
+        output_dir (str, optional): local or s3:// directory of the predictions.
+            Defaults to OUTPUT_DIR.
+
+    Returns:
+        dict: throughput of the run
+    """
+    labelled_files = [file for file in labelled_files.split(",") if file]
+    bert_model, prototypes = None, None
+    if labelled_files:
+        spans = load_labelled_spans(labelled_files)
+        prototypes = label_prototypes(
+            embed_texts(spans["span"].tolist()), spans["label"]
+        )
+        bert_model = BertVectorizer(verbose=True, multi_process=False).fit()
+        logger.info(f"embedding classifier with labels {list(prototypes)}")
+
+    nlp = spacy.load(NER_MODEL_FOLDER)
+    version = hash_object(
+        {
+            "model": str(NER_MODEL_FOLDER),
+            "labelled_files": labelled_files,
+            "chunk_size": chunk_size,
+        }
+    )
+    return run_inference(
+        get_ojo_sample_chunks(chunksize=chunk_size),
+        nlp,
+        output_dir,
+        version,
+        bert_model=bert_model,
+        prototypes=prototypes,
+        n_process=n_process,
+        batch_size=batch_size,
+    )
+
+
+if __name__ == "__main__":
+    plac.call(main)
@@ -0,0 +1,92 @@
+"""
+This script computes the prevalence of each job quality subcategory (the share of job ads mentioning it, with
+95% confidence intervals) by region, occupation and quarter, from the job ad x subcategory matrix built by
+build_feature_matrix.py.
+
+Every job ad in the matrix is given its ITL1 and ITL2 region, SOC2 and SOC4 occupation and the quarter it was
+created in, and the prevalence is computed for each grouping in GROUPINGS with an IndicatorCube
+(see utils/aggregation.py). Other groupings can be computed interactively, eg.
+
+cube = get_indicator_cube()
+cube.prevalence(["SOC_2digit", "quarter"])
+cube.share("pay", itl_1_name="Wales", SOC_2digit="21", quarter="2023Q1")
+
+To run this script, first build the feature matrix, then run the following command from the root directory:
+
+python dap_job_quality/pipeline/job_quality_prevalence.py
+
+The prevalence tables are saved to outputs/data/features/prevalence/, one parquet file per grouping.
+"""
+import plac
+
+from dap_job_quality import BUCKET_NAME, PROJECT_DIR, logger
+from dap_job_quality.getters.data_getters import load_s3_data
+from dap_job_quality.getters.ojo_getters import get_ojo_location_sample, get_ojo_sample
+from dap_job_quality.pipeline.build_feature_matrix import FEATURE_MATRIX_PATH
+from dap_job_quality.pipeline.salary.create_df_for_salary_analysis import (
+    SALARY_ANALYSIS_S3,
+)
+from dap_job_quality.utils.aggregation import IndicatorCube
+from dap_job_quality.utils.feature_matrix import FeatureMatrix
+
+import pandas as pd
+from typing import List
+
+PREVALENCE_DIR = PROJECT_DIR / "outputs/data/features/prevalence"
+GROUPINGS = [
+    [],
+    ["itl_1_name"],
+    ["SOC_2digit"],
+    ["quarter"],
+    ["itl_1_name", "SOC_2digit"],
+    ["itl_1_name", "quarter"],
+    ["SOC_2digit", "quarter"],
+    ["itl_1_name", "SOC_2digit", "quarter"],
+    ["SOC_4digit"],
+    ["itl_2_name"],
+]
+
+
+def get_group_keys() -> pd.DataFrame:
+    """Gets the region, occupation and created date of the job ads in the OJO sample.
+
+    Returns:
+        pd.DataFrame: indexed by job id, with the columns created, itl_1_name,
+            itl_2_name, SOC_2digit and SOC_4digit (missing if unknown)
+    """
+    keys = get_ojo_sample()[["id", "created"]].drop_duplicates("id")
+    locations = get_ojo_location_sample()[["id", "itl_1_name", "itl_2_name"]]
+    occupations = load_s3_data(
+        BUCKET_NAME, SALARY_ANALYSIS_S3, columns=["id", "SOC_2digit", "SOC_4digit"]
+    )
+    for lookup in [locations, occupations]:
+        keys = keys.merge(
+            lookup.astype({"id": keys["id"].dtype}).drop_duplicates("id"),
+            on="id",
+            how="left",
+        )
+    return keys.set_index("id")
+
+
+def get_indicator_cube() -> IndicatorCube:
+    """Gets an IndicatorCube of the saved feature matrix and the OJO sample group keys."""
+    return IndicatorCube(FeatureMatrix.load(FEATURE_MATRIX_PATH), get_group_keys())
+
+
+def grouping_name(by: List[str]) -> str:
+    """Name of the prevalence table of a grouping, eg. "itl_1_name_x_quarter"."""
+    return "_x_".join(by) or "all"
+
+
+def main():
+    cube = get_indicator_cube()
+    PREVALENCE_DIR.mkdir(parents=True, exist_ok=True)
+    for by in GROUPINGS:
+        prevalence = cube.prevalence(by)
+        file_path = PREVALENCE_DIR / f"{grouping_name(by)}.parquet"
+        prevalence.to_parquet(file_path, index=False)
+        logger.info(f"Saved {len(prevalence)} rows of prevalence to {file_path}")
+
+
+if __name__ == "__main__":
+    plac.call(main)
@@ -7,17 +7,64 @@ To run this script to generate 10,000 sentences of data, run the following comma
 
 python dap_job_quality/pipeline/keyword_search.py
 
-It will output a file into outputs/data, which can be manually uploaded to google sheets for further analysis."""
+It will output a file into outputs/data, which can be manually uploaded to google sheets for further analysis.
+
+To search every sentence instead, run:
+
+python dap_job_quality/pipeline/keyword_search.py -i True
+
+This searches the job ads one day (of their created date) at a time and saves the results of each day to
+outputs/data/keyword_search_partitions, so when it is re-run only the days with new or changed job ads are searched
+(or every day, if the search terms have changed).
+
+To clean and search the job ads in parallel processes (eg. 4), add -nj 4. To reuse the cleaned job descriptions
+and sentences of previous runs (keyed by the cleaning rules, see utils/text_cache.py), add -tc True.
+
+The time taken by each stage and the number of sentences searched are saved in a run report in outputs/reports/runs/
+(see utils/instrumentation.py)."""
 
 from dap_job_quality import PROJECT_DIR, logger
 from dap_job_quality.getters.ojo_getters import get_ojo_sample
-from dap_job_quality.utils.text_cleaning import clean_text, split_sentences
+from dap_job_quality.utils.incremental import (
+    hash_dataframe,
+    hash_object,
+    load_partitions,
+    run_incremental,
+)
+from dap_job_quality.utils.chunk import map_chunks
+from dap_job_quality.utils.instrumentation import increment, run_report, stage
+from dap_job_quality.utils.sentence_dictionary import (
+    SentenceDictionary,
+    build_sentence_dictionary,
+)
+from dap_job_quality.utils.text_cache import TEXT_CACHE_PATH
+from dap_job_quality.utils.text_cleaning import (
+    clean_text,
+    clean_texts,
+    cleaner_version,
+    disable_text_cache,
+    enable_text_cache,
+    split_sentences,
+)
+from functools import partial
 import pandas as pd
+import plac
+from typing import Iterable, List, Optional
 
 NO_SENTENCES = 10000
 INPUT_PATH = PROJECT_DIR / "inputs/keyword_lookup.csv"
+# Columns of the keyword search results
+OUTPUT_COLUMNS = [
+    "job_id",
+    "sentence_id",
+    "sentence",
+    "target_phrases_found",
+    "dimension",
+    "subcategory",
+]
 todays_date = pd.to_datetime("today").date()
 OUTPUT_PATH = PROJECT_DIR / f"outputs/data/keyword_search_{todays_date}.csv"
+PARTITIONS_DIR = PROJECT_DIR / "outputs/data/keyword_search_partitions"
 
 
 def get_analysis_sample(df: pd.DataFrame, no_of_sentences: int = NO_SENTENCES) -> dict:
@@ -26,56 +73,53 @@ def get_analysis_sample(df: pd.DataFrame, no_of_sentences: int = NO_SENTENCES) -
 
     Args:
         df (pd.DataFrame): The dataframe from which to take the sample, typically the ojo sample
-        no_of_sentences (int): The number of sentences required as output (as this is for prototyping, default is 10,000 sentences)
+        no_of_sentences (int): The number of sentences required as output (as this is for prototyping, default is 10,000 sentences).
+            If None, all sentences are returned.
 
     Returns:
         dict: A dictionary of the first n sentences for analysis, with the job_id (from the ojo df), sentence_id (from 0 to n within a single job_id) and sentence text
     """
-    sentences_for_analysis = {}
-    for i in range(0, len(df)):
-        job_id = df.iloc[i]["id"]
-        text_list = split_sentences(df.iloc[i]["clean_description"])
-        sentences_for_analysis[job_id] = {}  # Initialize the inner dictionary
-        for j in range(0, len(text_list)):
-            sentences_for_analysis[job_id][j] = text_list[j]
-
-    sentences_df = (
-        pd.DataFrame.from_dict(sentences_for_analysis, orient="index")
-        .stack()
-        .reset_index()
-    )
-    sentences_df.columns = ["job_id", "sentence_id", "sentence"]
-    output = sentences_df.iloc[0:no_of_sentences, :].to_dict(orient="records")
+    output = []
+    for job_id, clean_description in zip(df["id"], df["clean_description"]):
+        for sentence_id, sentence in enumerate(split_sentences(clean_description)):
+            output.append(
+                {"job_id": job_id, "sentence_id": sentence_id, "sentence": sentence}
+            )
+            if no_of_sentences is not None and len(output) >= no_of_sentences:
+                return output
     return output
 
 
-def run_keyword_search(
-    df: pd.DataFrame, search_terms: dict, no_of_sentences: int = NO_SENTENCES
-) -> pd.DataFrame:
-    """This function takes a dataframe of sentences, and a dictionary of search terms,
-    and returns a dataframe with each search term found within a sentence.
+def find_phrases(
+    sentences: Iterable[str], target_phrases: List[str]
+) -> List[List[str]]:
+    """Find the target phrases contained in each sentence (ignoring case).
 
     Args:
-        df (pd.DataFrame): The dataframe containing the sentences to be searched (typically the ojo sample)
-        search_terms (dict): A dictionary of search terms, their subcategory and overall job quality dimension (saved manually in the the INPUT_PATH)
-        no_of_sentences (int, optional): How many sentences to search Defaults to NO_SENTENCES.
+        sentences (Iterable[str]): The sentences to be searched
+        target_phrases (List[str]): The lowercase phrases to search for
 
     Returns:
-        pd.DataFrame: A dataframe with each sentence, the keywords found, and their respective dimension and subcategory.
-        Note that if there are two keywords found in a single sentence, there will be two rows for that sentence.
+        List[List[str]]: The target phrases found in each sentence
     """
-    data_for_search = get_analysis_sample(df, no_of_sentences)
+    found = []
+    for sentence in sentences:
+        sentence = sentence.lower()
+        found.append([phrase for phrase in target_phrases if phrase in sentence])
+    return found
 
-    target_phrases = list(search_terms.keys())
 
-    for item in data_for_search:
-        sentence = item["sentence"]
-        target_phrases_contained = [
-            phrase for phrase in target_phrases if phrase in sentence.lower()
-        ]
-        item["target_phrases_found"] = target_phrases_contained
+def explode_keywords(output_df: pd.DataFrame, search_terms: dict) -> pd.DataFrame:
+    """Create one row for each target phrase found in a sentence, and add their dimension and subcategory.
+
+    Args:
+        output_df (pd.DataFrame): One row per sentence, with a target_phrases_found column of lists
+        search_terms (dict): A dictionary of search terms, their subcategory and overall job quality dimension
 
-    output_df = pd.DataFrame(data_for_search)
+    Returns:
+        pd.DataFrame: One row per sentence and keyword found (or one row with no keyword), without sentence
+        splitting errors
+    """
     output_df = output_df.explode(
         "target_phrases_found"
     )  # Create one row for each target phrase found
@@ -93,28 +137,214 @@ def run_keyword_search(
     )
 
     # Filter out sentence splitting eror
-    output_df = output_df[output_df["sentence"].str.len() > 1]
+    return output_df[output_df["sentence"].str.len() > 1]
+
+
+def find_keywords(data_for_search: list, search_terms: dict) -> pd.DataFrame:
+    """This function takes a list of sentences, and a dictionary of search terms,
+    and returns a dataframe with each search term found within a sentence.
+
+    Args:
+        data_for_search (list): The sentences to be searched, as output by get_analysis_sample()
+        search_terms (dict): A dictionary of search terms, their subcategory and overall job quality dimension (saved manually in the the INPUT_PATH)
+
+    Returns:
+        pd.DataFrame: A dataframe with each sentence, the keywords found, and their respective dimension and subcategory.
+        Note that if there are two keywords found in a single sentence, there will be two rows for that sentence.
+    """
+    target_phrases = list(search_terms.keys())
+    found = find_phrases((item["sentence"] for item in data_for_search), target_phrases)
+    for item, target_phrases_contained in zip(data_for_search, found):
+        item["target_phrases_found"] = target_phrases_contained
+
+    output_df = pd.DataFrame(
+        data_for_search,
+        columns=["job_id", "sentence_id", "sentence", "target_phrases_found"],
+    )
+    return explode_keywords(output_df, search_terms)
+
+
+def find_keywords_in_dictionary(
+    dictionary: SentenceDictionary,
+    search_terms: dict,
+    n_jobs: Optional[int] = 1,
+    chunk_size: int = 100000,
+) -> pd.DataFrame:
+    """Search each unique sentence of a sentence dictionary for keywords once, and broadcast
+    the keywords found back to every occurrence of the sentence.
+
+    Args:
+        dictionary (SentenceDictionary): The unique sentences of the job ads, as output by build_sentence_dictionary()
+        search_terms (dict): A dictionary of search terms, their subcategory and overall job quality dimension
+        n_jobs (Optional[int], optional): Number of processes searching chunks of the unique sentences, where None is
+            the number of cores. Defaults to 1.
+        chunk_size (int, optional): Number of unique sentences searched at a time by each process. Defaults to 100000.
+
+    Returns:
+        pd.DataFrame: The same dataframe as find_keywords() of every sentence of the job ads.
+    """
+    found = [
+        target_phrases_contained
+        for chunk in map_chunks(
+            partial(find_phrases, target_phrases=list(search_terms.keys())),
+            dictionary.sentences,
+            chunk_size,
+            n_jobs=n_jobs,
+            executor="process",
+        )
+        for target_phrases_contained in chunk
+    ]
+    output_df = dictionary.to_frame(id_col="job_id")[
+        ["job_id", "sentence_id", "sentence"]
+    ]
+    output_df["target_phrases_found"] = dictionary.broadcast(found)
+    return explode_keywords(output_df, search_terms)
+
 
+@stage("keyword_search")
+def run_keyword_search(
+    df: pd.DataFrame, search_terms: dict, no_of_sentences: int = NO_SENTENCES
+) -> pd.DataFrame:
+    """This function takes a dataframe of sentences, and a dictionary of search terms,
+    and returns a dataframe with each search term found within a sentence.
+
+    Args:
+        df (pd.DataFrame): The dataframe containing the sentences to be searched (typically the ojo sample)
+        search_terms (dict): A dictionary of search terms, their subcategory and overall job quality dimension (saved manually in the the INPUT_PATH)
+        no_of_sentences (int, optional): How many sentences to search Defaults to NO_SENTENCES.
+
+    Returns:
+        pd.DataFrame: A dataframe with each sentence, the keywords found, and their respective dimension and subcategory.
+        Note that if there are two keywords found in a single sentence, there will be two rows for that sentence.
+    """
+    data_for_search = get_analysis_sample(df, no_of_sentences)
+    increment("keyword_search.sentences_in", len(data_for_search))
+    output_df = find_keywords(data_for_search, search_terms)
+    increment("keyword_search.rows_out", len(output_df))
+
+    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
     output_df.to_csv(OUTPUT_PATH)
-    path = OUTPUT_PATH
-    if not path.exists():
-        path.mkdir(parents=True)
+    return output_df
+
+
+def search_partition(
+    df: pd.DataFrame,
+    search_terms: dict,
+    n_jobs: Optional[int] = 1,
+    chunk_size: int = 10000,
+) -> pd.DataFrame:
+    """Clean the job ads created in one date partition and search every sentence for keywords.
+    Each unique sentence is only searched once (see utils/sentence_dictionary.py).
+
+    Args:
+        df (pd.DataFrame): The ojo job ads in the partition
+        search_terms (dict): A dictionary of search terms, their subcategory and overall job quality dimension
+        n_jobs (Optional[int], optional): Number of processes cleaning and searching chunks of the job ads, where
+            None is the number of cores. Defaults to 1.
+        chunk_size (int, optional): Number of job ads cleaned at a time by each process. Defaults to 10000.
+
+    Returns:
+        pd.DataFrame: A dataframe with each sentence, the keywords found, and their respective dimension and subcategory.
+    """
+    increment("keyword_search.ads_in", len(df))
+    dictionary = build_sentence_dictionary(df, n_jobs=n_jobs, chunk_size=chunk_size)
+    increment("keyword_search.sentences_in", dictionary.n_occurrences)
+    increment("keyword_search.unique_sentences_in", len(dictionary))
+    output_df = find_keywords_in_dictionary(dictionary, search_terms, n_jobs=n_jobs)
+    increment("keyword_search.rows_out", len(output_df))
+    return output_df
+
+
+@stage("incremental_keyword_search")
+def run_incremental_keyword_search(
+    df: pd.DataFrame,
+    search_terms: dict,
+    output_dir: str = str(PARTITIONS_DIR),
+    n_jobs: Optional[int] = 1,
+) -> pd.DataFrame:
+    """Search every sentence of the ojo job ads for keywords, one day of job ads at a time.
+    Only the days with new or changed job ads are searched, unless the search terms or the cleaning rules have changed.
+
+    Args:
+        df (pd.DataFrame): The ojo job ads, with a created column
+        search_terms (dict): A dictionary of search terms, their subcategory and overall job quality dimension
+        output_dir (str, optional): Where the results of each day are saved. Defaults to PARTITIONS_DIR.
+        n_jobs (Optional[int], optional): Number of processes searching each day, where None is the number of cores.
+            Defaults to 1.
+
+    Returns:
+        pd.DataFrame: A dataframe with each sentence, the keywords found, and their respective dimension and subcategory.
+    """
+    run_incremental(
+        df,
+        lambda partition_df: search_partition(partition_df, search_terms, n_jobs),
+        output_dir,
+        stage="keyword_search",
+        # the cleaning rules change the sentences searched
+        version=hash_object([search_terms, cleaner_version()]),
+        hash_fn=lambda partition_df: hash_dataframe(
+            partition_df[["id", "description"]]
+        ),
+    )
+    output_df = load_partitions(output_dir, columns=OUTPUT_COLUMNS)
+
+    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
     output_df.to_csv(OUTPUT_PATH)
+    return output_df
 
 
-if __name__ == "__main__":
+@plac.annotations(
+    incremental=(
+        "search every sentence, one day of job ads at a time",
+        "option",
+        "i",
+        bool,
+    ),
+    n_jobs=(
+        "number of processes cleaning and searching the job ads",
+        "option",
+        "nj",
+        int,
+    ),
+    text_cache=(
+        "reuse cleaned job descriptions and sentences cached in outputs/cache",
+        "option",
+        "tc",
+        bool,
+    ),
+)
+def main(incremental: bool = False, n_jobs: int = 1, text_cache: bool = False):
+    with run_report("keyword_search"):
+        if text_cache:
+            enable_text_cache(path=TEXT_CACHE_PATH)
+        try:
+            search(incremental, n_jobs)
+        finally:
+            if text_cache:
+                logger.info(f"Text cache: {disable_text_cache()}")
+
+
+def search(incremental: bool = False, n_jobs: int = 1):
     # Import and clean the data
     logger.info("Downloading OJO sample from S3")
-    ojo_df = get_ojo_sample()
-
-    logger.info("Download complete - running analysis")
-    ojo_df["clean_description"] = ojo_df["description"].apply(clean_text)
+    with stage("load_ojo_sample"):
+        ojo_df = get_ojo_sample()
 
     # Get current search terms
     search_terms = (
         pd.read_csv(INPUT_PATH).set_index("target_phrase").to_dict(orient="index")
     )
 
-    run_keyword_search(ojo_df, search_terms)
+    logger.info("Download complete - running analysis")
+    if incremental:
+        run_incremental_keyword_search(ojo_df, search_terms, n_jobs=n_jobs)
+    else:
+        with stage("clean_descriptions"):
+            ojo_df["clean_description"] = clean_texts(ojo_df["description"], n_jobs)
+        run_keyword_search(ojo_df, search_terms)
 
     logger.info("Analysis complete - output saved to outputs/data/")
+
+
+if __name__ == "__main__":
+    plac.call(main)
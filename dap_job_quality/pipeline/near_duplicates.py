@@ -0,0 +1,97 @@
+"""
+This script finds near-duplicate job ads (eg. ads reposted with small edits) in the
+OJO sample with a MinHash LSH index, and outputs the clusters of near-duplicates so
+they can be dropped before keyword counts or labelling.
+
+To build the index and find near-duplicates with a Jaccard similarity of at
+least 0.8, run the following command from the root directory:
+
+python dap_job_quality/pipeline/near_duplicates.py -t 0.8
+
+The index is saved to outputs/data/near_duplicates/, and passing it back in
+with -i adds new ads to it incrementally instead of rebuilding it:
+
+python dap_job_quality/pipeline/near_duplicates.py -i outputs/data/near_duplicates/minhash_lsh_index.npz
+"""
+import plac
+
+from dap_job_quality import PROJECT_DIR, logger
+from dap_job_quality.getters.ojo_getters import get_ojo_sample_chunks
+from dap_job_quality.utils.near_duplicates import MinHashLSH
+
+import pandas as pd
+from typing import Optional
+
+OUTPUT_DIR = PROJECT_DIR / "outputs/data/near_duplicates"
+INDEX_PATH = OUTPUT_DIR / "minhash_lsh_index.npz"
+CLUSTERS_PATH = OUTPUT_DIR / "near_duplicate_clusters.csv"
+
+
+def clusters_to_df(clusters: list) -> pd.DataFrame:
+    """Convert clusters of near-duplicate job ids to a dataframe.
+
+    Args:
+        clusters (list): clusters of near-duplicate job ids
+
+    Returns:
+        pd.DataFrame: one row per job ad with the cluster_id, cluster_size and id
+    """
+    return pd.DataFrame(
+        [
+            {"cluster_id": cluster_id, "cluster_size": len(cluster), "id": job_id}
+            for cluster_id, cluster in enumerate(clusters)
+            for job_id in cluster
+        ],
+        columns=["cluster_id", "cluster_size", "id"],
+    )
+
+
+@plac.annotations(
+    threshold=("Jaccard similarity threshold", "option", "t", float),
+    index_path=("existing index to add new ads to", "option", "i", str),
+    chunk_size=("chunk_size", "option", "cs", int),
+)
+def find_near_duplicates(
+    threshold: float = 0.8, index_path: Optional[str] = None, chunk_size: int = 10000
+) -> pd.DataFrame:
+    """Index the OJO sample and find clusters of near-duplicate job ads.
+
+    Args:
+        threshold (float, optional): Jaccard similarity above which two job ads are
+            near-duplicates. Ignored if an existing index is given. Defaults to 0.8.
+        index_path (Optional[str], optional): path to an existing index. Ads that
+            are already in it are not re-indexed. Defaults to None.
+        chunk_size (int, optional): number of job ads indexed at a time.
+            Defaults to 10000.
+
+    Returns:
+        pd.DataFrame: one row per near-duplicate job ad with its cluster
+    """
+    if index_path:
+        index = MinHashLSH.load(index_path)
+        logger.info(f"Loaded index of {len(index)} job ads from {index_path}")
+    else:
+        index = MinHashLSH(threshold=threshold)
+    indexed_ids = set(index.keys)
+
+    for chunk in get_ojo_sample_chunks(chunksize=chunk_size):
+        chunk = chunk.dropna(subset=["description"])
+        chunk = chunk[~chunk["id"].isin(indexed_ids)]
+        index.insert(chunk["id"], chunk["description"])
+        indexed_ids.update(chunk["id"])
+        logger.info(f"Indexed {len(index)} job ads")
+
+    clusters_df = clusters_to_df(index.duplicate_clusters())
+    logger.info(
+        f"Found {clusters_df['cluster_id'].nunique()} clusters of near-duplicates "
+        f"covering {len(clusters_df)} job ads"
+    )
+
+    index.save(INDEX_PATH)
+    clusters_df.to_csv(CLUSTERS_PATH, index=False)
+    logger.info(f"Index and clusters saved to {OUTPUT_DIR}")
+    return clusters_df
+
+
+if __name__ == "__main__":
+    plac.call(find_near_duplicates)
@@ -0,0 +1,206 @@
+"""
+This script mines the cleaned sentences of the OJO sample for candidate phrases to add to the keyword lookup,
+rather than only mining n-grams from the spans we have already labelled.
+
+Sentences are streamed in chunks and each one is given the job quality dimension of the keywords it contains
+(or "none"). Words, bigrams and trigrams are counted per dimension, with rare n-grams pruned as the counts grow
+so memory stays bounded. Candidate phrases are then scored by:
+    - how strongly their words go together (PMI and normalised PMI)
+    - how strongly they are associated with each existing job quality dimension (NPMI of the phrase and the dimension)
+
+To run this script, first download the current search terms and place them in the /inputs folder
+(see keyword_search.py), then run the following command from the root directory:
+
+python dap_job_quality/pipeline/phrase_mining.py
+
+It outputs a ranked table of candidate phrases, which are not already in the keyword lookup, into
+outputs/data/phrase_mining/.
+"""
+import plac
+
+from dap_job_quality import PROJECT_DIR, logger
+from dap_job_quality.getters.ojo_getters import get_ojo_sample_chunks
+from dap_job_quality.utils.ngrams import (
+    NgramCounter,
+    category_association,
+    collocation_scores,
+)
+from dap_job_quality.utils.text_cleaning import clean_text, split_sentences
+
+import pandas as pd
+import re
+from typing import Iterable, List, Tuple
+
+INPUT_PATH = PROJECT_DIR / "inputs/keyword_lookup.csv"
+todays_date = pd.to_datetime("today").date()
+OUTPUT_PATH = (
+    PROJECT_DIR / f"outputs/data/phrase_mining/candidate_phrases_{todays_date}.csv"
+)
+NO_DIMENSION = "none"
+
+
+def compile_keyword_pattern(search_terms: dict) -> re.Pattern:
+    """Compile the keywords into a single pattern, longest first so that the
+    longest keyword at a position is matched.
+
+    Args:
+        search_terms (dict): target phrase to a dict with a "dimension" key,
+            as read from the keyword lookup in keyword_search.py
+
+    Returns:
+        re.Pattern: pattern matching any keyword
+    """
+    phrases = sorted(search_terms, key=len, reverse=True)
+    return re.compile("|".join(re.escape(phrase.lower()) for phrase in phrases))
+
+
+def label_sentences(
+    sentences: Iterable[str], search_terms: dict, keyword_pattern: re.Pattern
+) -> Tuple[List[str], List[str]]:
+    """Give each sentence the job quality dimensions of the keywords it contains.
+    A sentence with keywords from two dimensions is returned once for each.
+
+    Args:
+        sentences (Iterable[str]): cleaned sentences
+        search_terms (dict): target phrase to a dict with a "dimension" key
+        keyword_pattern (re.Pattern): output of compile_keyword_pattern()
+
+    Returns:
+        Tuple[List[str], List[str]]: sentences and their dimension, NO_DIMENSION
+            if they contain no keywords
+    """
+    lower_terms = {phrase.lower(): terms for phrase, terms in search_terms.items()}
+    labelled_sentences, dimensions = [], []
+    for sentence in sentences:
+        sentence_dimensions = {
+            lower_terms[match]["dimension"]
+            for match in keyword_pattern.findall(sentence.lower())
+        } or {NO_DIMENSION}
+        for dimension in sorted(sentence_dimensions):
+            labelled_sentences.append(sentence)
+            dimensions.append(dimension)
+    return labelled_sentences, dimensions
+
+
+def count_sentence_ngrams(
+    chunks: Iterable[pd.DataFrame],
+    search_terms: dict,
+    max_n: int = 3,
+    prune_count: int = 2,
+    prune_every: int = 10,
+) -> NgramCounter:
+    """Count the n-grams of the sentences of streamed job ads per job quality dimension.
+
+    Args:
+        chunks (Iterable[pd.DataFrame]): chunks of job ads with a description column
+        search_terms (dict): target phrase to a dict with a "dimension" key
+        max_n (int, optional): longest n-grams to count. Defaults to 3.
+        prune_count (int, optional): n-grams counted fewer than this many times
+            are dropped every prune_every chunks. Defaults to 2.
+        prune_every (int, optional): number of chunks between pruning. Defaults to 10.
+
+    Returns:
+        NgramCounter: n-gram counts per dimension
+    """
+    keyword_pattern = compile_keyword_pattern(search_terms)
+    counter = NgramCounter(ns=range(1, max_n + 1))
+    n_sentences = 0
+    for i, chunk in enumerate(chunks, start=1):
+        sentences = [
+            sentence
+            for description in chunk["description"].dropna()
+            for sentence in split_sentences(clean_text(description))
+            if len(sentence) > 1
+        ]
+        counter.update(*label_sentences(sentences, search_terms, keyword_pattern))
+        n_sentences += len(sentences)
+        if i % prune_every == 0:
+            counter.prune(prune_count)
+            logger.info(f"Counted n-grams in {n_sentences} sentences")
+    return counter
+
+
+def rank_candidate_phrases(
+    counter: NgramCounter,
+    search_terms: dict,
+    min_count: int = 20,
+) -> pd.DataFrame:
+    """Score and rank the counted bigrams and longer n-grams as candidate phrases.
+
+    Args:
+        counter (NgramCounter): output of count_sentence_ngrams()
+        search_terms (dict): target phrase to a dict with a "dimension" key, whose
+            phrases are left out of the candidates
+        min_count (int, optional): minimum count of a candidate. Defaults to 20.
+
+    Returns:
+        pd.DataFrame: one row per candidate phrase with its count, PMI, NPMI, the
+            dimension it is most associated with, and the NPMI of that association,
+            ranked within each dimension
+    """
+    dimensions = [
+        dimension for dimension in counter.categories if dimension != NO_DIMENSION
+    ]
+    candidates = []
+    for n in counter.ns[1:]:
+        scores = collocation_scores(counter, n).set_index("key")
+        association = category_association(counter, n)[dimensions]
+        scores["n"] = n
+        scores["dimension"] = association.idxmax(axis=1)
+        scores["dimension_npmi"] = association.max(axis=1)
+        candidates.append(scores[scores["count"] >= min_count])
+    candidates = pd.concat(candidates, ignore_index=True)
+
+    existing = {phrase.lower() for phrase in search_terms}
+    candidates = candidates[~candidates["ngram"].isin(existing)]
+    # phrases that are both good collocations and specific to a dimension rank highest
+    candidates["score"] = candidates["npmi"].clip(lower=0) * candidates[
+        "dimension_npmi"
+    ].clip(lower=0)
+    return candidates.sort_values(
+        ["dimension", "score"], ascending=[True, False]
+    ).reset_index(drop=True)[
+        ["dimension", "ngram", "n", "count", "pmi", "npmi", "dimension_npmi", "score"]
+    ]
+
+
+@plac.annotations(
+    min_count=("min_count", "option", "mc", int),
+    max_n=("max_n", "option", "n", int),
+    prune_count=("prune_count", "option", "pc", int),
+    chunk_size=("chunk_size", "option", "cs", int),
+)
+def mine_phrases(
+    min_count: int = 20, max_n: int = 3, prune_count: int = 2, chunk_size: int = 10000
+) -> pd.DataFrame:
+    """Mine the OJO sample for candidate keyword phrases and save them ranked.
+
+    Args:
+        min_count (int, optional): minimum count of a candidate phrase. Defaults to 20.
+        max_n (int, optional): longest phrases, in words. Defaults to 3.
+        prune_count (int, optional): n-grams counted fewer than this many times are
+            dropped as the counts grow. Defaults to 2.
+        chunk_size (int, optional): number of job ads read at a time. Defaults to 10000.
+
+    Returns:
+        pd.DataFrame: ranked candidate phrases
+    """
+    search_terms = (
+        pd.read_csv(INPUT_PATH).set_index("target_phrase").to_dict(orient="index")
+    )
+    counter = count_sentence_ngrams(
+        get_ojo_sample_chunks(chunksize=chunk_size),
+        search_terms,
+        max_n=max_n,
+        prune_count=prune_count,
+    )
+    candidates = rank_candidate_phrases(counter, search_terms, min_count=min_count)
+
+    OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    candidates.to_csv(OUTPUT_PATH, index=False)
+    logger.info(f"Saved {len(candidates)} candidate phrases to {OUTPUT_PATH}")
+    return candidates
+
+
+if __name__ == "__main__":
+    plac.call(mine_phrases)
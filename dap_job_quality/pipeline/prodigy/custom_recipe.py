@@ -20,14 +20,16 @@ import copy
 from prodigy.components.loaders import JSONL
 from prodigy.components.preprocess import add_tokens
 
-# LOAD NER MODEL
 model_folder = PROJECT_DIR / "outputs/models/ner_model/20230808"
-if not model_folder.exists():
-    logger.error(
-        f"Model folder {model_folder} does not exist. Please download the model."
-    )
 
-nlp = spacy.load(model_folder)
+
+def load_ner_model() -> spacy.language.Language:
+    """Load the NER model, when the recipe is run rather than when it is imported."""
+    if not model_folder.exists():
+        logger.error(
+            f"Model folder {model_folder} does not exist. Please download the model."
+        )
+    return spacy.load(model_folder)
 
 
 def make_tasks(
@@ -77,6 +79,7 @@ def custom_ner(dataset, source):
     blocks = [{"view_id": "ner_manual"}, {"view_id": "text_input"}]
 
     stream = JSONL(source)
+    nlp = load_ner_model()
 
     # Add tokens to the stream
     stream = add_tokens(nlp, stream)
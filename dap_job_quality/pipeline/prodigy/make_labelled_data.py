@@ -8,29 +8,93 @@ python dap_job_quality/pipeline/prodigy/make_labelled_data.py -ts 1000
 
 if you would also like to save to s3, run:
 python dap_job_quality/pipeline/prodigy/make_labelled_data.py -ts 1000 -s3 True
+
+The OJO sample is streamed in chunks and sampled with a hash-based sampler, so
+the same random seed always gives the same job ads and near-identical ads are
+only sampled once. To stratify the sample (eg. by ITL 3 region, sector or the
+job quality dimension of the first keyword found in the ad), run:
+
+python dap_job_quality/pipeline/prodigy/make_labelled_data.py -ts 1000 -sb itl_3_code
+python dap_job_quality/pipeline/prodigy/make_labelled_data.py -ts 1000 -sb sector
+python dap_job_quality/pipeline/prodigy/make_labelled_data.py -ts 1000 -sb dimension
+
+To reuse the job descriptions cleaned by previous runs (of this script or
+keyword_search.py -tc True), add -tc True.
 """
 import plac
 import srsly
 
-from dap_job_quality.getters.ojo_getters import get_ojo_sample
+from dap_job_quality.getters.ojo_getters import (
+    get_ojo_job_title_sample,
+    get_ojo_sample_chunks,
+)
 from dap_job_quality.getters.data_getters import save_to_s3
 
-from dap_job_quality.utils.text_cleaning import clean_text
+from dap_job_quality.utils.sampling import (
+    column_strata,
+    keyword_strata,
+    lookup_strata,
+    stratified_hash_sample,
+)
+from dap_job_quality.utils.text_cache import TEXT_CACHE_PATH
+from dap_job_quality.utils.text_cleaning import (
+    clean_texts,
+    disable_text_cache,
+    enable_text_cache,
+)
 from dap_job_quality import BUCKET_NAME, PROJECT_DIR, logger
 
 from datetime import datetime
 import os
+import pandas as pd
+from typing import Callable, List, Optional
+
+KEYWORD_LOOKUP_PATH = PROJECT_DIR / "inputs/keyword_lookup.csv"
+JOB_TITLE_STRATA = ["sector", "parent_sector", "knowledge_domain", "occupation"]
 
-import json
+
+def get_strata_fn(stratify_by: Optional[str]) -> Optional[Callable]:
+    """Get the function that assigns each streamed job ad to a stratum.
+
+    Args:
+        stratify_by (Optional[str]): "dimension" to stratify by the job quality
+            dimension of the first keyword found, a field of the job title
+            sample (eg. "sector") or a column of the ojo sample (eg. "itl_3_code").
+            If None, the sample is not stratified.
+
+    Returns:
+        Optional[Callable]: strata function for the sampler
+    """
+    if not stratify_by:
+        return None
+    if stratify_by == "dimension":
+        search_terms = (
+            pd.read_csv(KEYWORD_LOOKUP_PATH)
+            .set_index("target_phrase")
+            .to_dict(orient="index")
+        )
+        return keyword_strata(search_terms)
+    if stratify_by in JOB_TITLE_STRATA:
+        job_titles = get_ojo_job_title_sample()
+        return lookup_strata(dict(zip(job_titles["id"], job_titles[stratify_by])))
+    return column_strata(stratify_by)
 
 
 @plac.annotations(
     train_size=("train_size", "option", "ts", int),
     to_s3=("to_s3", "option", "s3", bool),
     random_seed=("random_seed", "option", "rs", int),
+    stratify_by=("stratify_by", "option", "sb", str),
+    chunk_size=("chunk_size", "option", "cs", int),
+    text_cache=("text_cache", "option", "tc", bool),
 )
 def make_labelled_data(
-    train_size: int = 1000, to_s3: bool = False, random_seed: int = 42
+    train_size: int = 1000,
+    to_s3: bool = False,
+    random_seed: int = 42,
+    stratify_by: Optional[str] = None,
+    chunk_size: int = 10000,
+    text_cache: bool = False,
 ):
     """Function to create a sub-sample of the OJO data and
     convert it to .jsonl format from which it can be annotated
@@ -42,68 +106,112 @@ def make_labelled_data(
         save_to_s3 (bool, optional): whether to save labelled data to s3.
             Defaults to False.
         random_seed (int, optional): random seed for reproducibility.
+        stratify_by (Optional[str], optional): what to stratify the sample by,
+            see get_strata_fn(). Defaults to None (no stratification).
+        chunk_size (int, optional): number of job ads streamed at a time.
+            Defaults to 10000.
+        text_cache (bool, optional): whether to reuse job descriptions cleaned
+            by previous runs, see utils/text_cache.py. Defaults to False.
     """
 
-    # load ojo sample and subset of unique job descriptions
-    ojo_sample = (
-        get_ojo_sample()
-        .drop_duplicates(subset="description")
-        .sample(frac=1, random_state=random_seed)[:train_size]  # shuffle
-        .reset_index(drop=True)
+    # stream the ojo sample and sample unique job descriptions
+    ojo_sample = stratified_hash_sample(
+        get_ojo_sample_chunks(chunksize=chunk_size),
+        sample_size=train_size,
+        random_seed=random_seed,
+        strata_fn=get_strata_fn(stratify_by),
     )
+    if stratify_by:
+        logger.info(
+            f"sampled job ads by {stratify_by}: {ojo_sample['stratum'].value_counts().to_dict()}"
+        )
 
     # apply minimal text cleaning to job descriptions
-    ojo_sample["clean_description"] = (
-        ojo_sample.description.apply(clean_text)
+    if text_cache:
+        enable_text_cache(path=TEXT_CACHE_PATH)
+    try:
+        ojo_sample["clean_description"] = clean_descriptions(ojo_sample.description)
+    finally:
+        if text_cache:
+            logger.info(f"Text cache: {disable_text_cache()}")
+
+    today_date = datetime.today().strftime("%Y-%m-%d").replace("-", "")
+    save_labelling_data(
+        make_prodigy_tasks(ojo_sample),
+        f"{today_date}_ads_to_label_ts_{str(train_size)}_random_seed_{str(random_seed)}.jsonl",
+        to_s3=to_s3,
+    )
+
+
+def clean_descriptions(descriptions: pd.Series, n_jobs: Optional[int] = 1) -> pd.Series:
+    """Apply minimal text cleaning to job descriptions before labelling.
+
+    Args:
+        descriptions (pd.Series): raw job descriptions
+        n_jobs (Optional[int], optional): number of processes cleaning the
+            descriptions, where None is the number of cores. Defaults to 1.
+
+    Returns:
+        pd.Series: cleaned job descriptions
+    """
+    return (
+        pd.Series(
+            clean_texts(descriptions, n_jobs),
+            index=descriptions.index,
+            dtype=object,
+        )
         .str.replace("[", "")
         .str.replace("]", "")
         .str.strip()
     )
 
-    data_to_label = ojo_sample[["id", "clean_description"]].to_dict(orient="records")
-
-    converted_training_data_local = []
-    converted_training_data_jsonl = ""
-    for data in data_to_label:
-        training_data_json = {
-            "text": data["clean_description"],
-            "meta": {"job_id": data["id"]},
-        }
-        converted_training_data_local.append(training_data_json)
-        # create json lines for s3
-        converted_training_data_jsonl += json.dumps(
-            training_data_json, ensure_ascii=False
-        )
-        converted_training_data_jsonl += "\n"
 
+def make_prodigy_tasks(
+    df: pd.DataFrame, id_col: str = "id", text_col: str = "clean_description"
+) -> List[dict]:
+    """Convert job ads to Prodigy tasks.
+
+    Args:
+        df (pd.DataFrame): job ads to label
+        id_col (str, optional): column with the job id. Defaults to "id".
+        text_col (str, optional): column with the cleaned job description.
+            Defaults to "clean_description".
+
+    Returns:
+        List[dict]: Prodigy tasks with "text" and "meta" keys
+    """
+    return [
+        {"text": text, "meta": {"job_id": job_id}}
+        for job_id, text in zip(df[id_col], df[text_col])
+    ]
+
+
+def save_labelling_data(tasks: List[dict], file_name: str, to_s3: bool = False):
+    """Save Prodigy tasks to a .jsonl file in the labelled_data folder and,
+    optionally, to s3.
+
+    Args:
+        tasks (List[dict]): Prodigy tasks
+        file_name (str): name of the .jsonl file
+        to_s3 (bool, optional): whether to also save the tasks to s3.
+            Defaults to False.
+    """
     # save data locally
-    today_date = datetime.today().strftime("%Y-%m-%d").replace("-", "")
     data_path = PROJECT_DIR / "dap_job_quality/pipeline/prodigy/labelled_data"
     logger.info(
-        f"saving labelled data locally of size {train_size} to {data_path} location"
+        f"saving labelled data locally of size {len(tasks)} to {data_path} location"
     )
 
     if not data_path.exists():
         os.makedirs(data_path)
 
-    srsly.write_jsonl(
-        os.path.join(
-            data_path,
-            f"{today_date}_ads_to_label_ts_{str(train_size)}_random_seed_{str(random_seed)}.jsonl",
-        ),
-        converted_training_data_local,
-    )
+    srsly.write_jsonl(os.path.join(data_path, file_name), tasks)
 
     if to_s3:
         logger.info("saving labelled data to s3")
-        s3_path = os.path.join(
-            "job_quality",
-            "prodigy",
-            "labelled_data",
-            f"{today_date}_ads_to_label_ts_{str(train_size)}_random_seed_{str(random_seed)}.jsonl",
-        )
-        # this is NOT being saved as a jsonl file, but as a json file
-        save_to_s3(BUCKET_NAME, converted_training_data_jsonl, s3_path)
+        s3_path = os.path.join("job_quality", "prodigy", "labelled_data", file_name)
+        # saved as one task per line, as it is saved locally
+        save_to_s3(BUCKET_NAME, tasks, s3_path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,184 @@
+"""
+This script selects the next batch of OJO job ads to label with active learning,
+instead of sampling uniformly at random like make_labelled_data.py.
+
+A pool of unlabelled job ads is scored by how uncertain their job quality
+dimension is, from the similarity of their sentence embeddings to the spans
+labelled so far (weighted towards rare dimensions like 6_voice_representation),
+and optionally from the confidence of the NER model's entities. The most
+uncertain job ads are shortlisted and a diverse batch is picked from the
+shortlist with a k-center step, then saved as Prodigy .jsonl.
+
+To select 1000 job ads using the labelled data downloaded from Prodigy, run:
+
+python dap_job_quality/pipeline/prodigy/select_candidates.py -ts 1000 \
+    -lf dap_job_quality/pipeline/prodigy/labelled_data/20240119_ads_labelled.jsonl
+
+To also use the NER model (see README.md to download it), add `-ner True`.
+"""
+import plac
+
+from dap_job_quality import PROJECT_DIR, logger
+from dap_job_quality.getters.data_getters import load_labelled_spans
+from dap_job_quality.getters.ojo_getters import get_ojo_sample_chunks
+from dap_job_quality.pipeline.prodigy.make_labelled_data import (
+    clean_descriptions,
+    make_prodigy_tasks,
+    save_labelling_data,
+)
+from dap_job_quality.utils.active_learning import (
+    label_prototypes,
+    label_weights,
+    prototype_uncertainty,
+    select_candidates,
+)
+from dap_job_quality.utils.bert_vectorizer import BertVectorizer, embed_unique_texts
+from dap_job_quality.utils.chunk import list_chunks
+from dap_job_quality.utils.sampling import stratified_hash_sample
+
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import spacy
+from typing import List
+
+NER_MODEL_FOLDER = PROJECT_DIR / "outputs/models/ner_model/20230808"
+
+
+def embed_texts(texts: List[str], chunk_size: int = 1000) -> np.ndarray:
+    """Embed texts in chunks with the sentence transformer used across the repo,
+    embedding repeated texts once.
+
+    Args:
+        texts (List[str]): texts to embed
+        chunk_size (int, optional): number of texts embedded at a time.
+            Defaults to 1000.
+
+    Returns:
+        np.ndarray: (n, d) array of embeddings
+    """
+    bert_model = BertVectorizer(verbose=True, multi_process=False).fit()
+    return embed_unique_texts(bert_model, texts, chunk_size)
+
+
+def ner_uncertainty(
+    texts: List[str], batch_size: int = 256, beam_width: int = 8
+) -> np.ndarray:
+    """Score how uncertain the NER model is about the entities in each text,
+    using the entity probabilities from a beam search. An entity predicted with
+    a probability of 0.5 is the most uncertain.
+
+    Args:
+        texts (List[str]): job ads to score
+        batch_size (int, optional): number of texts parsed at a time. Defaults to 256.
+        beam_width (int, optional): width of the beam search. Defaults to 8.
+
+    Returns:
+        np.ndarray: (n,) uncertainty scores between 0 and 1
+    """
+    nlp = spacy.load(NER_MODEL_FOLDER)
+    ner = nlp.get_pipe("ner")
+
+    scores = []
+    for batch_texts in list_chunks(texts, batch_size):
+        docs = list(nlp.pipe(batch_texts, disable=["ner"]))
+        beams = ner.beam_parse(docs, beam_width=beam_width)
+        for entity_scores in ner.scored_ents(beams):
+            probs = np.fromiter(entity_scores.values(), dtype=np.float32)
+            scores.append((1 - np.abs(2 * probs - 1)).max() if len(probs) else 0.0)
+    return np.array(scores, dtype=np.float32)
+
+
+@plac.annotations(
+    train_size=("train_size", "option", "ts", int),
+    labelled_files=("comma separated Prodigy output files", "option", "lf", str),
+    pool_size=("pool_size", "option", "ps", int),
+    pool_factor=("pool_factor", "option", "pf", int),
+    use_ner=("use_ner", "option", "ner", bool),
+    to_s3=("to_s3", "option", "s3", bool),
+    random_seed=("random_seed", "option", "rs", int),
+)
+def select_labelling_batch(
+    train_size: int = 1000,
+    labelled_files: str = "",
+    pool_size: int = 100000,
+    pool_factor: int = 5,
+    use_ner: bool = False,
+    to_s3: bool = False,
+    random_seed: int = 42,
+):
+    """Select the next batch of job ads to label with active learning and save
+    it as Prodigy .jsonl.
+
+    Args:
+        train_size (int, optional): size of the batch to label. Defaults to 1000.
+        labelled_files (str, optional): comma separated paths to Prodigy output
+            files with the labels so far.
+        pool_size (int, optional): number of unlabelled job ads to score.
+            Defaults to 100000.
+        pool_factor (int, optional): the most uncertain pool_factor x train_size
+            job ads are shortlisted before the diversity step. Defaults to 5.
+        use_ner (bool, optional): whether to also score job ads with the NER
+            model. Defaults to False.
+        to_s3 (bool, optional): whether to save the batch to s3. Defaults to False.
+        random_seed (int, optional): random seed for the pool sample. Defaults to 42.
+    """
+    labelled_spans = load_labelled_spans(
+        [file for file in labelled_files.split(",") if file]
+    )
+    labelled_ids = set(labelled_spans["job_id"])
+    logger.info(
+        f"loaded {len(labelled_spans)} labelled spans from {len(labelled_ids)} job ads"
+    )
+
+    # sample a de-duplicated pool of unlabelled job ads
+    pool = stratified_hash_sample(
+        (chunk[~chunk["id"].isin(labelled_ids)] for chunk in get_ojo_sample_chunks()),
+        sample_size=pool_size,
+        random_seed=random_seed,
+    )
+    pool["clean_description"] = clean_descriptions(pool["description"])
+    logger.info(f"scoring a pool of {len(pool)} job ads")
+
+    pool_embeddings = embed_texts(pool["clean_description"].tolist())
+    labelled_embeddings = None
+    if len(labelled_spans) > 0:
+        span_embeddings = embed_texts(labelled_spans["span"].tolist())
+        uncertainty = prototype_uncertainty(
+            pool_embeddings,
+            label_prototypes(span_embeddings, labelled_spans["label"]),
+            weights=label_weights(labelled_spans["label"]),
+        )
+        labelled_embeddings = embed_texts(
+            labelled_spans.drop_duplicates("job_id")["text"].tolist()
+        )
+    else:
+        logger.info("no labelled spans, selecting on diversity only")
+        uncertainty = np.ones(len(pool), dtype=np.float32)
+
+    if use_ner:
+        # combine the two scores on the same scale by ranking them
+        ner_scores = ner_uncertainty(pool["clean_description"].tolist())
+        uncertainty = (
+            pd.Series(uncertainty).rank(pct=True).to_numpy()
+            + pd.Series(ner_scores).rank(pct=True).to_numpy()
+        ) / 2
+
+    selected = select_candidates(
+        uncertainty,
+        pool_embeddings,
+        batch_size=train_size,
+        pool_factor=pool_factor,
+        labelled_embeddings=labelled_embeddings,
+    )
+
+    today_date = datetime.today().strftime("%Y-%m-%d").replace("-", "")
+    save_labelling_data(
+        make_prodigy_tasks(pool.iloc[selected]),
+        f"{today_date}_ads_to_label_ts_{str(train_size)}_active_learning.jsonl",
+        to_s3=to_s3,
+    )
+
+
+if __name__ == "__main__":
+    plac.call(select_labelling_batch)
@@ -0,0 +1,286 @@
+"""
+This script benchmarks the hot paths of the pipeline on seeded synthetic OJO data (see utils/synthetic_ojo.py),
+so it runs offline and we can tell whether a change made them faster or slower:
+    - clean_text and split_sentences over every job description
+    - the keyword search over every sentence (get_analysis_sample and find_keywords, as in run_keyword_search)
+    - extract_soc_codes and merge_ojo_df, as in create_df_for_salary_analysis.py
+    - get_embeddings, optionally, as it needs the sentence transformer model to be downloaded
+
+Each benchmark is timed (the fastest of a few runs) and then run once more under tracemalloc to get its peak
+memory. The results are saved to outputs/benchmarks/ in a JSON file named after the current commit.
+
+To benchmark 10,000 job ads, run the following command from the root directory:
+
+python dap_job_quality/pipeline/run_benchmarks.py
+
+To benchmark 10k, 100k and 1M job ads, include the embeddings, and compare against the results of
+another commit, run:
+
+python dap_job_quality/pipeline/run_benchmarks.py -n 10000,100000,1000000 -e True \
+    -c outputs/benchmarks/benchmarks_<commit>.json
+"""
+import plac
+
+from dap_job_quality import PROJECT_DIR, logger
+from dap_job_quality.pipeline.keyword_search import find_keywords, get_analysis_sample
+from dap_job_quality.pipeline.salary.create_df_for_salary_analysis import (
+    extract_soc_codes,
+    merge_ojo_df,
+)
+from dap_job_quality.utils.synthetic_ojo import make_keyword_lookup, make_ojo_tables
+from dap_job_quality.utils.text_cleaning import clean_text, split_sentences
+
+from datetime import datetime
+import gc
+import json
+import pandas as pd
+import platform
+import subprocess
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+BENCHMARKS_DIR = PROJECT_DIR / "outputs/benchmarks"
+N_EMBEDDED_SENTENCES = 1000
+
+
+def bench_clean_text(tables: Dict[str, pd.DataFrame]) -> Callable:
+    descriptions = tables["ojo_df"]["description"].tolist()
+    return lambda: [clean_text(description) for description in descriptions]
+
+
+def bench_split_sentences(tables: Dict[str, pd.DataFrame]) -> Callable:
+    clean_descriptions = [clean_text(d) for d in tables["ojo_df"]["description"]]
+    return lambda: [split_sentences(description) for description in clean_descriptions]
+
+
+def bench_keyword_search(tables: Dict[str, pd.DataFrame]) -> Callable:
+    ojo_df = tables["ojo_df"].assign(
+        clean_description=tables["ojo_df"]["description"].apply(clean_text)
+    )
+    search_terms = (
+        make_keyword_lookup().set_index("target_phrase").to_dict(orient="index")
+    )
+    return lambda: find_keywords(
+        get_analysis_sample(ojo_df, no_of_sentences=None), search_terms
+    )
+
+
+def bench_extract_soc_codes(tables: Dict[str, pd.DataFrame]) -> Callable:
+    return lambda: extract_soc_codes(tables["ojo_occ"]["SOC"])
+
+
+def bench_merge_ojo_df(tables: Dict[str, pd.DataFrame]) -> Callable:
+    ojo_df = tables["ojo_df"].drop(columns="description")
+    return lambda: merge_ojo_df(
+        ojo_df, tables["ojo_occ"], tables["ojo_loc"], tables["ojo_sal"]
+    )
+
+
+def bench_get_embeddings(tables: Dict[str, pd.DataFrame]) -> Callable:
+    # imported here as it needs torch and the sentence transformer model
+    from dap_job_quality.utils.bert_vectorizer import get_embeddings
+
+    sentences = [
+        sentence
+        for description in tables["ojo_df"]["description"]
+        for sentence in split_sentences(clean_text(description))
+        if len(sentence) > 1
+    ][:N_EMBEDDED_SENTENCES]
+    return lambda: get_embeddings(sentences)
+
+
+BENCHMARKS = {
+    "clean_text": bench_clean_text,
+    "split_sentences": bench_split_sentences,
+    "keyword_search": bench_keyword_search,
+    "extract_soc_codes": bench_extract_soc_codes,
+    "merge_ojo_df": bench_merge_ojo_df,
+}
+
+
+def measure(fn: Callable, repeats: int = 3) -> dict:
+    """Time a function and measure its peak memory.
+
+    Args:
+        fn (Callable): function to benchmark
+        repeats (int, optional): number of timed runs. Defaults to 3.
+
+    Returns:
+        dict: the fastest and median wall time in seconds, and the peak memory
+            allocated in MB
+    """
+    seconds = []
+    for _ in range(repeats):
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - t0)
+
+    # tracemalloc slows the function down, so it is run separately
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": round(min(seconds), 4),
+        "median_seconds": round(float(pd.Series(seconds).median()), 4),
+        "peak_mb": round(peak / 1024**2, 1),
+    }
+
+
+def get_commit() -> str:
+    """Get the short hash of the current commit, with "-dirty" if there are
+    uncommitted changes, or "unknown" outside a git repository."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=PROJECT_DIR,
+        ).stdout.strip()
+        changes = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=PROJECT_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if changes else commit
+
+
+def run_benchmarks(
+    n_ads: List[int],
+    benchmarks: Dict[str, Callable] = BENCHMARKS,
+    repeats: int = 3,
+    seed: int = 42,
+) -> pd.DataFrame:
+    """Run the benchmarks on synthetic data of each size.
+
+    Args:
+        n_ads (List[int]): numbers of synthetic job ads
+        benchmarks (Dict[str, Callable], optional): benchmark name to a function
+            taking the synthetic tables and returning the function to benchmark.
+            Defaults to BENCHMARKS.
+        repeats (int, optional): number of timed runs. Defaults to 3.
+        seed (int, optional): random seed of the synthetic data. Defaults to 42.
+
+    Returns:
+        pd.DataFrame: one row per benchmark and size
+    """
+    results = []
+    for n in n_ads:
+        tables = make_ojo_tables(n, seed=seed)
+        for name, setup in benchmarks.items():
+            result = {"benchmark": name, "n_ads": n, **measure(setup(tables), repeats)}
+            logger.info(result)
+            results.append(result)
+    return pd.DataFrame(results)
+
+
+def compare_results(results: pd.DataFrame, baseline: pd.DataFrame) -> pd.DataFrame:
+    """Compare benchmark results to those of another commit.
+
+    Args:
+        results (pd.DataFrame): output of run_benchmarks()
+        baseline (pd.DataFrame): results of the other commit
+
+    Returns:
+        pd.DataFrame: the times and peak memory of both, with their ratios
+            (below 1 is an improvement)
+    """
+    comparison = results.merge(
+        baseline, on=["benchmark", "n_ads"], suffixes=("", "_baseline")
+    )
+    comparison["time_ratio"] = (
+        comparison["seconds"] / comparison["seconds_baseline"]
+    ).round(2)
+    comparison["memory_ratio"] = (
+        comparison["peak_mb"] / comparison["peak_mb_baseline"]
+    ).round(2)
+    return comparison[
+        [
+            "benchmark",
+            "n_ads",
+            "seconds_baseline",
+            "seconds",
+            "time_ratio",
+            "peak_mb_baseline",
+            "peak_mb",
+            "memory_ratio",
+        ]
+    ]
+
+
+@plac.annotations(
+    n_ads=("comma separated numbers of job ads", "option", "n", str),
+    benchmark_names=("comma separated benchmarks to run", "option", "b", str),
+    embeddings=("also benchmark get_embeddings", "option", "e", bool),
+    repeats=("repeats", "option", "r", int),
+    compare_to=("results file of another commit", "option", "c", str),
+)
+def main(
+    n_ads: str = "10000",
+    benchmark_names: str = "",
+    embeddings: bool = False,
+    repeats: int = 3,
+    compare_to: str = "",
+) -> pd.DataFrame:
+    """Run the benchmarks, save the results and optionally compare them to another commit.
+
+    Args:
+        n_ads (str, optional): comma separated numbers of synthetic job ads.
+            Defaults to "10000".
+        benchmark_names (str, optional): comma separated benchmarks to run.
+            Defaults to "", ie. all of them.
+        embeddings (bool, optional): whether to also benchmark get_embeddings.
+            Defaults to False.
+        repeats (int, optional): number of timed runs. Defaults to 3.
+        compare_to (str, optional): results file of another commit. Defaults to "".
+
+    Returns:
+        pd.DataFrame: the results
+    """
+    benchmarks = dict(BENCHMARKS)
+    if embeddings:
+        benchmarks["get_embeddings"] = bench_get_embeddings
+    if benchmark_names:
+        benchmarks = {
+            name: benchmarks[name] for name in benchmark_names.split(",") if name
+        }
+    results = run_benchmarks(
+        [int(n) for n in n_ads.split(",")], benchmarks, repeats=repeats
+    )
+
+    commit = get_commit()
+    BENCHMARKS_DIR.mkdir(parents=True, exist_ok=True)
+    results_path = BENCHMARKS_DIR / f"benchmarks_{commit}.json"
+    with open(results_path, "w") as f:
+        json.dump(
+            {
+                "commit": commit,
+                "run_at": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "machine": platform.platform(),
+                "results": results.to_dict(orient="records"),
+            },
+            f,
+            indent=2,
+        )
+    logger.info(f"Benchmarks:\n{results.to_string(index=False)}")
+    logger.info(f"Saved the results to {results_path}")
+
+    if compare_to:
+        with open(compare_to) as f:
+            baseline = pd.DataFrame(json.load(f)["results"])
+        comparison = compare_results(results, baseline)
+        logger.info(f"Compared to {compare_to}:\n{comparison.to_string(index=False)}")
+    return results
+
+
+if __name__ == "__main__":
+    plac.call(main)
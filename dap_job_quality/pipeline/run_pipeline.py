@@ -0,0 +1,318 @@
+"""
+This script runs the job quality workflow as a DAG of cached stages (see utils/dag.py), rather than running
+keyword_search.py, make_labelled_data.py, create_df_for_salary_analysis.py and salary_internal_tests.py one
+after another, each re-downloading and recomputing its inputs:
+
+    ojo_sample ──┬── sentence_dictionary ── keyword_search
+                 └── labelling_sample
+    ojo_occ, ojo_loc, ojo_sal, ojo_large_sample ── salary_analysis ── salary_checks
+
+Each stage's output is cached in outputs/cache/pipeline under a hash of its code (the stage function and the
+whole modules of the functions it calls), parameters and input files (the ETags of the OJO tables in S3, and
+the contents of inputs/keyword_lookup.csv and the salary rules), so only the stages that have changed are re-run:
+after editing the keyword lookup, only the keyword search is redone, over the cached dictionary of unique
+sentences (see utils/sentence_dictionary.py).
+The keyword search and labelling branches and the salary branch run in parallel.
+
+To run the whole workflow, run the following command from the root directory:
+
+python dap_job_quality/pipeline/run_pipeline.py
+
+To only run some stages (and the stages they depend on), to see which stages would be run without running
+them, or to re-run a stage even though its output is cached:
+
+python dap_job_quality/pipeline/run_pipeline.py -t keyword_search,salary_checks
+python dap_job_quality/pipeline/run_pipeline.py -d True
+python dap_job_quality/pipeline/run_pipeline.py -f salary_analysis
+
+The keyword search results are saved to outputs/data/, the job ads to label to the prodigy labelled_data folder
+and the salary rule violations next to salary_internal_tests.py, as by the individual scripts. To also save the
+salary analysis table and the job ads to label to S3, add -s3 True.
+"""
+from datetime import datetime
+from typing import List, Optional
+
+import pandas as pd
+import plac
+
+from dap_job_quality import BUCKET_NAME, PRINZ_BUCKET_NAME, logger
+from dap_job_quality.getters.data_getters import (
+    get_s3_parquet_columns,
+    load_s3_data,
+    save_to_s3,
+)
+from dap_job_quality.getters.ojo_getters import (
+    JOB_TITLE_SAMPLE_S3,
+    OJO_SAMPLE_S3,
+    get_ojo_sample,
+)
+from dap_job_quality.pipeline.keyword_search import (
+    INPUT_PATH,
+    OUTPUT_PATH,
+    find_keywords_in_dictionary,
+)
+from dap_job_quality.pipeline.prodigy.make_labelled_data import (
+    JOB_TITLE_STRATA,
+    KEYWORD_LOOKUP_PATH,
+    clean_descriptions,
+    get_strata_fn,
+    make_prodigy_tasks,
+    save_labelling_data,
+)
+from dap_job_quality.pipeline.salary.create_df_for_salary_analysis import (
+    LARGE_OJO_SAMPLE_S3,
+    LOCATION_MEASURES_S3,
+    OCC_MEASURES_S3,
+    SALARY_ANALYSIS_S3,
+    SALARY_MEASURES_S3,
+    merge_ojo_df,
+)
+from dap_job_quality.pipeline.salary.salary_internal_tests import (
+    SALARY_RULES_PATH,
+    VIOLATIONS_PATH,
+    applicable_rules,
+    evaluate_rules,
+    load_salary_rules,
+)
+from dap_job_quality.utils.chunk import map_chunks
+from dap_job_quality.utils.dag import Pipeline, Stage
+from dap_job_quality.utils.instrumentation import run_report
+from dap_job_quality.utils.sampling import stratified_hash_sample
+from dap_job_quality.utils.sentence_dictionary import (
+    SentenceDictionary,
+    build_sentence_dictionary,
+)
+from dap_job_quality.utils.text_cleaning import clean_text, cleaner_version
+
+
+# The stages whose outputs are saved, by default
+TARGETS = ["keyword_search", "labelling_sample", "salary_checks"]
+
+
+def s3_path(bucket_name: str, file_name: str) -> str:
+    return f"s3://{bucket_name}/{file_name}"
+
+
+def sentence_dictionary(ojo_sample: pd.DataFrame) -> SentenceDictionary:
+    """Clean and split the ojo sample into its unique sentences."""
+    return build_sentence_dictionary(ojo_sample)
+
+
+def keyword_search(sentence_dictionary: SentenceDictionary) -> pd.DataFrame:
+    """Search every sentence of the ojo sample for the keywords in INPUT_PATH."""
+    search_terms = (
+        pd.read_csv(INPUT_PATH).set_index("target_phrase").to_dict(orient="index")
+    )
+    return find_keywords_in_dictionary(sentence_dictionary, search_terms)
+
+
+def labelling_sample(
+    ojo_sample: pd.DataFrame,
+    train_size: int,
+    random_seed: int,
+    stratify_by: Optional[str],
+) -> pd.DataFrame:
+    """Sample job ads to label, as make_labelled_data.py does."""
+    sample = stratified_hash_sample(
+        [ojo_sample],
+        sample_size=train_size,
+        random_seed=random_seed,
+        strata_fn=get_strata_fn(stratify_by),
+    )
+    sample["clean_description"] = clean_descriptions(sample["description"])
+    return sample
+
+
+def ojo_occ() -> pd.DataFrame:
+    return load_s3_data(PRINZ_BUCKET_NAME, OCC_MEASURES_S3, columns=["job_id", "SOC"])
+
+
+def ojo_loc() -> pd.DataFrame:
+    return load_s3_data(
+        PRINZ_BUCKET_NAME,
+        LOCATION_MEASURES_S3,
+        columns=["id", "itl_1_code", "itl_1_name"],
+    )
+
+
+def ojo_sal() -> pd.DataFrame:
+    return load_s3_data(PRINZ_BUCKET_NAME, SALARY_MEASURES_S3)
+
+
+def ojo_large_sample() -> pd.DataFrame:
+    # every column except the job descriptions, which are not needed
+    return load_s3_data(
+        PRINZ_BUCKET_NAME,
+        LARGE_OJO_SAMPLE_S3,
+        columns=[
+            col
+            for col in get_s3_parquet_columns(PRINZ_BUCKET_NAME, LARGE_OJO_SAMPLE_S3)
+            if col != "description"
+        ],
+    )
+
+
+def salary_analysis(
+    ojo_large_sample: pd.DataFrame,
+    ojo_occ: pd.DataFrame,
+    ojo_loc: pd.DataFrame,
+    ojo_sal: pd.DataFrame,
+) -> pd.DataFrame:
+    return merge_ojo_df(ojo_large_sample, ojo_occ, ojo_loc, ojo_sal)
+
+
+def salary_checks(salary_analysis: pd.DataFrame) -> pd.DataFrame:
+    """Check the salary analysis table against the salary rules, as
+    salary_internal_tests.py does."""
+    rules = applicable_rules(load_salary_rules(), salary_analysis.columns)
+    return evaluate_rules(salary_analysis, rules)
+
+
+def make_stages(
+    train_size: int = 1000, random_seed: int = 42, stratify_by: Optional[str] = None
+) -> List[Stage]:
+    """Make the stages of the job quality workflow.
+
+    Args:
+        train_size (int, optional): number of job ads to label. Defaults to 1000.
+        random_seed (int, optional): random seed of the labelling sample. Defaults to 42.
+        stratify_by (Optional[str], optional): what to stratify the labelling
+            sample by, see make_labelled_data.get_strata_fn(). Defaults to None.
+
+    Returns:
+        List[Stage]: the stages
+    """
+    strata_files = []
+    if stratify_by == "dimension":
+        strata_files = [KEYWORD_LOOKUP_PATH]
+    elif stratify_by in JOB_TITLE_STRATA:
+        strata_files = [s3_path(PRINZ_BUCKET_NAME, JOB_TITLE_SAMPLE_S3)]
+
+    return [
+        Stage(
+            "ojo_sample",
+            get_ojo_sample,
+            files=[s3_path(PRINZ_BUCKET_NAME, OJO_SAMPLE_S3)],
+        ),
+        Stage(
+            "sentence_dictionary",
+            sentence_dictionary,
+            inputs=["ojo_sample"],
+            code=[build_sentence_dictionary, clean_text, map_chunks],
+            # the cleaning rules aren't functions, so are versioned separately
+            version=cleaner_version(),
+        ),
+        Stage(
+            "keyword_search",
+            keyword_search,
+            inputs=["sentence_dictionary"],
+            files=[INPUT_PATH],
+            code=[find_keywords_in_dictionary, SentenceDictionary, map_chunks],
+        ),
+        Stage(
+            "labelling_sample",
+            labelling_sample,
+            inputs=["ojo_sample"],
+            params={
+                "train_size": train_size,
+                "random_seed": random_seed,
+                "stratify_by": stratify_by,
+            },
+            files=strata_files,
+            code=[stratified_hash_sample, clean_descriptions, clean_text, map_chunks],
+            version=cleaner_version(),
+        ),
+        Stage(
+            "ojo_occ",
+            ojo_occ,
+            files=[s3_path(PRINZ_BUCKET_NAME, OCC_MEASURES_S3)],
+        ),
+        Stage(
+            "ojo_loc",
+            ojo_loc,
+            files=[s3_path(PRINZ_BUCKET_NAME, LOCATION_MEASURES_S3)],
+        ),
+        Stage(
+            "ojo_sal",
+            ojo_sal,
+            files=[s3_path(PRINZ_BUCKET_NAME, SALARY_MEASURES_S3)],
+        ),
+        Stage(
+            "ojo_large_sample",
+            ojo_large_sample,
+            files=[s3_path(PRINZ_BUCKET_NAME, LARGE_OJO_SAMPLE_S3)],
+        ),
+        Stage(
+            "salary_analysis",
+            salary_analysis,
+            inputs=["ojo_large_sample", "ojo_occ", "ojo_loc", "ojo_sal"],
+            code=[merge_ojo_df],
+        ),
+        Stage(
+            "salary_checks",
+            salary_checks,
+            inputs=["salary_analysis"],
+            files=[SALARY_RULES_PATH],
+            code=[evaluate_rules],
+        ),
+    ]
+
+
+def save_outputs(outputs: dict, train_size: int, random_seed: int, to_s3: bool):
+    """Save the outputs of the workflow where the individual scripts save them."""
+    if "keyword_search" in outputs:
+        OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+        outputs["keyword_search"].to_csv(OUTPUT_PATH)
+        logger.info(f"Keyword search results saved to {OUTPUT_PATH}")
+    if "labelling_sample" in outputs:
+        today_date = datetime.today().strftime("%Y%m%d")
+        save_labelling_data(
+            make_prodigy_tasks(outputs["labelling_sample"]),
+            f"{today_date}_ads_to_label_ts_{train_size}_random_seed_{random_seed}.jsonl",
+            to_s3=to_s3,
+        )
+    if "salary_analysis" in outputs and to_s3:
+        save_to_s3(BUCKET_NAME, outputs["salary_analysis"], SALARY_ANALYSIS_S3)
+    if "salary_checks" in outputs:
+        outputs["salary_checks"].to_parquet(VIOLATIONS_PATH, index=False)
+        logger.info(f"Salary rule violations saved to {VIOLATIONS_PATH}")
+
+
+@plac.annotations(
+    targets=("comma separated stages to run", "option", "t", str),
+    force=("comma separated stages to re-run even if cached", "option", "f", str),
+    dry_run=("only log which stages would be run", "option", "d", bool),
+    max_workers=("maximum number of stages run at once", "option", "w", int),
+    to_s3=("also save the outputs to s3", "option", "s3", bool),
+    train_size=("train_size", "option", "ts", int),
+    random_seed=("random_seed", "option", "rs", int),
+    stratify_by=("stratify_by", "option", "sb", str),
+)
+def main(
+    targets: str = "",
+    force: str = "",
+    dry_run: bool = False,
+    max_workers: int = 4,
+    to_s3: bool = False,
+    train_size: int = 1000,
+    random_seed: int = 42,
+    stratify_by: Optional[str] = None,
+):
+    pipeline = Pipeline(make_stages(train_size, random_seed, stratify_by))
+    target_names = [name for name in targets.split(",") if name] or TARGETS
+    if to_s3 and not targets:
+        target_names = target_names + ["salary_analysis"]
+    force_names = [name for name in force.split(",") if name]
+
+    if dry_run:
+        for name, runs in pipeline.plan(target_names, force_names).items():
+            logger.info(f"{name}: {'run' if runs else 'cached'}")
+        return
+
+    with run_report("pipeline"):
+        outputs = pipeline.run(target_names, force_names, max_workers=max_workers)
+        save_outputs(outputs, train_size, random_seed, to_s3)
+
+
+if __name__ == "__main__":
+    plac.call(main)
@@ -0,0 +1,438 @@
+"""This script precomputes the tables used to compare OJO salaries to the Annual Survey of Hours and Earnings (ASHE),
+so that Salary_comparison_ASHE.ipynb (and any dashboards) can query a small comparison cube instead of reloading
+and regrouping millions of job ads.
+
+It:
+    - parses ASHE tables 2 (SOC2), 3 (region by SOC2) and 14 (SOC4) once into a tidy table
+    - aggregates OJO salaries (count, mean and percentiles of the min, max and mean salary) per
+        SOC2/SOC4 x ITL1 x financial year, including totals across occupations and/or regions.
+        The salary table is streamed in chunks into mergeable quantile sketches (see utils/quantile_sketch.py),
+        so percentiles are estimated to within about 1.3% of their rank without sorting whole groups in memory
+    - joins the two into the comparison cube, comparing each OJO financial year to the ASHE tables of the same
+        year (ASHE's reference date is in April, so the tables published in 2023 are compared to 2023-24)
+
+The ASHE tables are downloaded from the ONS website and manually placed in the S3 bucket (see ashe_table_paths()),
+and the OJO salary table is created by create_df_for_salary_analysis.py.
+
+To run for the ASHE tables published in 2022 and 2023, run from the project root folder:
+
+python -m dap_job_quality.pipeline.salary.ashe_comparison_cube -y 2022,2023
+
+OJO financial years without ASHE tables have no ASHE statistics in the cube.
+
+The salary sketches are saved to S3, so a new drop of OJO job ads can be added to them without reprocessing
+the job ads that came before:
+
+python -m dap_job_quality.pipeline.salary.ashe_comparison_cube -y 2023 -u True -f <path to new salary table>
+"""
+from dap_job_quality import BUCKET_NAME, logger
+from dap_job_quality.getters.data_getters import (
+    load_s3_data,
+    load_s3_data_chunks,
+    load_s3_excel,
+    save_to_s3,
+)
+from dap_job_quality.pipeline.salary.create_df_for_salary_analysis import (
+    SALARY_ANALYSIS_S3,
+)
+from dap_job_quality.utils.quantile_sketch import GroupedQuantileSketches
+
+from nltk.metrics.distance import edit_distance
+import numpy as np
+import pandas as pd
+import plac
+from typing import Dict, List, Tuple
+
+ASHE_TIDY_S3 = "job_quality/ashe_data/{year}/ashe_tables_tidy.parquet"
+OJO_SALARY_SKETCHES_S3 = "job_quality/salary_analysis/ojo_salary_sketches.pkl"
+OJO_SALARY_AGGREGATES_S3 = "job_quality/salary_analysis/ojo_salary_aggregates.parquet"
+COMPARISON_CUBE_S3 = "job_quality/salary_analysis/ashe_comparison_cube.parquet"
+
+ALL = "All"
+SALARY_COLUMNS = ["min_annualised_salary", "max_annualised_salary", "mean_salary"]
+PERCENTILES = [10, 20, 25, 30, 40, 50, 60, 70, 75, 80, 90]
+ASHE_COLUMNS = [
+    "title",
+    "soc_code",
+    "number_of_jobs_thousands",
+    "median",
+    "median_annual_pct_change",
+    "mean",
+    "mean_annual_pct_change",
+    "p10",
+    "p20",
+    "p25",
+    "p30",
+    "p40",
+    "p60",
+    "p70",
+    "p75",
+    "p80",
+    "p90",
+]
+# The OJO groupings, and the ASHE table each one is compared to
+GROUPINGS = {
+    ("SOC_4digit", ALL): "14",
+    ("SOC_2digit", ALL): "2",
+    ("SOC_2digit", "itl_1_name"): "3",
+    (ALL, "itl_1_name"): "3",
+    (ALL, ALL): "2",
+}
+
+
+def ashe_table_paths(year: int) -> Dict[str, str]:
+    """Paths to the ASHE annual gross pay tables published in a given year.
+
+    Args:
+        year (int): year of publication
+
+    Returns:
+        Dict[str, str]: ASHE table number to S3 path
+    """
+    return {
+        "2": f"job_quality/ashe_data/{year}/PROV - Occupation SOC20 (2) Table 2.7a   Annual pay - Gross {year}.xls",
+        "3": f"job_quality/ashe_data/{year}/PROV - Work Region Occupation SOC20 (2) Table 3.7a   Annual pay - Gross {year}.xls",
+        "14": f"job_quality/ashe_data/{year}/PROV - Occupation SOC20 (4) Table 14.7a   Annual pay - Gross {year}.xls",
+    }
+
+
+def clean_ashe_table(df: pd.DataFrame) -> pd.DataFrame:
+    """Takes an ASHE excel sheet and returns a clean dataframe.
+    Note: This function is specific to the ASHE excel sheet format as of 2023, but will work across multiple tables (2, 3, 14)
+
+    Args:
+        df (pd.DataFrame): the "All" sheet of an ASHE table
+
+    Returns:
+        pd.DataFrame: one row per occupation (or region) with the ASHE_COLUMNS
+    """
+    # Remove the columns to the right of the last column where every value is NaN
+    nan_columns = df.columns[df.isna().all()]
+    if len(nan_columns):
+        df = df.drop(columns=df.columns[df.columns.get_loc(nan_columns[-1]) :])
+    df = df.iloc[:, : len(ASHE_COLUMNS)]
+    df.columns = ASHE_COLUMNS[: len(df.columns)]
+
+    # Drop header rows
+    df = df[df["title"].notna() & (df["title"] != "Description")]
+
+    # Replace 'x', ':' and '..' missing values with NaN
+    df = df.replace(["x", ":", ".."], np.nan)
+
+    # Drop rows where every value is nan
+    df = df.dropna(how="all", subset=[col for col in df.columns if col != "title"])
+
+    df = df.astype(
+        {col: float for col in df.columns if col not in ["title", "soc_code"]}
+    )
+    df["title"] = df["title"].astype(str).str.strip()
+    df["soc_code"] = df["soc_code"].astype(str).str.strip()
+    return df.reset_index(drop=True)
+
+
+def ashe_financial_year(year: int) -> str:
+    """The financial year whose OJO salaries are compared to the ASHE tables
+    published in a given year, as ASHE's reference date is in April.
+
+    Args:
+        year (int): year of publication
+
+    Returns:
+        str: financial year label, eg. "2023-24" for 2023
+    """
+    return f"{year}-{(year + 1) % 100:02d}"
+
+
+def tidy_ashe_tables(tables: Dict[str, pd.DataFrame], year: int) -> pd.DataFrame:
+    """Combine the cleaned ASHE tables into a single tidy table.
+
+    In table 3, region rows have a code with letters in it (eg. "E12000001") and
+    are followed by the occupation rows for that region.
+
+    Args:
+        tables (Dict[str, pd.DataFrame]): ASHE table number to cleaned table
+        year (int): year of publication
+
+    Returns:
+        pd.DataFrame: one row per table, region and occupation, with the year
+            and the financial year it is compared to
+    """
+    tidy_tables = []
+    for table, df in tables.items():
+        df = df.copy()
+        is_region = df["soc_code"].str.contains("[a-zA-Z]")
+        if table == "3":
+            df["region"] = df["title"].where(is_region).ffill().fillna(ALL)
+            df.loc[is_region, "soc_code"] = ALL
+        else:
+            df["region"] = ALL
+            df.loc[df["title"] == "All employees", "soc_code"] = ALL
+        df["soc_level"] = np.select(
+            [df["soc_code"] == ALL, df["soc_code"].str.len() <= 2],
+            [ALL, "SOC_2digit"],
+            "SOC_4digit",
+        )
+        df["table"] = table
+        df["year"] = year
+        df["financial_year"] = ashe_financial_year(year)
+        tidy_tables.append(df)
+    return pd.concat(tidy_tables, ignore_index=True)
+
+
+def financial_year(created: pd.Series) -> pd.Series:
+    """Label dates with the financial year (April to March) they fall in,
+    eg. "2022-23", which matches the ASHE reference periods.
+
+    Args:
+        created (pd.Series): dates
+
+    Returns:
+        pd.Series: categorical financial year labels
+    """
+    created = pd.to_datetime(created, errors="coerce")
+    start_year = created.dt.year - (created.dt.month < 4)
+    labels = (
+        start_year.astype("Int64").astype("string")
+        + "-"
+        + ((start_year + 1) % 100).astype("Int64").astype("string").str.zfill(2)
+    )
+    return labels.astype("category")
+
+
+def group_columns(soc_col: str, region_col: str) -> List[str]:
+    """Columns to group the OJO salaries by for one grouping in GROUPINGS."""
+    return ["financial_year"] + [col for col in [soc_col, region_col] if col != ALL]
+
+
+def salary_sketches(k: int = 200) -> Dict[Tuple[str, str], GroupedQuantileSketches]:
+    """Create empty salary sketches for every grouping in GROUPINGS.
+
+    Args:
+        k (int, optional): size parameter of the sketches. Defaults to 200, for
+            percentiles within about 1.3% of the true rank.
+
+    Returns:
+        Dict[Tuple[str, str], GroupedQuantileSketches]: grouping to sketches
+    """
+    return {
+        (soc_col, region_col): GroupedQuantileSketches(
+            group_columns(soc_col, region_col), SALARY_COLUMNS, k=k, seed=42
+        )
+        for soc_col, region_col in GROUPINGS
+    }
+
+
+def update_salary_sketches(
+    sketches: Dict[Tuple[str, str], GroupedQuantileSketches], chunk: pd.DataFrame
+) -> Dict[Tuple[str, str], GroupedQuantileSketches]:
+    """Add a chunk of the OJO salary table to the salary sketches.
+
+    Args:
+        sketches (Dict[Tuple[str, str], GroupedQuantileSketches]): output of salary_sketches()
+        chunk (pd.DataFrame): chunk of the OJO salary table from create_df_for_salary_analysis.py
+
+    Returns:
+        Dict[Tuple[str, str], GroupedQuantileSketches]: the updated sketches
+    """
+    chunk = chunk.assign(financial_year=financial_year(chunk["created"]))
+    for grouping_sketches in sketches.values():
+        grouping_sketches.update(chunk)
+    return sketches
+
+
+def aggregate_ojo_salaries(
+    sketches: Dict[Tuple[str, str], GroupedQuantileSketches]
+) -> pd.DataFrame:
+    """Summarise the salary sketches of every grouping in GROUPINGS.
+
+    Args:
+        sketches (Dict[Tuple[str, str], GroupedQuantileSketches]): salary sketches
+
+    Returns:
+        pd.DataFrame: count, mean and percentiles of each salary column per
+            financial year, soc level, soc code and region
+    """
+    aggregates = []
+    for (soc_col, region_col), grouping_sketches in sketches.items():
+        grouping_aggregates = grouping_sketches.to_frame(PERCENTILES).rename(
+            columns={soc_col: "soc_code", region_col: "region"}
+        )
+        if soc_col == ALL:
+            grouping_aggregates["soc_code"] = ALL
+        if region_col == ALL:
+            grouping_aggregates["region"] = ALL
+        grouping_aggregates["soc_level"] = soc_col
+        aggregates.append(grouping_aggregates)
+    aggregates = pd.concat(aggregates, ignore_index=True)
+    aggregates["soc_code"] = aggregates["soc_code"].astype(str)
+    aggregates["region"] = aggregates["region"].astype(str)
+    aggregates["financial_year"] = aggregates["financial_year"].astype(str)
+    return aggregates
+
+
+def normalise_region_name(name: str) -> str:
+    """Normalise region names, which differ slightly between ASHE and OJO."""
+    return name.replace("(England)", "").strip().lower()
+
+
+def match_regions(ashe_regions: List[str], ojo_regions: List[str]) -> Dict[str, str]:
+    """Match OJO ITL1 region names to the closest ASHE region name.
+
+    Args:
+        ashe_regions (List[str]): ASHE region names
+        ojo_regions (List[str]): OJO ITL1 region names
+
+    Returns:
+        Dict[str, str]: OJO region name to ASHE region name
+    """
+    ashe_by_name = {normalise_region_name(region): region for region in ashe_regions}
+    matches = {ALL: ALL}
+    for region in ojo_regions:
+        if region == ALL:
+            continue
+        name = normalise_region_name(region)
+        best_match = min(ashe_by_name, key=lambda x: edit_distance(name, x))
+        matches[region] = ashe_by_name[best_match]
+    return matches
+
+
+def build_comparison_cube(
+    ojo_aggregates: pd.DataFrame, ashe: pd.DataFrame
+) -> pd.DataFrame:
+    """Join the OJO salary aggregates to the ASHE table each grouping compares to,
+    of the same financial year. OJO financial years without ASHE tables have no
+    ASHE statistics.
+
+    Args:
+        ojo_aggregates (pd.DataFrame): output of aggregate_ojo_salaries()
+        ashe (pd.DataFrame): output of tidy_ashe_tables(), for one or more years
+
+    Returns:
+        pd.DataFrame: OJO aggregates with the ASHE statistics (prefixed "ashe_")
+    """
+    table_for_grouping = {
+        (soc_col, region_col): table
+        for (soc_col, region_col), table in GROUPINGS.items()
+    }
+    ojo_aggregates = ojo_aggregates.copy()
+    ojo_aggregates["table"] = [
+        table_for_grouping[(soc_level, ALL if region == ALL else "itl_1_name")]
+        for soc_level, region in zip(
+            ojo_aggregates["soc_level"], ojo_aggregates["region"]
+        )
+    ]
+    region_matches = match_regions(
+        ashe.loc[ashe["region"] != ALL, "region"].unique().tolist(),
+        ojo_aggregates["region"].unique().tolist(),
+    )
+    ojo_aggregates["ashe_region"] = ojo_aggregates["region"].map(region_matches)
+
+    ashe = ashe.drop(columns=["soc_level"]).rename(
+        columns={
+            col: f"ashe_{col}"
+            for col in ashe.columns
+            if col not in ["financial_year", "table", "soc_code", "region"]
+        }
+    )
+    unmatched_years = set(ojo_aggregates["financial_year"]) - set(
+        ashe["financial_year"]
+    )
+    if unmatched_years:
+        logger.warning(
+            f"No ASHE tables for the financial years {sorted(unmatched_years)}"
+        )
+    return ojo_aggregates.merge(
+        ashe.rename(columns={"region": "ashe_region"}),
+        on=["financial_year", "table", "soc_code", "ashe_region"],
+        how="left",
+    )
+
+
+def get_comparison_cube() -> pd.DataFrame:
+    """Gets the precomputed OJO and ASHE salary comparison cube from s3.
+
+    Returns:
+        pd.DataFrame: one row per financial year, soc level, soc code and ITL1
+            region (or ALL), with OJO salary aggregates and the ASHE statistics
+    """
+    return load_s3_data(BUCKET_NAME, COMPARISON_CUBE_S3)
+
+
+@plac.annotations(
+    years_of_publication=(
+        "comma separated years the ASHE tables were published",
+        "option",
+        "y",
+        str,
+    ),
+    salary_file=("OJO salary table in the bucket", "option", "f", str),
+    update=("add the salary table to the saved sketches", "option", "u", bool),
+    chunk_size=("chunk_size", "option", "cs", int),
+)
+def make_comparison_cube(
+    years_of_publication: str = "2023",
+    salary_file: str = SALARY_ANALYSIS_S3,
+    update: bool = False,
+    chunk_size: int = 1000000,
+) -> pd.DataFrame:
+    """Parse the ASHE tables, aggregate the OJO salaries and save the
+    comparison cube to s3.
+
+    Args:
+        years_of_publication (str, optional): comma separated years the ASHE
+            tables were published, each compared to the OJO salaries of the
+            financial year starting in April of that year. Defaults to "2023".
+        salary_file (str, optional): path to the OJO salary table in the bucket.
+            Defaults to SALARY_ANALYSIS_S3.
+        update (bool, optional): whether to merge the salary table into the
+            saved salary sketches (eg. for a new monthly drop of job ads) rather
+            than replace them. Defaults to False.
+        chunk_size (int, optional): number of job ads read at a time.
+            Defaults to 1000000.
+
+    Returns:
+        pd.DataFrame: the comparison cube
+    """
+    tidy_tables = []
+    for year in [int(year) for year in str(years_of_publication).split(",")]:
+        logger.info(f"Parsing ASHE tables published in {year}")
+        tidy_table = tidy_ashe_tables(
+            {
+                table: clean_ashe_table(
+                    load_s3_excel(BUCKET_NAME, path, sheet_name="All")
+                )
+                for table, path in ashe_table_paths(year).items()
+            },
+            year,
+        )
+        save_to_s3(BUCKET_NAME, tidy_table, ASHE_TIDY_S3.format(year=year))
+        tidy_tables.append(tidy_table)
+    ashe = pd.concat(tidy_tables, ignore_index=True)
+
+    logger.info("Aggregating OJO salaries")
+    sketches = salary_sketches()
+    for chunk in load_s3_data_chunks(
+        BUCKET_NAME,
+        salary_file,
+        chunksize=chunk_size,
+        columns=["created", "itl_1_name", "SOC_2digit", "SOC_4digit"] + SALARY_COLUMNS,
+    ):
+        update_salary_sketches(sketches, chunk)
+    if update:
+        # merge the new job ads into the sketches of the job ads processed before
+        previous_sketches = load_s3_data(BUCKET_NAME, OJO_SALARY_SKETCHES_S3)
+        for grouping, grouping_sketches in sketches.items():
+            previous_sketches[grouping].merge(grouping_sketches)
+        sketches = previous_sketches
+    save_to_s3(BUCKET_NAME, sketches, OJO_SALARY_SKETCHES_S3)
+
+    ojo_aggregates = aggregate_ojo_salaries(sketches)
+    save_to_s3(BUCKET_NAME, ojo_aggregates, OJO_SALARY_AGGREGATES_S3)
+
+    cube = build_comparison_cube(ojo_aggregates, ashe)
+    save_to_s3(BUCKET_NAME, cube, COMPARISON_CUBE_S3)
+    return cube
+
+
+if __name__ == "__main__":
+    plac.call(make_comparison_cube)
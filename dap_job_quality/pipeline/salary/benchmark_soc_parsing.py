@@ -0,0 +1,66 @@
+"""
+This script benchmarks the vectorised SOC code extraction used in create_df_for_salary_analysis.py
+against the previous row-wise implementation (which ran eval() on every row), on a synthetic SOC column.
+
+To run, from the root folder:
+
+python -m dap_job_quality.pipeline.salary.benchmark_soc_parsing
+"""
+from dap_job_quality import logger
+from dap_job_quality.pipeline.salary.create_df_for_salary_analysis import (
+    extract_soc_codes,
+)
+from dap_job_quality.utils.synthetic_ojo import make_soc_strings
+
+import numpy as np
+import pandas as pd
+import time
+
+N_ROWS = [10000, 100000, 1000000]
+
+
+def extract_soc_codes_rowwise(soc: pd.Series) -> pd.DataFrame:
+    """The previous row-wise SOC code extraction, kept as a baseline."""
+    soc_clean = soc.fillna("None")
+    soc_clean = soc_clean.apply(lambda x: x.replace("nan", "None"))
+    soc_clean = soc_clean.apply(lambda x: eval(x) if isinstance(x, str) else x)
+    soc_4digit = soc_clean.apply(
+        lambda x: x.get("SOC_2020") if isinstance(x, dict) else x
+    )
+    soc_2digit = soc_4digit.apply(lambda x: x[0:2] if isinstance(x, str) else x)
+    return pd.DataFrame({"SOC_4digit": soc_4digit, "SOC_2digit": soc_2digit})
+
+
+def make_soc_column(n_rows: int, missing_share: float = 0.1, seed: int = 42):
+    """Make a synthetic SOC column of serialised dicts, like the OJO occupation measures."""
+    return make_soc_strings(n_rows, np.random.default_rng(seed), missing_share)
+
+
+def benchmark_soc_parsing(n_rows: int) -> dict:
+    """Time both implementations on n_rows and check they agree."""
+    soc = make_soc_column(n_rows)
+
+    t0 = time.perf_counter()
+    rowwise = extract_soc_codes_rowwise(soc)
+    rowwise_seconds = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    vectorised = extract_soc_codes(soc)
+    vectorised_seconds = time.perf_counter() - t0
+
+    matches = (
+        rowwise["SOC_4digit"].astype("string").fillna("")
+        == vectorised["SOC_4digit"].astype("string").fillna("")
+    ).all()
+    return {
+        "n_rows": n_rows,
+        "rowwise_seconds": round(rowwise_seconds, 3),
+        "vectorised_seconds": round(vectorised_seconds, 3),
+        "speedup": round(rowwise_seconds / vectorised_seconds, 1),
+        "results_match": bool(matches),
+    }
+
+
+if __name__ == "__main__":
+    results = pd.DataFrame([benchmark_soc_parsing(n_rows) for n_rows in N_ROWS])
+    logger.info(f"SOC parsing benchmark:\n{results.to_string(index=False)}")
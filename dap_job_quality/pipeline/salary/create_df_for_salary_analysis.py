@@ -1,18 +1,39 @@
 """This script merges the fields required from different OJO tables for the salary analysis undertaken in salary_external_tests.py.
 
-The final table is saved in 'job_quality/salary_analysis/salary_analysis_df.csv'
+The final table is saved in 'job_quality/salary_analysis/salary_analysis_df.parquet'
 
-A warning that the data download takes some time, so will likely take ~30 mins to complete.
+A warning that the data download takes some time. Only the columns needed are downloaded, and the wall
+time and peak memory of loading and merging are logged and saved in a run report in outputs/reports/runs/
+(see utils/instrumentation.py).
 
 To run this file, run from the project root folder:
 
-python -m dap_job_quality.utils.create_df_for_salary_analysis
+python -m dap_job_quality.pipeline.salary.create_df_for_salary_analysis
+
+To only merge the months (of the job ads' created date) with new or changed job ads since the last run, run:
+
+python -m dap_job_quality.pipeline.salary.create_df_for_salary_analysis -i True
 
     """
 
 from dap_job_quality import BUCKET_NAME, PRINZ_BUCKET_NAME, logger
-from dap_job_quality.getters.data_getters import load_s3_data, load_s3_excel, save_to_s3
+from dap_job_quality.getters.data_getters import (
+    get_s3_parquet_columns,
+    load_s3_data,
+    load_s3_excel,
+    save_to_s3,
+)
+from dap_job_quality.utils.incremental import (
+    date_partitions,
+    hash_dataframe,
+    hash_object,
+    load_partitions,
+    run_incremental,
+)
+from dap_job_quality.utils.instrumentation import increment, run_report, stage
 import pandas as pd
+import plac
+from typing import Dict, List, Optional
 
 
 # Current OJO data paths
@@ -27,7 +48,107 @@ SALARY_MEASURES_S3 = (
     "outputs/data/ojo_application/deduplicated_sample/all_salaries_data_sample.parquet"
 )
 
+# Output path
+SALARY_ANALYSIS_S3 = "job_quality/salary_analysis/salary_analysis_df.parquet"
+SALARY_PARTITIONS_S3 = f"s3://{BUCKET_NAME}/job_quality/salary_analysis/partitions"
+
+
+# Matches the SOC_2020 code in the serialised SOC dicts,
+# eg. "{'SOC_2020_EXT': '2136/99', 'SOC_2020': '2136', 'SOC_2010': '2136', 'name': ...}"
+soc_2020_pattern = r"""['"]SOC_2020['"]\s*:\s*['"]?(\d+)"""
+
+
+def extract_soc_codes(soc: pd.Series) -> pd.DataFrame:
+    """Extract the SOC 2020 4 digit and 2 digit codes from the SOC column, which
+    holds either serialised dicts (when read from csv) or dicts (when read from
+    a structured parquet column).
+
+    Args:
+        soc (pd.Series): SOC column of the OJO occupation measures
+
+    Returns:
+        pd.DataFrame: categorical SOC_4digit and SOC_2digit columns, missing
+            where there is no SOC 2020 code
+    """
+    soc = soc.astype(object)
+    soc_4digit = soc.str.extract(soc_2020_pattern, expand=False)
+    is_dict = soc.map(type) == dict
+    if is_dict.any():
+        soc_4digit[is_dict] = soc[is_dict].str.get("SOC_2020")
+    soc_4digit = soc_4digit.astype("string")
+    return pd.DataFrame(
+        {
+            "SOC_4digit": soc_4digit.astype("category"),
+            "SOC_2digit": soc_4digit.str[0:2].astype("category"),
+        },
+        index=soc.index,
+    )
+
+
+def to_join_keys(*keys: pd.Series) -> List[pd.Series]:
+    """Convert id columns to a common key type for joining: int64 if every id
+    column is numeric (integers hash and compare much faster than strings),
+    otherwise strings.
+
+    Args:
+        *keys (pd.Series): id columns to join on
 
+    Returns:
+        List[pd.Series]: the id columns as join keys
+    """
+    if all(pd.api.types.is_numeric_dtype(key) for key in keys):
+        return [key.astype("Int64") for key in keys]
+    return [
+        key.astype("Int64").astype("string")
+        if pd.api.types.is_numeric_dtype(key)
+        else key.astype("string")
+        for key in keys
+    ]
+
+
+def lookup_columns(
+    keys: pd.Series,
+    table: pd.DataFrame,
+    table_keys: pd.Series,
+    columns: List[str],
+    categorical_columns: Optional[List[str]] = None,
+) -> Dict[str, pd.Series]:
+    """Left join columns of a table onto keys, without copying either frame:
+    the table keys are hashed once and each column is gathered with a single
+    take().
+
+    Args:
+        keys (pd.Series): keys to join onto
+        table (pd.DataFrame): table with the columns to join
+        table_keys (pd.Series): key of each row of the table
+        columns (List[str]): columns of the table to join
+        categorical_columns (Optional[List[str]], optional): columns to store as
+            categoricals. Defaults to None.
+
+    Returns:
+        Dict[str, pd.Series]: the joined columns, aligned with keys
+    """
+    is_duplicated = table_keys.duplicated().to_numpy()
+    if is_duplicated.any():
+        logger.warning(
+            f"Dropping {is_duplicated.sum()} rows with duplicated ids before joining {columns}"
+        )
+    table_index = pd.Index(table_keys[~is_duplicated])
+    positions = table_index.get_indexer(keys)
+    categorical_columns = categorical_columns or []
+
+    joined = {}
+    for col in columns:
+        values = table[col][~is_duplicated]
+        if col in categorical_columns:
+            values = values.astype("category")
+        joined[col] = pd.Series(
+            values.array.take(positions, allow_fill=True), index=keys.index, name=col
+        )
+    return joined
+
+
+@stage("merge_ojo_df", log=False)
 def merge_ojo_df(
     ojo_df: pd.DataFrame,
     ojo_occ: pd.DataFrame,
@@ -37,38 +158,49 @@ def merge_ojo_df(
 ) -> pd.DataFrame:
     """Takes de-duplicated OJO data and returns a dataframe with the relevant data
     (ITL1 codes, SOC2 and SOC4 codes, salary min, salary max, salary mean, and job title)
+
+    The location, occupation and salary tables are joined onto the job ad ids in a
+    single pass, using integer keys where possible and categorical ITL and SOC columns.
     """
+    increment("merge_ojo_df.rows_in", len(ojo_df))
+    ojo_keys, loc_keys, occ_keys, sal_keys = to_join_keys(
+        ojo_df["id"], ojo_loc["id"], ojo_occ["job_id"], ojo_sal["id"]
+    )
+    ojo_keys = ojo_keys.reset_index(drop=True)
+    columns = {col: ojo_df[col].reset_index(drop=True) for col in ojo_df.columns}
 
-    # Merge dataframes
-    ojo_df = ojo_df.merge(
-        ojo_loc[["id", "itl_1_code", "itl_1_name"]], on="id", how="left"
-    )  # Get ITL1 code and name
-    ojo_df = ojo_df.merge(
-        ojo_occ[["job_id", "SOC"]], left_on="id", right_on="job_id", how="left"
-    ).drop(
-        columns="job_id"
-    )  # Get raw SOC level 4 mapping
-    ojo_df = ojo_df.merge(
-        ojo_sal, on="id", how="left"
-    )  # Min and max annualised salaries
+    # Get ITL1 code and name
+    columns.update(
+        lookup_columns(
+            ojo_keys,
+            ojo_loc,
+            loc_keys,
+            ["itl_1_code", "itl_1_name"],
+            categorical_columns=["itl_1_code", "itl_1_name"],
+        )
+    )
+    # Get raw SOC level 4 mapping
+    columns.update(lookup_columns(ojo_keys, ojo_occ, occ_keys, ["SOC"]))
+    # Min and max annualised salaries
+    columns.update(
+        lookup_columns(
+            ojo_keys,
+            ojo_sal,
+            sal_keys,
+            [col for col in ojo_sal.columns if col not in columns],
+        )
+    )
+    ojo_df = pd.DataFrame(columns, copy=False)
 
     # Get mean salaries
     ojo_df["mean_salary"] = ojo_df[
         ["min_annualised_salary", "max_annualised_salary"]
     ].mean(axis=1)
 
-    # Get SOC 4 digit codes in single column
-    ojo_df["SOC_clean"] = ojo_df["SOC"].fillna("None")
-    ojo_df["SOC_clean"] = ojo_df["SOC_clean"].apply(lambda x: x.replace("nan", "None"))
-    ojo_df["SOC_clean"] = ojo_df["SOC_clean"].apply(
-        lambda x: eval(x) if isinstance(x, str) else x
-    )
-    ojo_df["SOC_4digit"] = ojo_df["SOC_clean"].apply(
-        lambda x: x.get("SOC_2020") if isinstance(x, dict) else x
-    )
-    ojo_df["SOC_2digit"] = ojo_df["SOC_4digit"].apply(
-        lambda x: x[0:2] if isinstance(x, str) else x
-    )
+    # Get SOC 4 and 2 digit codes in single columns
+    soc_codes = extract_soc_codes(ojo_df["SOC"])
+    ojo_df["SOC_4digit"] = soc_codes["SOC_4digit"]
+    ojo_df["SOC_2digit"] = soc_codes["SOC_2digit"]
 
     # Check all values have carried over from the SOC extraction
     soc_columns = [col for col in ojo_df.columns if "SOC" in col]
@@ -82,22 +214,139 @@ def merge_ojo_df(
     else:
         logger.info("Some additional missing values - check if SOC extracted correctly")
 
+    increment("merge_ojo_df.rows_out", len(ojo_df))
     if save_file == True:
-        save_to_s3(
-            BUCKET_NAME, ojo_df, "job_quality/salary_analysis/salary_analysis_df.csv"
+        save_to_s3(BUCKET_NAME, ojo_df, SALARY_ANALYSIS_S3)
+        logger.info(f"File saved to {BUCKET_NAME}/{SALARY_ANALYSIS_S3}")
+
+    return ojo_df
+
+
+def merge_ojo_df_incremental(
+    ojo_df: pd.DataFrame,
+    ojo_occ: pd.DataFrame,
+    ojo_loc: pd.DataFrame,
+    ojo_sal: pd.DataFrame,
+    output_dir: str = SALARY_PARTITIONS_S3,
+    freq: str = "M",
+) -> pd.DataFrame:
+    """Merge the OJO tables one month (of the job ads' created date) at a time,
+    only re-merging the months whose job ads, or whose occupation, location or
+    salary rows, are new or have changed since the last run.
+
+    Args:
+        ojo_df (pd.DataFrame): de-duplicated OJO job ads, with a created column
+        ojo_occ (pd.DataFrame): OJO occupation measures
+        ojo_loc (pd.DataFrame): OJO location measures
+        ojo_sal (pd.DataFrame): OJO salary measures
+        output_dir (str, optional): where the merged months and their manifest
+            are saved. Defaults to SALARY_PARTITIONS_S3.
+        freq (str, optional): pandas period frequency of the partitions.
+            Defaults to "M".
+
+    Returns:
+        pd.DataFrame: the merged table, as returned by merge_ojo_df()
+    """
+    partitions = date_partitions(ojo_df["created"], freq)
+    ojo_keys, loc_keys, occ_keys, sal_keys = to_join_keys(
+        ojo_df["id"], ojo_loc["id"], ojo_occ["job_id"], ojo_sal["id"]
+    )
+    # Split the occupation, location and salary rows by the partition of their job ad
+    partition_of = pd.Series(partitions.to_numpy(), index=pd.Index(ojo_keys))
+    partition_of = partition_of[~partition_of.index.duplicated()]
+    lookups = {}
+    for name, table, table_keys in [
+        ("occ", ojo_occ, occ_keys),
+        ("loc", ojo_loc, loc_keys),
+        ("sal", ojo_sal, sal_keys),
+    ]:
+        table_partitions = partition_of.reindex(table_keys.to_numpy()).to_numpy()
+        lookups[name] = {
+            partition: partition_table
+            for partition, partition_table in table.groupby(
+                table_partitions, sort=False
+            )
+        }
+        lookups[name][None] = table.iloc[0:0]
+
+    def partition_lookups(partition_df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+        partition = date_partitions(partition_df["created"].iloc[:1], freq).iloc[0]
+        return {
+            name: tables.get(partition, tables[None])
+            for name, tables in lookups.items()
+        }
+
+    def hash_partition(partition_df: pd.DataFrame) -> str:
+        return hash_object(
+            [hash_dataframe(partition_df)]
+            + [
+                hash_dataframe(table)
+                for table in partition_lookups(partition_df).values()
+            ]
         )
-        logger.info(
-            f"File saved to {BUCKET_NAME}/job_quality/salary_analysis/salary_analysis_df.csv"
+
+    def merge_partition(partition_df: pd.DataFrame) -> pd.DataFrame:
+        tables = partition_lookups(partition_df)
+        return merge_ojo_df(partition_df, tables["occ"], tables["loc"], tables["sal"])
+
+    run_incremental(
+        ojo_df,
+        merge_partition,
+        output_dir,
+        stage="salary_analysis_merge",
+        freq=freq,
+        hash_fn=hash_partition,
+    )
+    if ojo_df.empty:
+        # no partitions to load, so merge the empty tables for the merged columns
+        return merge_ojo_df(
+            ojo_df, ojo_occ.iloc[0:0], ojo_loc.iloc[0:0], ojo_sal.iloc[0:0]
         )
+    return load_partitions(output_dir)
 
-    return ojo_df
 
+@plac.annotations(
+    incremental=(
+        "only merge the months with new or changed job ads",
+        "option",
+        "i",
+        bool,
+    ),
+)
+def main(incremental: bool = False):
+    with run_report("create_df_for_salary_analysis"):
+        with stage("Loading data"):
+            ojo_occ = load_s3_data(
+                PRINZ_BUCKET_NAME, OCC_MEASURES_S3, columns=["job_id", "SOC"]
+            )
+            ojo_loc = load_s3_data(
+                PRINZ_BUCKET_NAME,
+                LOCATION_MEASURES_S3,
+                columns=["id", "itl_1_code", "itl_1_name"],
+            )
+            ojo_sal = load_s3_data(PRINZ_BUCKET_NAME, SALARY_MEASURES_S3)
+            # Load every column except the job descriptions, which are not needed
+            ojo_df = load_s3_data(
+                PRINZ_BUCKET_NAME,
+                LARGE_OJO_SAMPLE_S3,
+                columns=[
+                    col
+                    for col in get_s3_parquet_columns(
+                        PRINZ_BUCKET_NAME, LARGE_OJO_SAMPLE_S3
+                    )
+                    if col != "description"
+                ],
+            )
+
+        with stage("Merging data"):
+            if incremental:
+                clean_df = merge_ojo_df_incremental(ojo_df, ojo_occ, ojo_loc, ojo_sal)
+                save_to_s3(BUCKET_NAME, clean_df, SALARY_ANALYSIS_S3)
+            else:
+                clean_df = merge_ojo_df(
+                    ojo_df, ojo_occ, ojo_loc, ojo_sal, save_file=True
+                )
 
-if __name__ == "__main__":
-    ojo_occ = load_s3_data(PRINZ_BUCKET_NAME, OCC_MEASURES_S3)
-    ojo_loc = load_s3_data(PRINZ_BUCKET_NAME, LOCATION_MEASURES_S3)
-    ojo_sal = load_s3_data(PRINZ_BUCKET_NAME, SALARY_MEASURES_S3)
-    ojo_df = load_s3_data(PRINZ_BUCKET_NAME, LARGE_OJO_SAMPLE_S3)
-    ojo_df.drop(columns=["description"], inplace=True)
 
-    clean_df = merge_ojo_df(ojo_df, ojo_occ, ojo_loc, ojo_sal, save_file=True)
+if __name__ == "__main__":
+    plac.call(main)
@@ -1,91 +1,280 @@
 """"
 This script takes the most recent salary data and runs some basic checks, to ensure the rules applied in the cleaning process are working as expected.
 
-To run, update the salary_measures_s3 variable to the most recent salary data file, then from the root folder, run:
+The checks are the rules in dap_job_quality/config/salary_rules.yaml, so to add a check, add a rule there.
+The salary table is streamed in chunks (eg. parquet row groups), all rules are evaluated in a single vectorised pass
+over each chunk, and the job ads that fail a rule are exported as a table of (id, rule) violations.
 
-python -m dap_job_quality.pipeline.salary.salary_internal_tests"""
+To run, update the SALARY_MEASURES_S3 variable to the most recent salary data file, then from the root folder, run:
 
+python -m dap_job_quality.pipeline.salary.salary_internal_tests
 
-from dap_job_quality import PRINZ_BUCKET_NAME, PROJECT_DIR, logger
-from dap_job_quality.getters.data_getters import load_s3_data
+To also run the rules that need SOC codes (eg. salary outliers within occupations), check the salary analysis
+table created by create_df_for_salary_analysis.py:
+
+python -m dap_job_quality.pipeline.salary.salary_internal_tests -b open-jobs-lake -f job_quality/salary_analysis/salary_analysis_df.parquet"""
+
+
+from dap_job_quality import PRINZ_BUCKET_NAME, PROJECT_DIR, get_yaml_config, logger
+from dap_job_quality.getters.data_getters import (
+    get_s3_parquet_columns,
+    load_s3_data,
+    load_s3_data_chunks,
+)
+
+from dap_job_quality.utils.chunk import map_chunks
+
+from fnmatch import fnmatch
+from functools import partial
+from pathlib import Path
+import plac
+import re
+from typing import Dict, Iterable, Optional, Set, Tuple
 
 import pandas as pd
-import unittest
-import json
 
 
-salary_measures_s3 = (
+SALARY_MEASURES_S3 = (
     "outputs/data/ojo_application/deduplicated_sample/all_salaries_data_sample.parquet"
 )
+SALARY_RULES_PATH = Path(__file__).parents[2] / "config/salary_rules.yaml"
+VIOLATIONS_PATH = (
+    PROJECT_DIR
+    / "dap_job_quality/pipeline/salary/salary_internal_tests_violations.parquet"
+)
 
-ojo_sal = load_s3_data(PRINZ_BUCKET_NAME, salary_measures_s3)
+compiled_identifier_pattern = re.compile(r"[A-Za-z_]\w*")
+# numbers such as 500000, 0.5, 1e6 and 1_000, whose exponents aren't columns
+compiled_number_pattern = re.compile(
+    r"(?<![\w.])(?:\d[\d_]*\.?\d*|\.\d+)(?:[eE][+-]?\d+)?"
+)
+expression_keywords = {"and", "or", "not", "in", "True", "False"}
 
 
-class TestSalary:
-    def __init__(self, df):
-        self.error_dict = {}
-        self.export_path = f"{PROJECT_DIR}/dap_job_quality/pipeline/salary/salary_internal_tests_log.json"
-        self.df = df
-        self.logger = logger
+def load_salary_rules(file_path: Path = SALARY_RULES_PATH) -> Dict[str, dict]:
+    """Load the salary rules config.
 
-    def test_min_less_max_salaries(self):
-        logger.info("Checking that min salary < max salary for all records")
-        self.df["sal_diff"] = (
-            self.df["max_annualised_salary"] - self.df["min_annualised_salary"]
-        )
-        self.df["sal_diff"].fillna(0, inplace=True)
+    Args:
+        file_path (Path, optional): path to the rules config.
+            Defaults to SALARY_RULES_PATH.
 
-        if self.df["sal_diff"].min() >= 0:
-            "Minimum salary less than or equal to maximum salary",
-            logger.info("Test passed")
-        else:
-            self.error_dict["min_less_max_salaries"] = self.df[self.df["sal_diff"] < 0][
-                "id"
-            ].to_list()
-            logger.info(
-                f"Test failed - list of ids where test failed has been exported to file at {self.export_path}"
-            )
+    Returns:
+        Dict[str, dict]: rule name to rule config
+    """
+    return get_yaml_config(file_path)["rules"]
 
-    def test_max_salary_500k(self):
-        logger.info("Checking that all salaries are <= £500k GBP")
 
-        if self.df["max_annualised_salary"].max() <= 500000:
-            logger.info("Test passed")
+def rule_columns(rule: dict) -> Set[str]:
+    """Get the columns a rule needs.
+
+    Args:
+        rule (dict): rule config
+
+    Returns:
+        Set[str]: column names
+    """
+    if rule.get("type") == "group_outlier":
+        return {rule["column"], rule["by"]}
+    expression = compiled_number_pattern.sub(" ", rule["fail_if"])
+    return set(compiled_identifier_pattern.findall(expression)) - expression_keywords
+
+
+def applicable_rules(rules: Dict[str, dict], columns: Iterable[str]) -> Dict[str, dict]:
+    """Keep the rules that only need the given columns, logging the ones skipped.
+
+    Args:
+        rules (Dict[str, dict]): rule name to rule config
+        columns (Iterable[str]): columns of the salary table
+
+    Returns:
+        Dict[str, dict]: the rules that can be checked
+    """
+    columns = set(columns)
+    kept = {}
+    for name, rule in rules.items():
+        missing_columns = rule_columns(rule) - columns
+        if missing_columns:
+            logger.warning(f"Skipping rule {name} - missing columns {missing_columns}")
         else:
-            self.error_dict["max_salary_500k"] = self.df[
-                self.df["max_annualised_salary"] > 500000
-            ]["id"].to_list()
-            logger.info(
-                f"Test failed - list of ids where test failed has been exported to file at {self.export_path}"
+            kept[name] = rule
+    return kept
+
+
+def group_outlier_bounds(df: pd.DataFrame, rule: dict) -> pd.DataFrame:
+    """Get the per group bounds outside of which values are outliers.
+
+    Args:
+        df (pd.DataFrame): table with the rule's column and by columns
+        rule (dict): group outlier rule config
+
+    Returns:
+        pd.DataFrame: lower and upper bounds indexed by group
+    """
+    grouped = df.groupby(rule["by"], observed=True)[rule["column"]]
+    quartiles = grouped.quantile([0.25, 0.75]).unstack()
+    iqr = quartiles[0.75] - quartiles[0.25]
+    multiplier = rule.get("iqr_multiplier", 3)
+    bounds = pd.DataFrame(
+        {
+            "lower": quartiles[0.25] - multiplier * iqr,
+            "upper": quartiles[0.75] + multiplier * iqr,
+        }
+    )
+    bounds = bounds[grouped.count() >= rule.get("min_group_size", 1)]
+    bounds.index = bounds.index.astype(object)
+    return bounds
+
+
+def evaluate_rules(
+    df: pd.DataFrame,
+    rules: Dict[str, dict],
+    group_bounds: Optional[Dict[str, pd.DataFrame]] = None,
+    id_col: str = "id",
+) -> pd.DataFrame:
+    """Evaluate every rule over a salary table (or a chunk of one).
+
+    Args:
+        df (pd.DataFrame): salary table
+        rules (Dict[str, dict]): rule name to rule config
+        group_bounds (Optional[Dict[str, pd.DataFrame]], optional): bounds of the
+            group outlier rules, computed over the whole table. If None, they
+            are computed from df.
+        id_col (str, optional): column with the job ad id. Defaults to "id".
+
+    Returns:
+        pd.DataFrame: one row per violation with the id and rule
+    """
+    group_bounds = group_bounds or {}
+    violations = []
+    for name, rule in rules.items():
+        if rule.get("type") == "group_outlier":
+            bounds = group_bounds.get(name)
+            if bounds is None:
+                bounds = group_outlier_bounds(df, rule)
+            groups = df[rule["by"]].astype(object)
+            values = df[rule["column"]]
+            failed = (values < groups.map(bounds["lower"]).astype(float)) | (
+                values > groups.map(bounds["upper"]).astype(float)
             )
+        else:
+            failed = df.eval(rule["fail_if"])
+        failed_ids = df.loc[failed.fillna(False).astype(bool).to_numpy(), id_col]
+        violations.append(pd.DataFrame({id_col: failed_ids.to_numpy(), "rule": name}))
+
+    if not violations:
+        return pd.DataFrame(columns=[id_col, "rule"])
+    violations = pd.concat(violations, ignore_index=True)
+    violations["rule"] = pd.Categorical(violations["rule"], categories=list(rules))
+    return violations
+
+
+def evaluate_chunk(
+    chunk: pd.DataFrame,
+    rules: Dict[str, dict],
+    group_bounds: Dict[str, pd.DataFrame],
+    id_col: str = "id",
+) -> Tuple[pd.DataFrame, int]:
+    """Evaluate every rule over a chunk of a salary table.
+
+    Returns:
+        Tuple[pd.DataFrame, int]: the violations, as returned by evaluate_rules(),
+            and the number of rows checked
+    """
+    return evaluate_rules(chunk, rules, group_bounds, id_col=id_col), len(chunk)
+
 
-    def test_max_diff_10_times(self):
-        logger.info(
-            "Checking that all max salaries are less than 10 times the min salary"
+def validate_salaries(
+    bucket_name: str = PRINZ_BUCKET_NAME,
+    file_name: str = SALARY_MEASURES_S3,
+    rules: Optional[Dict[str, dict]] = None,
+    chunk_size: int = 1000000,
+    id_col: str = "id",
+    n_jobs: int = 2,
+) -> pd.DataFrame:
+    """Check a salary table in s3 against the salary rules, chunk by chunk.
+
+    Only the columns the rules need are loaded. Group outlier bounds are
+    computed in a first pass over just the columns they need. The chunks are
+    checked in threads while the next chunk is read from s3.
+
+    Args:
+        bucket_name (str, optional): S3 bucket. Defaults to PRINZ_BUCKET_NAME.
+        file_name (str, optional): path to the salary table in the S3 bucket.
+            Defaults to SALARY_MEASURES_S3.
+        rules (Optional[Dict[str, dict]], optional): rule name to rule config.
+            Defaults to the rules in SALARY_RULES_PATH.
+        chunk_size (int, optional): number of rows checked at a time.
+            Defaults to 1000000.
+        id_col (str, optional): column with the job ad id. Defaults to "id".
+        n_jobs (int, optional): number of threads checking chunks. Defaults to 2.
+
+    Returns:
+        pd.DataFrame: one row per violation with the id and rule
+    """
+    rules = rules if rules is not None else load_salary_rules()
+    if fnmatch(file_name, "*.parquet"):
+        table_columns = get_s3_parquet_columns(bucket_name, file_name)
+    else:
+        table_columns = pd.read_csv(
+            "s3://" + bucket_name + "/" + file_name, nrows=0
+        ).columns
+    rules = applicable_rules(rules, table_columns)
+    columns = sorted(set().union(*map(rule_columns, rules.values())) | {id_col})
+
+    group_bounds = {
+        name: group_outlier_bounds(
+            load_s3_data(bucket_name, file_name, columns=sorted(rule_columns(rule))),
+            rule,
         )
-        if (
-            self.df["max_annualised_salary"] <= self.df["min_annualised_salary"] * 10
-        ).all():
-            logger.info("Test passed")
-        else:
-            self.error_dict["max_diff_10_times"] = self.df[
-                self.df["max_annualised_salary"] > self.df["min_annualised_salary"] * 10
-            ]["id"].to_list()
-            logger.info(
-                f"Test failed - list of ids where test failed has been exported to file at {self.export_path}"
-            )
+        for name, rule in rules.items()
+        if rule.get("type") == "group_outlier"
+    }
+
+    violations, n_rows = [], 0
+    for chunk_violations, n_chunk_rows in map_chunks(
+        partial(evaluate_chunk, rules=rules, group_bounds=group_bounds, id_col=id_col),
+        load_s3_data_chunks(
+            bucket_name, file_name, chunksize=chunk_size, columns=columns
+        ),
+        n_jobs=n_jobs,
+        # at most n_jobs chunks (and the one being read) are in memory at once
+        max_in_flight=n_jobs,
+    ):
+        violations.append(chunk_violations)
+        n_rows += n_chunk_rows
+    violations = pd.concat(
+        violations or [pd.DataFrame(columns=[id_col, "rule"])], ignore_index=True
+    )
+    violations["rule"] = pd.Categorical(violations["rule"], categories=list(rules))
+
+    counts = violations["rule"].value_counts()
+    for name, rule in rules.items():
+        status = "passed" if counts.get(name, 0) == 0 else f"failed for {counts[name]}"
+        logger.info(f"{rule.get('description', name)}: {status} of {n_rows} job ads")
+    return violations
 
-    def run_all_tests(self):
-        test = TestSalary(self.df)
-        test.test_min_less_max_salaries()
-        test.test_max_salary_500k()
-        test.test_max_diff_10_times()
-        with open(test.export_path, "w") as file:
-            json.dump(test.error_dict, file)
+
+@plac.annotations(
+    bucket_name=("bucket_name", "option", "b", str),
+    file_name=("file_name", "option", "f", str),
+    chunk_size=("chunk_size", "option", "cs", int),
+    n_jobs=("n_jobs", "option", "nj", int),
+)
+def run_all_tests(
+    bucket_name: str = PRINZ_BUCKET_NAME,
+    file_name: str = SALARY_MEASURES_S3,
+    chunk_size: int = 1000000,
+    n_jobs: int = 2,
+):
+    """Check a salary table against the salary rules and export the violations."""
+    violations = validate_salaries(
+        bucket_name, file_name, chunk_size=chunk_size, n_jobs=n_jobs
+    )
+    violations.to_parquet(VIOLATIONS_PATH, index=False)
+    logger.info(f"Violations exported to {VIOLATIONS_PATH}")
 
 
 if __name__ == "__main__":
-    test = TestSalary(ojo_sal)
-    test.run_all_tests()
+    plac.call(run_all_tests)
 
     print("All tests complete")
@@ -0,0 +1,202 @@
+"""
+Functions to select informative job adverts to label, using uncertainty
+sampling followed by a k-center diversity step.
+
+All scoring is vectorised with numpy and done in batches, so pools of hundreds
+of thousands of embedded job adverts can be scored on CPU.
+"""
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from dap_job_quality.utils.chunk import list_chunks
+
+
+def normalise_rows(embeddings: np.ndarray) -> np.ndarray:
+    """L2 normalise embeddings so that dot products are cosine similarities.
+
+    Args:
+        embeddings (np.ndarray): (n, d) array of embeddings
+
+    Returns:
+        np.ndarray: (n, d) float32 array of unit length embeddings
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def label_prototypes(
+    embeddings: np.ndarray, labels: Iterable[str]
+) -> Dict[str, np.ndarray]:
+    """Get the mean (prototype) embedding of the labelled spans of each label.
+
+    Args:
+        embeddings (np.ndarray): (n, d) array of labelled span embeddings
+        labels (Iterable[str]): the label of each span
+
+    Returns:
+        Dict[str, np.ndarray]: label to unit length prototype embedding
+    """
+    embeddings = normalise_rows(embeddings)
+    labels = np.asarray(list(labels))
+    prototypes = {}
+    for label in np.unique(labels):
+        prototype = embeddings[labels == label].mean(axis=0, keepdims=True)
+        prototypes[label] = normalise_rows(prototype)[0]
+    return prototypes
+
+
+def label_weights(labels: Iterable[str]) -> Dict[str, float]:
+    """Weight labels by their inverse frequency, so that job adverts resembling
+    rare labels (eg. "6_voice_representation") are favoured.
+
+    Args:
+        labels (Iterable[str]): the label of each labelled span
+
+    Returns:
+        Dict[str, float]: label to weight, with a mean weight of 1
+    """
+    unique_labels, counts = np.unique(list(labels), return_counts=True)
+    weights = 1 / counts
+    weights = weights / weights.mean()
+    return dict(zip(unique_labels, weights))
+
+
+def prototype_probabilities(
+    embeddings: np.ndarray,
+    prototypes: Dict[str, np.ndarray],
+    temperature: float = 0.05,
+) -> np.ndarray:
+    """Get the probability of each label for each embedding, from a softmax over
+    the cosine similarities to each label prototype.
+
+    Args:
+        embeddings (np.ndarray): (n, d) array of embeddings
+        prototypes (Dict[str, np.ndarray]): label to prototype embedding
+        temperature (float, optional): softmax temperature. Defaults to 0.05.
+
+    Returns:
+        np.ndarray: (n, n_labels) probabilities, with the labels in the order
+            of prototypes
+    """
+    prototype_matrix = np.stack(list(prototypes.values()))
+    logits = normalise_rows(embeddings) @ prototype_matrix.T / temperature
+    logits -= logits.max(axis=1, keepdims=True)
+    probs = np.exp(logits)
+    return probs / probs.sum(axis=1, keepdims=True)
+
+
+def prototype_uncertainty(
+    embeddings: np.ndarray,
+    prototypes: Dict[str, np.ndarray],
+    weights: Optional[Dict[str, float]] = None,
+    temperature: float = 0.05,
+    batch_size: int = 10000,
+) -> np.ndarray:
+    """Score how uncertain the label of each job advert is, from the margin
+    between its two most likely labels under a softmax over the cosine
+    similarities to each label prototype.
+
+    Args:
+        embeddings (np.ndarray): (n, d) array of job advert embeddings
+        prototypes (Dict[str, np.ndarray]): label to prototype embedding
+        weights (Optional[Dict[str, float]], optional): label to weight. If given,
+            uncertainty is scaled by the expected weight of the label.
+        temperature (float, optional): softmax temperature. Defaults to 0.05.
+        batch_size (int, optional): number of job adverts scored at a time.
+            Defaults to 10000.
+
+    Returns:
+        np.ndarray: (n,) uncertainty scores, higher is more uncertain
+    """
+    prototype_labels = list(prototypes)
+    if weights is not None:
+        weight_vector = np.array(
+            [weights.get(label, 1.0) for label in prototype_labels], dtype=np.float32
+        )
+
+    scores = []
+    for batch in list_chunks(embeddings, batch_size):
+        probs = prototype_probabilities(batch, prototypes, temperature)
+        if probs.shape[1] > 1:
+            top_two = np.partition(probs, -2, axis=1)[:, -2:]
+            uncertainty = 1 - (top_two[:, 1] - top_two[:, 0])
+        else:
+            uncertainty = 1 - probs[:, 0]
+        if weights is not None:
+            uncertainty = uncertainty * (probs @ weight_vector)
+        scores.append(uncertainty)
+    return np.concatenate(scores) if scores else np.empty(0, dtype=np.float32)
+
+
+def k_center_greedy(
+    embeddings: np.ndarray, k: int, centers: Optional[np.ndarray] = None
+) -> List[int]:
+    """Greedily pick k job adverts that are as far as possible from each other
+    and from any already labelled job adverts (the k-center coreset heuristic).
+
+    Args:
+        embeddings (np.ndarray): (n, d) array of candidate job advert embeddings
+        k (int): number of job adverts to pick
+        centers (Optional[np.ndarray], optional): (m, d) array of embeddings
+            that are already labelled. Defaults to None.
+
+    Returns:
+        List[int]: indices of the picked job adverts, in the order picked
+    """
+    embeddings = normalise_rows(embeddings)
+    n = len(embeddings)
+    k = min(k, n)
+    if k == 0:
+        return []
+
+    # cosine distance to the nearest center
+    min_distances = np.full(n, np.inf, dtype=np.float32)
+    if centers is not None and len(centers) > 0:
+        for batch in list_chunks(normalise_rows(centers), 1000):
+            distances = 1 - embeddings @ batch.T
+            np.minimum(min_distances, distances.min(axis=1), out=min_distances)
+
+    picked = []
+    next_index = 0 if np.isinf(min_distances).all() else int(min_distances.argmax())
+    for _ in range(k):
+        picked.append(next_index)
+        distances = 1 - embeddings @ embeddings[next_index]
+        np.minimum(min_distances, distances, out=min_distances)
+        min_distances[next_index] = -np.inf
+        next_index = int(min_distances.argmax())
+    return picked
+
+
+def select_candidates(
+    uncertainty: np.ndarray,
+    embeddings: np.ndarray,
+    batch_size: int = 1000,
+    pool_factor: int = 5,
+    labelled_embeddings: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Select a batch of job adverts to label: shortlist the most uncertain
+    job adverts, then pick a diverse batch from the shortlist.
+
+    Args:
+        uncertainty (np.ndarray): (n,) uncertainty score of each job advert
+        embeddings (np.ndarray): (n, d) array of job advert embeddings
+        batch_size (int, optional): number of job adverts to select. Defaults to 1000.
+        pool_factor (int, optional): the shortlist is pool_factor x batch_size
+            of the most uncertain job adverts. Defaults to 5.
+        labelled_embeddings (Optional[np.ndarray], optional): embeddings of job
+            adverts that have already been labelled, which the batch is kept
+            away from. Defaults to None.
+
+    Returns:
+        np.ndarray: indices of the selected job adverts
+    """
+    shortlist_size = min(len(uncertainty), batch_size * pool_factor)
+    if shortlist_size == 0:
+        return np.empty(0, dtype=int)
+    shortlist = np.argpartition(-uncertainty, shortlist_size - 1)[:shortlist_size]
+    picked = k_center_greedy(
+        embeddings[shortlist], batch_size, centers=labelled_embeddings
+    )
+    return shortlist[picked]
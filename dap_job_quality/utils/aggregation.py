@@ -0,0 +1,251 @@
+"""
+Prevalence of job quality features (eg. the share of job adverts offering flexible
+working) by any combination of region, occupation and time period.
+
+IndicatorCube integer-codes the group keys of every job advert once (eg. ITL1
+region, SOC2 occupation and the quarter the advert was created in). A group-by is
+then a combined integer code per job advert and np.bincount over the non-zero
+entries of the binary job advert x feature matrix, rather than a pandas groupby.
+The result of each group-by is cached, so looking up "the share of job adverts
+offering X in region Y, occupation Z and quarter Q" is an index lookup.
+
+Confidence intervals are Wilson score intervals, which stay within [0, 1] and
+behave well for small groups and shares close to 0 or 1.
+"""
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+from dap_job_quality.utils.feature_matrix import FeatureMatrix
+
+PREVALENCE_COLUMNS = [
+    "feature",
+    "n_ads",
+    "n_with_feature",
+    "share",
+    "ci_lower",
+    "ci_upper",
+]
+
+
+def wilson_interval(
+    successes: np.ndarray, n: np.ndarray, confidence: float = 0.95
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Wilson score confidence intervals of proportions.
+
+    Args:
+        successes (np.ndarray): number of successes, eg. job adverts with a feature
+        n (np.ndarray): number of trials, eg. job adverts in the group
+        confidence (float, optional): confidence level. Defaults to 0.95.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: lower and upper bounds, NaN where n is 0
+    """
+    successes = np.asarray(successes, dtype=float)
+    n = np.asarray(n, dtype=float)
+    z = norm.ppf(0.5 + confidence / 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = successes / n
+        denominator = 1 + z**2 / n
+        centre = (p + z**2 / (2 * n)) / denominator
+        half_width = z * np.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / denominator
+    return np.clip(centre - half_width, 0, 1), np.clip(centre + half_width, 0, 1)
+
+
+class IndicatorCube:
+    """
+    Prevalence rates of job quality features for group-by combinations of job advert keys.
+    """
+
+    def __init__(
+        self,
+        features: FeatureMatrix,
+        keys: pd.DataFrame,
+        date_col: Optional[str] = "created",
+        period_freq: str = "Q",
+    ):
+        """
+        Args:
+            features (FeatureMatrix): job advert x feature matrix, eg. from
+                build_feature_matrix.py. Any non-zero entry counts as having the feature.
+            keys (pd.DataFrame): group keys (eg. itl_1_name, SOC_2digit, created)
+                indexed by job id. Job adverts without keys can only be counted
+                in group-bys that don't use the missing keys.
+            date_col (Optional[str], optional): date column to derive a period key
+                from, or None. Defaults to "created".
+            period_freq (str, optional): pandas period frequency of the period key,
+                which is named "quarter" for "Q" and "period" otherwise. Defaults to "Q".
+        """
+        self.features = features.binary()
+        self.ids = self.features.ids
+        self.feature_names = self.features.features
+        self._feature_index = pd.Index(self.feature_names)
+
+        keys = keys[~keys.index.duplicated()].reindex(self.ids)
+        if date_col is not None and date_col in keys.columns:
+            period_col = "quarter" if period_freq == "Q" else "period"
+            keys[period_col] = (
+                pd.to_datetime(keys[date_col], errors="coerce")
+                .dt.to_period(period_freq)
+                .astype(str)
+                .where(keys[date_col].notna())
+            )
+            keys = keys.drop(columns=date_col)
+
+        self.codes: Dict[str, np.ndarray] = {}
+        self.levels: Dict[str, pd.Index] = {}
+        for col in keys.columns:
+            codes, levels = pd.factorize(keys[col], sort=True)
+            self.codes[col] = codes.astype(np.int64)
+            self.levels[col] = pd.Index(levels, name=col)
+
+        # CSR (row, column) of each job advert with each feature
+        matrix = self.features.matrix
+        self._rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+        self._columns = matrix.indices.astype(np.int64)
+        self._cache: Dict[Tuple[Tuple[str, ...], float], pd.DataFrame] = {}
+        # the same group-bys indexed by their keys and feature, for share()
+        self._lookup_cache: Dict[Tuple[Tuple[str, ...], float], pd.DataFrame] = {}
+
+    @property
+    def keys(self) -> List[str]:
+        """Names of the keys that can be grouped by."""
+        return list(self.codes)
+
+    def _group_codes(self, by: Tuple[str, ...]) -> Tuple[np.ndarray, pd.DataFrame]:
+        """Combine the codes of the keys into one code per job advert.
+
+        Returns:
+            Tuple[np.ndarray, pd.DataFrame]: code of each job advert (-1 if any of
+                its keys is missing) and the key values of each code
+        """
+        if not by:
+            return np.zeros(len(self.ids), dtype=np.int64), pd.DataFrame(index=[0])
+        unknown = [col for col in by if col not in self.codes]
+        if unknown:
+            raise KeyError(f"Unknown keys {unknown}, choose from {self.keys}")
+
+        codes = np.column_stack([self.codes[col] for col in by])
+        has_keys = (codes >= 0).all(axis=1)
+        shape = tuple(len(self.levels[col]) for col in by)
+        group_codes = np.full(len(self.ids), -1, dtype=np.int64)
+        if np.prod(shape, dtype=float) <= len(self.ids):
+            # dense codes, with a group for every combination of key values
+            group_codes[has_keys] = np.ravel_multi_index(codes[has_keys].T, shape)
+            group_keys = np.unravel_index(np.arange(np.prod(shape)), shape)
+        else:
+            # only the combinations that occur, as the product of the keys is large
+            combinations, group_codes[has_keys] = np.unique(
+                codes[has_keys], axis=0, return_inverse=True
+            )
+            group_keys = combinations.T
+        return group_codes, pd.DataFrame(
+            {
+                col: self.levels[col].take(key_codes)
+                for col, key_codes in zip(by, group_keys)
+            }
+        )
+
+    def prevalence(
+        self,
+        by: Iterable[str] = (),
+        features: Optional[Iterable[str]] = None,
+        confidence: float = 0.95,
+    ) -> pd.DataFrame:
+        """Share of job adverts with each feature in each group, with confidence intervals.
+
+        Args:
+            by (Iterable[str], optional): keys to group by, eg. ["itl_1_name", "quarter"].
+                Defaults to (), ie. across every job advert.
+            features (Optional[Iterable[str]], optional): features to return.
+                Defaults to every feature.
+            confidence (float, optional): confidence level of the intervals.
+                Defaults to 0.95.
+
+        Returns:
+            pd.DataFrame: one row per group with job adverts and feature, with the
+                group keys and PREVALENCE_COLUMNS
+        """
+        by = tuple(by)
+        cache_key = (by, confidence)
+        if cache_key not in self._cache:
+            self._cache[cache_key] = self._prevalence(by, confidence)
+        cube = self._cache[cache_key]
+        if features is not None:
+            cube = cube[cube["feature"].isin(list(features))]
+        return cube
+
+    def _prevalence(self, by: Tuple[str, ...], confidence: float) -> pd.DataFrame:
+        group_codes, group_keys = self._group_codes(by)
+        n_groups, n_features = len(group_keys), len(self.feature_names)
+        has_group = group_codes >= 0
+
+        n_ads = np.bincount(group_codes[has_group], minlength=n_groups)
+        entry_groups = group_codes[self._rows]
+        has_entry_group = entry_groups >= 0
+        n_with_feature = np.bincount(
+            entry_groups[has_entry_group] * n_features + self._columns[has_entry_group],
+            minlength=n_groups * n_features,
+        ).reshape(n_groups, n_features)
+
+        # drop empty groups, eg. combinations of keys that don't occur
+        occurs = n_ads > 0
+        group_keys = group_keys[occurs].reset_index(drop=True)
+        n_ads, n_with_feature = n_ads[occurs], n_with_feature[occurs]
+
+        cube = group_keys.loc[group_keys.index.repeat(n_features)].reset_index(
+            drop=True
+        )
+        cube["feature"] = np.tile(self.feature_names, len(group_keys))
+        cube["n_ads"] = np.repeat(n_ads, n_features)
+        cube["n_with_feature"] = n_with_feature.ravel()
+        cube["share"] = cube["n_with_feature"] / cube["n_ads"]
+        cube["ci_lower"], cube["ci_upper"] = wilson_interval(
+            cube["n_with_feature"], cube["n_ads"], confidence
+        )
+        return cube.sort_values([*by, "feature"], ignore_index=True)
+
+    def share(
+        self, feature: str, confidence: float = 0.95, **filters: Hashable
+    ) -> pd.Series:
+        """Share of job adverts with a feature in one group, eg.
+        cube.share("flexible_working", itl_1_name="Wales", quarter="2023Q1").
+
+        Args:
+            feature (str): feature name
+            confidence (float, optional): confidence level of the interval.
+                Defaults to 0.95.
+            **filters (Hashable): value of each key of the group. Keys that aren't
+                given are not grouped by.
+
+        Returns:
+            pd.Series: n_ads, n_with_feature, share, ci_lower and ci_upper of the group
+        """
+        if feature not in self._feature_index:
+            raise KeyError(f"Unknown feature {feature}")
+        by = tuple(sorted(filters))
+        cache_key = (by, confidence)
+        if cache_key not in self._lookup_cache:
+            self._lookup_cache[cache_key] = (
+                self.prevalence(by, confidence=confidence)
+                .set_index([*by, "feature"])
+                .sort_index()
+            )
+        cube = self._lookup_cache[cache_key]
+        group = tuple(filters[col] for col in by)
+        try:
+            return cube.loc[
+                (*group, feature) if by else feature, PREVALENCE_COLUMNS[1:]
+            ]
+        except KeyError:
+            # no job adverts in the group
+            return pd.Series(
+                [0, 0, np.nan, np.nan, np.nan], index=PREVALENCE_COLUMNS[1:]
+            )
+
+    def clear_cache(self):
+        """Forget the cached group-bys, eg. after changing the keys."""
+        self._cache.clear()
+        self._lookup_cache.clear()
@@ -1,16 +1,44 @@
-from sentence_transformers import SentenceTransformer
-import time
 from dap_job_quality import logger
 import numpy as np
-import torch
 
-from dap_job_quality.utils.chunk import list_chunks
+from dap_job_quality.utils.chunk import map_chunks
+from dap_job_quality.utils.instrumentation import increment, stage
 
-import time
 import logging
-from tqdm import tqdm
+from typing import Iterable
 
 
+def embed_unique_texts(
+    bert_model: "BertVectorizer",
+    texts: Iterable[str],
+    chunk_size: int = 1000,
+    progress: bool = False,
+) -> np.ndarray:
+    """
+    Embed each unique text once, in chunks, and broadcast the embeddings back to every text
+    Args:
+        bert_model: A fitted BertVectorizer
+        texts: The texts to embed, which can repeat (eg. boilerplate sentences of job adverts)
+        chunk_size: The number of unique texts to embed at a time
+        progress: Whether to show a progress bar
+    Returns:
+        np.ndarray: (n, d) array of the embedding of each text
+    """
+    # key of each unique text, in order of first occurrence
+    keys = {}
+    codes = [keys.setdefault(text, len(keys)) for text in texts]
+    if not keys:
+        return np.empty((0, 0), dtype=np.float32)
+    increment("texts_deduplicated", len(codes) - len(keys))
+    unique_embeddings = np.concatenate(
+        list(
+            map_chunks(bert_model.transform, list(keys), chunk_size, progress=progress)
+        )
+    )
+    return unique_embeddings[codes]
+
+
+@stage("get_embeddings")
 def get_embeddings(
     sent_list: list, chunk_size: int = 1000, id_list: list = None
 ) -> dict:
@@ -26,10 +54,8 @@ def get_embeddings(
 
     bert_model = BertVectorizer(verbose=True, multi_process=False).fit()
 
-    embeddings = []
-    for batch_texts in tqdm(list_chunks(sent_list, chunk_size)):
-        embeddings.append(bert_model.transform(batch_texts))
-    embeddings = np.concatenate(embeddings)
+    # torch already uses every core to embed a chunk, so the chunks are embedded one at a time
+    embeddings = embed_unique_texts(bert_model, sent_list, chunk_size, progress=True)
 
     if not id_list:
         id_list = sent_list
@@ -61,6 +87,10 @@ class BertVectorizer:
             logger.setLevel(logging.ERROR)
 
     def fit(self, *_):
+        # imported here as torch takes seconds to import
+        from sentence_transformers import SentenceTransformer
+        import torch
+
         device = torch.device(f"cuda:0" if torch.cuda.is_available() else "cpu")
         self.bert_model = SentenceTransformer(self.bert_model_name, device=device)
         self.bert_model.max_seq_length = 512
@@ -68,7 +98,12 @@ class BertVectorizer:
 
     def transform(self, texts):
         logger.info(f"Getting embeddings for {len(texts)} texts ...")
-        t0 = time.time()
+        increment("texts_embedded", len(texts))
+        with stage("bert_transform", log=self.verbose):
+            self._encode(texts)
+        return self.embedded_x
+
+    def _encode(self, texts):
         if self.multi_process:
             logger.info(".. with multiprocessing")
             pool = self.bert_model.start_multi_process_pool()
@@ -78,5 +113,3 @@ class BertVectorizer:
             self.bert_model.stop_multi_process_pool(pool)
         else:
             self.embedded_x = self.bert_model.encode(texts, batch_size=self.batch_size)
-        logger.info(f"Took {time.time() - t0} seconds")
-        return self.embedded_x
@@ -1,8 +1,26 @@
 """
-Functions to chunk data.
-"""
+Functions to chunk data, and to map a function over the chunks in parallel.
 
+iter_chunks() slices lists, arrays, dataframes and Arrow tables (without copying
+dataframes, arrays or Arrow tables) or batches any other iterable. map_chunks()
+maps a function over the chunks in a thread or process pool, keeping a bounded
+number of chunks in flight so that a large or streamed input (eg. a table read
+from S3 in chunks) is never all in memory at once, and yields the results in
+the order of the chunks.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from itertools import islice
+import os
+import time
+from typing import Callable, Iterator, Optional, Tuple, Type, Union
+
+from dap_job_quality import logger
+from dap_job_quality.utils.instrumentation import (
+    collect_metrics,
+    increment,
+    merge_metrics,
+)
 
 
 def list_chunks(orig_list: list, chunk_size: int = 100):
@@ -25,3 +43,212 @@ def dict_chunks(data_dict: dict, chunk_size: int = 100):
     it = iter(data_dict)
     for i in range(0, len(data_dict), chunk_size):
         yield {k: data_dict[k] for k in islice(it, chunk_size)}
+
+
+def iter_chunks(data, chunk_size: int = 100) -> Iterator:
+    """Chunks any data into batches of a specified chunk_size:
+        - dataframes and series are sliced with iloc, which doesn't copy them
+        - Arrow tables and record batches are sliced, which doesn't copy them
+        - dicts are chunked with dict_chunks()
+        - lists, tuples and numpy arrays are sliced (arrays without copying)
+        - any other iterable, eg. a generator, is batched into lists
+
+    Args:
+        data: data to chunk
+        chunk_size (int, optional): chunk size. Defaults to 100.
+
+    Yields:
+        Iterator: chunks of the same type as data, or lists for other iterables
+    """
+    if hasattr(data, "iloc"):
+        for start in range(0, len(data), chunk_size):
+            yield data.iloc[start : start + chunk_size]
+    elif hasattr(data, "num_rows") and hasattr(data, "slice"):
+        for start in range(0, data.num_rows, chunk_size):
+            yield data.slice(start, chunk_size)
+    elif isinstance(data, dict):
+        yield from dict_chunks(data, chunk_size)
+    elif hasattr(data, "__len__") and hasattr(data, "__getitem__"):
+        yield from list_chunks(data, chunk_size)
+    else:
+        it = iter(data)
+        while chunk := list(islice(it, chunk_size)):
+            yield chunk
+
+
+def count_chunks(data, chunk_size: Optional[int] = None) -> Optional[int]:
+    """Count the chunks iter_chunks() will yield, or the items of data if
+    chunk_size is None, where data has a length.
+
+    Args:
+        data: data to chunk
+        chunk_size (Optional[int], optional): chunk size. Defaults to None.
+
+    Returns:
+        Optional[int]: number of chunks, or None for iterables without a length
+    """
+    n = getattr(data, "num_rows", None)
+    if n is None:
+        if not hasattr(data, "__len__"):
+            return None
+        n = len(data)
+    return n if chunk_size is None else -(-n // chunk_size)
+
+
+class _Retrying:
+    """
+    Retry a function that fails, waiting longer after each failure. A class
+    rather than a closure, so it can be sent to worker processes.
+    """
+
+    def __init__(
+        self,
+        fn: Callable,
+        retries: int,
+        retry_wait: float,
+        retry_on: Tuple[Type[BaseException], ...],
+    ):
+        self.fn = fn
+        self.retries = retries
+        self.retry_wait = retry_wait
+        self.retry_on = retry_on
+
+    def __call__(self, chunk):
+        for attempt in range(self.retries + 1):
+            try:
+                return self.fn(chunk)
+            except self.retry_on as e:
+                if attempt == self.retries:
+                    raise
+                wait = self.retry_wait * 2**attempt
+                logger.warning(f"Chunk failed ({e!r}), retrying in {wait:.1f}s")
+                increment("map_chunks.retries")
+                time.sleep(wait)
+
+
+class _WithMetrics:
+    """
+    Return the stages and counters recorded by a function run in a worker
+    process with its result, so the parent can merge them into its own.
+    """
+
+    def __init__(self, fn: Callable):
+        self.fn = fn
+
+    def __call__(self, chunk):
+        # forget any metrics inherited from the parent by a forked worker
+        collect_metrics()
+        result = self.fn(chunk)
+        return result, collect_metrics()
+
+
+def _get_result(future):
+    return future.result()
+
+
+def _merged_result(future):
+    result, metrics = future.result()
+    merge_metrics(metrics)
+    return result
+
+
+def _pool_map(
+    fn: Callable, chunks: Iterator, n_jobs: int, executor: str, max_in_flight: int
+) -> Iterator:
+    """Map fn over chunks in a pool, with at most max_in_flight chunks submitted
+    and not yet yielded, yielding the results in order."""
+    if executor == "process":
+        # worker processes record their own metrics, so send them back
+        pool = ProcessPoolExecutor(max_workers=n_jobs)
+        fn, get_result = _WithMetrics(fn), _merged_result
+    else:
+        pool = ThreadPoolExecutor(max_workers=n_jobs)
+        get_result = _get_result
+    in_flight = deque()
+    try:
+        for chunk in chunks:
+            if len(in_flight) >= max_in_flight:
+                yield get_result(in_flight.popleft())
+            in_flight.append(pool.submit(fn, chunk))
+        while in_flight:
+            yield get_result(in_flight.popleft())
+    finally:
+        # if a chunk failed or the results are no longer wanted
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def map_chunks(
+    fn: Callable,
+    data,
+    chunk_size: Optional[int] = None,
+    n_jobs: Optional[int] = 1,
+    executor: str = "thread",
+    max_in_flight: Optional[int] = None,
+    retries: int = 0,
+    retry_wait: float = 1.0,
+    retry_on: Tuple[Type[BaseException], ...] = (Exception,),
+    progress: Union[bool, str] = False,
+) -> Iterator:
+    """Map a function over chunks of data, in parallel, yielding the results in order.
+
+    Use threads for functions that release the GIL (eg. reading from S3, numpy,
+    pandas or torch) and processes for pure python functions (eg. clean_text).
+    Functions and chunks sent to processes must be picklable, so use top level
+    functions (with functools.partial for any other arguments). The stages and
+    counters recorded in worker processes (see instrumentation) are merged into
+    this process's as their chunks are yielded.
+
+    Args:
+        fn (Callable): function of a chunk
+        data: data to chunk with iter_chunks(), or an iterable of chunks if
+            chunk_size is None (eg. load_s3_data_chunks())
+        chunk_size (Optional[int], optional): chunk size. Defaults to None.
+        n_jobs (Optional[int], optional): number of threads or processes, where
+            None is the number of cores and 1 maps in the current thread.
+            Defaults to 1.
+        executor (str, optional): "thread" or "process". Defaults to "thread".
+        max_in_flight (Optional[int], optional): maximum number of chunks being
+            processed or waiting to be yielded, which bounds the memory used.
+            Defaults to twice n_jobs.
+        retries (int, optional): number of times a failed chunk is retried.
+            Defaults to 0.
+        retry_wait (float, optional): seconds before the first retry, doubled
+            before each of the next. Defaults to 1.0.
+        retry_on (Tuple[Type[BaseException], ...], optional): exceptions to retry.
+            Defaults to (Exception,).
+        progress (Union[bool, str], optional): whether to show a progress bar,
+            or its description. Defaults to False.
+
+    Returns:
+        Iterator: fn of each chunk, in the order of the chunks
+    """
+    if executor not in ("thread", "process"):
+        raise ValueError(f"executor must be 'thread' or 'process', not {executor}")
+    n_jobs = n_jobs or os.cpu_count() or 1
+    total = count_chunks(data, chunk_size)
+    if total is not None:
+        # no more workers than chunks, and none for a single chunk
+        n_jobs = max(min(n_jobs, total), 1)
+    chunks = iter_chunks(data, chunk_size) if chunk_size else iter(data)
+    if retries:
+        fn = _Retrying(fn, retries, retry_wait, retry_on)
+
+    if n_jobs == 1:
+        results = map(fn, chunks)
+    else:
+        results = _pool_map(fn, chunks, n_jobs, executor, max_in_flight or 2 * n_jobs)
+    if progress:
+        results = _with_progress(
+            results, total, progress if isinstance(progress, str) else None
+        )
+    return results
+
+
+def _with_progress(results: Iterator, total: Optional[int], desc: Optional[str]):
+    # imported here as the progress bar is optional
+    from tqdm import tqdm
+
+    with tqdm(total=total, desc=desc, unit="chunk") as progress_bar:
+        for result in results:
+            progress_bar.update()
+            yield result
@@ -0,0 +1,409 @@
+"""
+A small DAG runner for the pipeline, with content-addressed caching of each stage's output.
+
+A stage declares the stages it takes as inputs, its parameters and any files it
+reads (local paths or "s3://" paths). Its cache key is a hash of:
+    - its code version: the source of its function and of the whole modules
+      defining any other code it declares (eg. find_keywords_in_dictionary, so
+      any helper in pipeline/keyword_search.py), plus an optional version string
+    - its parameters
+    - the fingerprints of its files: a hash of the contents of local files, and
+      the ETag of S3 objects
+    - the cache keys of its input stages
+
+The output of a stage is saved under its cache key (as parquet for dataframes,
+with their index, otherwise as a pickle), so a stage is only run when one of these has changed.
+For example, editing inputs/keyword_lookup.csv only changes the keys of the
+keyword search and the stages downstream of it. Cached outputs are only loaded
+if a stage that needs them has to run, and stages whose inputs are ready run in
+parallel threads (most stages wait on S3 or on pandas and numpy, which release
+the GIL).
+
+Caches can be saved locally or to S3 (with an "s3://" prefix).
+See pipeline/run_pipeline.py for the job quality workflow.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from hashlib import blake2b
+import inspect
+import json
+import pickle
+import posixpath
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+import fsspec
+import pandas as pd
+
+from dap_job_quality import PROJECT_DIR, logger
+from dap_job_quality.utils import instrumentation
+from dap_job_quality.utils.incremental import hash_object
+
+CACHE_DIR = PROJECT_DIR / "outputs/cache/pipeline"
+
+
+def fingerprint_file(path: str) -> str:
+    """Fingerprint a file that a stage reads.
+
+    Args:
+        path (str): local path, or "s3://bucket/key" path
+
+    Returns:
+        str: the ETag of S3 objects, or a hash of the contents of local files
+    """
+    path = str(path)
+    if path.startswith("s3://"):
+        from dap_job_quality.getters.data_getters import get_s3_object_fingerprint
+
+        bucket_name, _, file_name = path[len("s3://") :].partition("/")
+        return get_s3_object_fingerprint(bucket_name, file_name)
+    digest = blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024**2), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def code_version(code: Iterable[Any], modules: bool = False) -> str:
+    """Hash the source of functions (or classes or modules).
+
+    Args:
+        code (Iterable[Any]): functions whose changes should invalidate a stage
+        modules (bool, optional): whether to hash the whole module defining each
+            function or class, so that changes to the helpers it calls in that
+            module are also picked up. Defaults to False.
+
+    Returns:
+        str: hex digest
+    """
+    sources = []
+    if modules:
+        # each module once, in the order they are declared
+        code = dict.fromkeys(
+            inspect.getmodule(inspect.unwrap(obj)) or obj for obj in code
+        )
+    for obj in code:
+        # functools.wraps (eg. instrumentation.stage) keeps the wrapped function
+        obj = inspect.unwrap(obj)
+        try:
+            sources.append(inspect.getsource(obj))
+        except (OSError, TypeError):
+            # eg. builtins, whose source isn't available
+            sources.append(getattr(obj, "__qualname__", repr(obj)))
+    return hash_object(sources)
+
+
+class Stage:
+    """
+    A stage of a pipeline: a function of the outputs of its input stages and its parameters.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable,
+        inputs: Optional[List[str]] = None,
+        params: Optional[dict] = None,
+        files: Optional[List[str]] = None,
+        code: Optional[List[Callable]] = None,
+        version: str = "",
+    ):
+        """
+        Args:
+            name (str): name of the stage
+            fn (Callable): function called with the output of each input stage
+                (as keyword arguments named after the stages) and the parameters
+            inputs (Optional[List[str]], optional): names of the input stages.
+                Defaults to None.
+            params (Optional[dict], optional): JSON serialisable parameters passed
+                to fn. Defaults to None.
+            files (Optional[List[str]], optional): local or s3:// files fn reads,
+                which are fingerprinted (fn is not passed them). Defaults to None.
+            code (Optional[List[Callable]], optional): other functions (or
+                classes or modules) fn calls, whose modules' changes should
+                invalidate the stage. Defaults to None.
+            version (str, optional): bump to invalidate the stage for any other
+                reason. Defaults to "".
+        """
+        self.name = name
+        self.fn = fn
+        self.inputs = inputs or []
+        self.params = params or {}
+        self.files = [str(file) for file in files or []]
+        self.code = code or []
+        self.version = version
+
+    def cache_key(self, input_keys: Dict[str, str]) -> str:
+        """Hash the stage's code version, parameters, file fingerprints and input keys.
+
+        Args:
+            input_keys (Dict[str, str]): input stage name to its cache key
+
+        Returns:
+            str: hex digest
+        """
+        return hash_object(
+            {
+                # the stage's own function, and the whole modules of the code it
+                # calls, so that editing a helper of that code invalidates it
+                "code": [
+                    code_version([self.fn]),
+                    code_version(self.code, modules=True),
+                ],
+                "version": self.version,
+                "params": self.params,
+                "files": {file: fingerprint_file(file) for file in self.files},
+                "inputs": {name: input_keys[name] for name in self.inputs},
+            }
+        )
+
+
+class StageCache:
+    """
+    Outputs of stages, saved under their cache keys.
+    """
+
+    def __init__(self, cache_dir: str = str(CACHE_DIR)):
+        """
+        Args:
+            cache_dir (str, optional): local or s3:// directory of the cache.
+                Defaults to CACHE_DIR.
+        """
+        self.cache_dir = str(cache_dir).rstrip("/")
+
+    def _path(self, name: str, key: str, suffix: str) -> str:
+        return f"{self.cache_dir}/{name}/{key}{suffix}"
+
+    def _read_meta(self, name: str, key: str) -> Optional[dict]:
+        fs, fs_path = fsspec.core.url_to_fs(self._path(name, key, ".json"))
+        if not fs.exists(fs_path):
+            return None
+        with fs.open(fs_path, "r") as f:
+            return json.load(f)
+
+    def contains(self, name: str, key: str) -> bool:
+        """Whether a stage's output with this key has been saved."""
+        return self._read_meta(name, key) is not None
+
+    def load(self, name: str, key: str) -> Any:
+        """Load a stage's saved output."""
+        meta = self._read_meta(name, key)
+        path = self._path(name, key, meta["suffix"])
+        if meta["suffix"] == ".parquet":
+            return pd.read_parquet(path)
+        with fsspec.open(path, "rb") as f:
+            return pickle.load(f)
+
+    def save(self, name: str, key: str, output: Any, meta: dict):
+        """Save a stage's output under its key. The metadata is written last,
+        so an interrupted save is not mistaken for a cached output.
+
+        Args:
+            name (str): name of the stage
+            key (str): cache key of the stage
+            output (Any): output of the stage
+            meta (dict): metadata saved with the output, eg. its parameters
+        """
+        fs, fs_path = fsspec.core.url_to_fs(self._path(name, key, ""))
+        fs.makedirs(posixpath.dirname(fs_path), exist_ok=True)
+        suffix = ".pkl"
+        if isinstance(output, pd.DataFrame):
+            try:
+                # with the index, so a cached output is the same as a fresh one
+                output.to_parquet(self._path(name, key, ".parquet"))
+                suffix = ".parquet"
+            except (TypeError, ValueError, ImportError) as e:
+                # eg. columns of mixed types that arrow can't convert
+                logger.warning(f"Pickling the output of {name}, as {e}")
+        if suffix == ".pkl":
+            with fsspec.open(self._path(name, key, suffix), "wb") as f:
+                pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+        with fsspec.open(self._path(name, key, ".json"), "w") as f:
+            json.dump({**meta, "suffix": suffix}, f, indent=2, default=str)
+
+
+class Pipeline:
+    """
+    A DAG of stages, run with cached outputs and parallel stages.
+    """
+
+    def __init__(self, stages: List[Stage], cache: Optional[StageCache] = None):
+        """
+        Args:
+            stages (List[Stage]): stages of the pipeline, in any order
+            cache (Optional[StageCache], optional): cache of the stages' outputs.
+                Defaults to a StageCache in CACHE_DIR.
+        """
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Stage names must be unique")
+        self.cache = cache or StageCache()
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        order, visiting, done = [], set(), set()
+
+        def visit(name: str, path: List[str]):
+            if name in done:
+                return
+            if name not in self.stages:
+                raise ValueError(f"{path[-1]} takes an unknown stage {name} as input")
+            if name in visiting:
+                raise ValueError(f"Cycle in the pipeline: {' -> '.join(path + [name])}")
+            visiting.add(name)
+            for input_name in self.stages[name].inputs:
+                visit(input_name, path + [name])
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name, [])
+        return order
+
+    def sinks(self) -> List[str]:
+        """Get the stages that no other stage takes as input."""
+        inputs = {name for stage in self.stages.values() for name in stage.inputs}
+        return [name for name in self.order if name not in inputs]
+
+    def upstream(self, targets: Iterable[str]) -> Set[str]:
+        """Get the targets and every stage they depend on."""
+        needed, to_visit = set(), list(targets)
+        while to_visit:
+            name = to_visit.pop()
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage {name}")
+            if name not in needed:
+                needed.add(name)
+                to_visit.extend(self.stages[name].inputs)
+        return needed
+
+    def cache_keys(self, names: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        """Get the cache key of each stage, which only depends on the keys of
+        its inputs (not their outputs), so no stage has to be run to get them.
+
+        Args:
+            names (Optional[Iterable[str]], optional): stages to get the keys of,
+                with the stages they depend on. Defaults to every stage.
+
+        Returns:
+            Dict[str, str]: stage name to cache key
+        """
+        needed = self.upstream(names if names is not None else self.stages)
+        keys = {}
+        for name in self.order:
+            if name in needed:
+                keys[name] = self.stages[name].cache_key(keys)
+        return keys
+
+    def plan(
+        self, targets: Optional[Iterable[str]] = None, force: Iterable[str] = ()
+    ) -> Dict[str, bool]:
+        """Work out which stages have to run.
+
+        Args:
+            targets (Optional[Iterable[str]], optional): stages whose outputs are
+                wanted. Defaults to the sinks().
+            force (Iterable[str], optional): stages to run even if their output
+                is cached. Defaults to ().
+
+        Returns:
+            Dict[str, bool]: stage name to whether it has to run, for the targets
+                and the stages they depend on, in topological order
+        """
+        return self._plan(self.cache_keys(targets or self.sinks()), force)
+
+    def _plan(self, keys: Dict[str, str], force: Iterable[str]) -> Dict[str, bool]:
+        force = set(force)
+        return {
+            name: name in force or not self.cache.contains(name, key)
+            for name, key in keys.items()
+        }
+
+    def run(
+        self,
+        targets: Optional[Iterable[str]] = None,
+        force: Iterable[str] = (),
+        max_workers: int = 4,
+    ) -> Dict[str, Any]:
+        """Run the stages whose outputs aren't cached, in parallel where their
+        inputs allow, and get the outputs of the targets.
+
+        Args:
+            targets (Optional[Iterable[str]], optional): stages whose outputs are
+                wanted. Defaults to the sinks().
+            force (Iterable[str], optional): stages to run even if their output
+                is cached. Defaults to ().
+            max_workers (int, optional): maximum number of stages run at once.
+                Defaults to 4.
+
+        Returns:
+            Dict[str, Any]: target name to its output
+        """
+        targets = list(targets or self.sinks())
+        keys = self.cache_keys(targets)
+        to_run = {name for name, runs in self._plan(keys, force).items() if runs}
+        # a stage's inputs are only needed if it has to run
+        needed = set(targets) | {
+            input_name for name in to_run for input_name in self.stages[name].inputs
+        }
+        cached = [name for name in keys if name not in to_run]
+        logger.info(
+            f"Running {len(to_run)} of {len(keys)} stages "
+            f"({', '.join(name for name in keys if name in to_run) or 'none'}), "
+            f"{len(cached)} are cached"
+        )
+        instrumentation.increment("pipeline.stages_cached", len(cached))
+
+        outputs: Dict[str, Any] = {
+            name: self.cache.load(name, keys[name]) for name in cached if name in needed
+        }
+        pending = {name for name in keys if name in to_run}
+        running = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while pending or running:
+                ready = [
+                    name
+                    for name in self.order
+                    if name in pending
+                    and all(
+                        input_name in outputs for input_name in self.stages[name].inputs
+                    )
+                ]
+                for name in ready:
+                    pending.discard(name)
+                    running[
+                        executor.submit(self._run_stage, name, keys, outputs)
+                    ] = name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    # raises the stage's exception, after the running stages finish
+                    outputs[name] = future.result()
+
+        return {name: outputs[name] for name in targets}
+
+    def _run_stage(self, name: str, keys: Dict[str, str], outputs: Dict[str, Any]):
+        stage = self.stages[name]
+        with instrumentation.stage(f"pipeline.{name}"):
+            start_time = time.perf_counter()
+            output = stage.fn(
+                **{input_name: outputs[input_name] for input_name in stage.inputs},
+                **stage.params,
+            )
+            seconds = time.perf_counter() - start_time
+        self.cache.save(
+            name,
+            keys[name],
+            output,
+            {
+                "stage": name,
+                "params": stage.params,
+                "files": stage.files,
+                "inputs": {input_name: keys[input_name] for input_name in stage.inputs},
+                "seconds": round(seconds, 3),
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+            },
+        )
+        instrumentation.increment("pipeline.stages_run")
+        return output
@@ -1,15 +1,16 @@
 """
 Helper functions for EDA steps that we might want to repeat
 """
-from collections import Counter
+from functools import partial
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import re
-from typing import Union, List, Dict, Tuple
+from typing import Union, List, Dict, Optional, Sequence, Tuple
 from wordcloud import WordCloud
 
-from dap_job_quality.utils import text_cleaning as tc
+from dap_job_quality.utils.chunk import map_chunks
+from dap_job_quality.utils.ngrams import NgramCounter
 
 
 def make_wordclouds(
@@ -70,19 +71,21 @@ def make_wordclouds(
 
 def most_common_ngrams(
     df: pd.DataFrame,
-    n: int = 2,
+    n: Union[int, Sequence[int]] = 2,
     label_col: str = "label",
     text_col: str = "labelled_span",
     n_most_common: int = 10,
-) -> Dict[str, List[Tuple[str, int]]]:
+) -> Union[
+    Dict[str, List[Tuple[Tuple[str, ...], int]]],
+    Dict[int, Dict[str, List[Tuple[Tuple[str, ...], int]]]],
+]:
     """
     Find the most common n-grams within each category in a dataframe.
 
     This function assumes you have a dataframe where one column contains a labelled span of text,
     and another column contains the label attributed to that span (eg "job design and nature of work", "other benefit"
-    etc). The function iterates over each category,
-    tokenizes the text in the corresponding text column, and finds the most common n-grams
-    within each category.
+    etc). Each span is tokenized once, and the n-grams of every length in n are counted for all
+    categories in a single pass (see utils/ngrams.py).
 
     The aim is to find out what phrases come up most frequently in the context of sentences about categories like
     "social support and cohesion" (eg "warm and friendly team", "supportive atmosphere" etc), "job design and
@@ -90,30 +93,30 @@ def most_common_ngrams(
 
     Args:
         df (pd.DataFrame): The dataframe containing the text and labels.
-        n (int): The number of elements in each n-gram (default is 2).
+        n (Union[int, Sequence[int]]): The number of elements in each n-gram (default is 2), or a list of them
+            eg. [1, 2, 3] to count words, bigrams and trigrams at once.
         label_col (str): The name of the column in the dataframe that contains the category labels (default is 'label').
         text_col (str): The name of the column in the dataframe that contains the text to be tokenized (default is 'labelled_span').
         n_most_common (int): The number of most common n-grams to return for each category (default is 10).
 
     Returns:
-        Dict[str, List[Tuple[str, int]]]: A dictionary where the keys are the categories and the values are lists of tuples.
+        A dictionary where the keys are the categories and the values are lists of tuples.
         Each tuple contains an n-gram and its frequency, and the list is sorted by frequency in descending order.
+        If n is a list, a dictionary of these dictionaries for each n.
     """
-    category_ngrams = {}
-    for category in df[label_col].unique():
-        ngrams_list = []
-        for text in df[df[label_col] == category][text_col]:
-            n_grams = tc.tokenize(text, n)
-            ngrams_list.extend(n_grams)
-        category_ngrams[category] = Counter(ngrams_list).most_common(n_most_common)
-    return category_ngrams
+    ns = [n] if isinstance(n, int) else list(n)
+    counter = NgramCounter(ns).update(df[text_col], df[label_col])
+    category_ngrams = {
+        n_: counter.most_common(n_, n_most_common=n_most_common) for n_ in ns
+    }
+    return category_ngrams[n] if isinstance(n, int) else category_ngrams
 
 
 def find_phrase_and_sentence(text: str, phrases: List[str]) -> Tuple[bool, str]:
     """
     Searches for each phrase in a list within the provided text and returns the first sentence containing any phrase.
 
-    #TODO: extend this function so that it can return multiple sentences from the same job ad.
+    To find every phrase and sentence in many job ads, use find_phrases_and_sentences().
 
     The function iterates through a list of phrases and checks if any of them are present in the text.
     If a phrase is found, it returns a tuple with True and the sentence containing the phrase.
@@ -127,8 +130,9 @@ def find_phrase_and_sentence(text: str, phrases: List[str]) -> Tuple[bool, str]:
         Tuple[bool, str]: A tuple where the first element is a boolean indicating if any phrase was found,
         and the second element is the sentence containing the phrase. If no phrase is found, the second element is an empty string.
     """
+    lower_text = text.lower()
     for phrase in phrases:
-        if phrase in text.lower():  # Check if the phrase is in the text
+        if phrase in lower_text:  # Check if the phrase is in the text
             # Find the whole sentence containing the phrase
             sentence = re.search(
                 r"([^.]*?" + re.escape(phrase) + r"[^.]*\.)", text, re.IGNORECASE
@@ -136,3 +140,188 @@ def find_phrase_and_sentence(text: str, phrases: List[str]) -> Tuple[bool, str]:
             if sentence:
                 return True, sentence.group()
     return False, ""
+
+
+def phrase_trie_pattern(phrases: List[str]) -> str:
+    """
+    Build a regex matching any of the phrases, with the phrases merged into a trie
+    (eg. "annual bonus|annual leave" becomes "annual (?:bonus|leave)"), which the regex
+    engine scans much faster than a flat alternation of hundreds of phrases.
+
+    Args:
+        phrases (List[str]): phrases to match
+
+    Returns:
+        str: regex pattern
+    """
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = {}  # marks the end of a phrase
+
+    def node_pattern(node: dict) -> str:
+        branches = [
+            re.escape(char) + node_pattern(child)
+            for char, child in sorted(node.items())
+            if char != ""
+        ]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        # a phrase can also end here, so the rest of the branch is optional
+        return f"(?:{pattern})?" if "" in node else pattern
+
+    return node_pattern(trie)
+
+
+class PhraseMatcher:
+    """
+    Finds every occurrence of a set of phrases in a text, and the sentence it is in.
+
+    All the phrases are compiled into one lookahead pattern (merged into a trie), which
+    finds each position where a phrase starts in a single scan of the text. The
+    phrases starting at that position are then looked up in a table keyed by their
+    first few characters, so overlapping and nested phrases are all found.
+    """
+
+    def __init__(self, phrases: Dict[str, List[str]]):
+        """
+        Args:
+            phrases (Dict[str, List[str]]): dimension to the phrases to search for
+        """
+        self.dimensions: Dict[str, List[str]] = {}
+        for dimension, dimension_phrases in phrases.items():
+            for phrase in dimension_phrases:
+                phrase = phrase.lower()
+                if phrase and dimension not in self.dimensions.get(phrase, []):
+                    self.dimensions.setdefault(phrase, []).append(dimension)
+        sorted_phrases = sorted(self.dimensions, key=len, reverse=True)
+        self.prefix_length = min([3] + [len(phrase) for phrase in sorted_phrases])
+        self.phrases_by_prefix: Dict[str, List[str]] = {}
+        for phrase in sorted_phrases:
+            self.phrases_by_prefix.setdefault(phrase[: self.prefix_length], []).append(
+                phrase
+            )
+        self.pattern = re.compile(
+            f"(?={phrase_trie_pattern(sorted_phrases)})" if sorted_phrases else "(?!)"
+        )
+
+    def find(self, text: str) -> List[Dict]:
+        """Find every phrase in a text, and the sentence (bounded by full stops) it is in.
+
+        Args:
+            text (str): text to search, typically a cleaned job description
+
+        Returns:
+            List[Dict]: one dict per phrase hit and dimension, with the dimension,
+                phrase, sentence, sentence_start, sentence_end, phrase_start and phrase_end
+        """
+        lower_text = text.lower()
+        if len(lower_text) != len(text):
+            # some characters lowercase to several (eg. "İ"), which would shift the
+            # offsets of every hit after them, so those are left as they are
+            lower_text = "".join(
+                lower_char if len(lower_char) == 1 else char
+                for char, lower_char in ((char, char.lower()) for char in text)
+            )
+        hits = []
+        for match in self.pattern.finditer(lower_text):
+            start = match.start()
+            prefix = lower_text[start : start + self.prefix_length]
+            for phrase in self.phrases_by_prefix.get(prefix, []):
+                if not lower_text.startswith(phrase, start):
+                    continue
+                end = start + len(phrase)
+                sentence_start = lower_text.rfind(".", 0, start) + 1
+                sentence_end = lower_text.find(".", end)
+                sentence_end = len(text) if sentence_end == -1 else sentence_end + 1
+                # skip the whitespace after the previous full stop
+                while sentence_start < start and text[sentence_start].isspace():
+                    sentence_start += 1
+                for dimension in self.dimensions[phrase]:
+                    hits.append(
+                        {
+                            "dimension": dimension,
+                            "phrase": phrase,
+                            "sentence": text[sentence_start:sentence_end],
+                            "sentence_start": sentence_start,
+                            "sentence_end": sentence_end,
+                            "phrase_start": start,
+                            "phrase_end": end,
+                        }
+                    )
+        return hits
+
+
+def _find_phrases_in_chunk(
+    chunk: pd.DataFrame, phrases: Dict[str, List[str]], text_col: str, id_col: str
+) -> List[Dict]:
+    """Find every phrase in a chunk of texts, in a worker process."""
+    matcher = PhraseMatcher(phrases)
+    return [
+        {id_col: text_id, **hit}
+        for text_id, text in zip(chunk[id_col], chunk[text_col])
+        if isinstance(text, str)
+        for hit in matcher.find(text)
+    ]
+
+
+def find_phrases_and_sentences(
+    df: pd.DataFrame,
+    phrases: Dict[str, List[str]],
+    text_col: str = "clean_description",
+    id_col: str = "id",
+    n_jobs: Optional[int] = None,
+    chunk_size: int = 10000,
+) -> pd.DataFrame:
+    """
+    Find every phrase of every dimension in a column of job descriptions, and the sentences they are in.
+
+    Unlike find_phrase_and_sentence(), this returns every hit (not just the first sentence), searches
+    for the phrases of all dimensions in a single pass over each description, and splits the
+    descriptions into chunks that are searched in parallel.
+
+    Args:
+        df (pd.DataFrame): The dataframe containing the job descriptions.
+        phrases (Dict[str, List[str]]): A dictionary of dimension to the phrases to search for.
+        text_col (str): The name of the column with the job descriptions (default is 'clean_description').
+        id_col (str): The name of the column with the job ids (default is 'id').
+        n_jobs (Optional[int]): Number of processes to search with. Defaults to the number of cores,
+            and 1 searches in the current process.
+        chunk_size (int): Number of job descriptions searched at a time by each process (default is 10000).
+
+    Returns:
+        pd.DataFrame: One row per phrase hit and dimension, with the job id, dimension, phrase, sentence, and
+        the character offsets of the sentence and phrase in the description.
+    """
+    hits = [
+        hit
+        for chunk_hits in map_chunks(
+            partial(
+                _find_phrases_in_chunk,
+                phrases=phrases,
+                text_col=text_col,
+                id_col=id_col,
+            ),
+            df[[id_col, text_col]],
+            chunk_size,
+            n_jobs=n_jobs,
+            executor="process",
+        )
+        for hit in chunk_hits
+    ]
+    return pd.DataFrame(
+        hits,
+        columns=[
+            id_col,
+            "dimension",
+            "phrase",
+            "sentence",
+            "sentence_start",
+            "sentence_end",
+            "phrase_start",
+            "phrase_end",
+        ],
+    )
@@ -0,0 +1,299 @@
+"""
+A sparse job advert x job quality feature (eg. subcategory) matrix, to say
+"this job advert mentions pay, flexible working and training" in one place.
+
+FeatureMatrixBuilder collects signals from different sources (keyword hits, NER
+spans, classifier scores) as (job id, feature, weight) triples, and builds a
+scipy CSR matrix with one row per job advert and one column per feature.
+Aggregations over groups of job adverts (eg. regions or occupations) are then
+sparse matrix products instead of groupbys over exploded dataframes.
+
+A FeatureMatrix is saved as a .npz matrix plus a _index.npz file with the job
+ids of the rows and the names of the columns.
+"""
+from pathlib import Path
+from typing import Hashable, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix, csr_matrix, load_npz, save_npz
+
+
+class FeatureMatrix:
+    """
+    Sparse matrix of job adverts x features with the job ids and feature names.
+    """
+
+    def __init__(
+        self, matrix: csr_matrix, ids: Iterable[Hashable], features: List[str]
+    ):
+        """
+        Args:
+            matrix (csr_matrix): (n_ids, n_features) counts or weights
+            ids (Iterable[Hashable]): job id of each row
+            features (List[str]): name of each column
+        """
+        self.matrix = csr_matrix(matrix)
+        self.ids = pd.Index(ids)
+        self.features = list(features)
+        if self.matrix.shape != (len(self.ids), len(self.features)):
+            raise ValueError("matrix shape does not match the ids and features")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def binary(self) -> "FeatureMatrix":
+        """Get a matrix of whether each job advert has each feature."""
+        matrix = self.matrix.copy()
+        matrix.data = (matrix.data > 0).astype(np.float32)
+        matrix.eliminate_zeros()
+        return FeatureMatrix(matrix, self.ids, self.features)
+
+    def rows(self, ids: Iterable[Hashable]) -> "FeatureMatrix":
+        """Get the rows of the given job ids, in their order. Job ids that are
+        not in the matrix get empty rows.
+
+        Args:
+            ids (Iterable[Hashable]): job ids
+
+        Returns:
+            FeatureMatrix: matrix aligned with ids
+        """
+        ids = pd.Index(ids)
+        positions = self.ids.get_indexer(ids)
+        found = positions >= 0
+        selector = coo_matrix(
+            (
+                np.ones(found.sum(), dtype=np.float32),
+                (np.flatnonzero(found), positions[found]),
+            ),
+            shape=(len(ids), len(self.ids)),
+        ).tocsr()
+        return FeatureMatrix(selector @ self.matrix, ids, self.features)
+
+    def aggregate(self, groups: pd.Series) -> pd.DataFrame:
+        """Sum the features of the job adverts in each group, as a sparse matrix product.
+
+        Args:
+            groups (pd.Series): group of each job advert (eg. ITL1 region),
+                indexed by job id. Job adverts without a group are left out.
+
+        Returns:
+            pd.DataFrame: (n_groups, n_features) sums
+        """
+        groups = groups.reindex(self.ids)
+        codes, uniques = pd.factorize(groups, sort=True)
+        has_group = codes >= 0
+        indicator = csr_matrix(
+            (
+                np.ones(has_group.sum(), dtype=np.float32),
+                (codes[has_group], np.flatnonzero(has_group)),
+            ),
+            shape=(len(uniques), len(self.ids)),
+        )
+        return pd.DataFrame(
+            (indicator @ self.matrix).toarray(),
+            index=pd.Index(uniques, name=groups.name),
+            columns=self.features,
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        """Get the matrix as a dense dataframe, for small matrices."""
+        return pd.DataFrame(
+            self.matrix.toarray(), index=self.ids, columns=self.features
+        )
+
+    @staticmethod
+    def _index_path(file_path: Union[str, Path]) -> Path:
+        file_path = Path(file_path)
+        return file_path.with_name(f"{file_path.stem}_index.npz")
+
+    def save(self, file_path: Union[str, Path]):
+        """Save the matrix to a .npz file, and the ids and features next to it.
+
+        Args:
+            file_path (Union[str, Path]): path to the .npz file
+        """
+        Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+        save_npz(file_path, self.matrix)
+        np.savez(
+            self._index_path(file_path),
+            ids=np.array(self.ids, dtype=object),
+            features=np.array(self.features, dtype=object),
+        )
+
+    @classmethod
+    def load(cls, file_path: Union[str, Path]) -> "FeatureMatrix":
+        """Load a matrix saved with save().
+
+        Args:
+            file_path (Union[str, Path]): path to the .npz file
+
+        Returns:
+            FeatureMatrix: the loaded matrix
+        """
+        index = np.load(cls._index_path(file_path), allow_pickle=True)
+        return cls(
+            load_npz(file_path), index["ids"].tolist(), index["features"].tolist()
+        )
+
+
+class FeatureMatrixBuilder:
+    """
+    Collects job quality signals from different sources into a FeatureMatrix.
+    """
+
+    def __init__(self):
+        self._ids: List[np.ndarray] = []
+        self._features: List[np.ndarray] = []
+        self._weights: List[np.ndarray] = []
+
+    def add(
+        self,
+        ids: Iterable[Hashable],
+        features: Iterable[str],
+        weights: Optional[Iterable[float]] = None,
+        prefix: str = "",
+    ) -> "FeatureMatrixBuilder":
+        """Add (job id, feature, weight) signals. Missing features are ignored.
+
+        Args:
+            ids (Iterable[Hashable]): job id of each signal
+            features (Iterable[str]): feature of each signal, eg. a subcategory
+            weights (Optional[Iterable[float]], optional): weight of each signal.
+                Defaults to 1 for every signal, ie. counts.
+            prefix (str, optional): prefix for the feature names, to keep the
+                features of different sources apart. Defaults to "".
+
+        Returns:
+            FeatureMatrixBuilder: the updated builder
+        """
+        signals = pd.DataFrame({"id": list(ids), "feature": list(features)})
+        signals["weight"] = 1.0 if weights is None else list(weights)
+        signals = signals.dropna(subset=["feature", "weight"])
+        self._ids.append(signals["id"].to_numpy())
+        self._features.append((prefix + signals["feature"].astype(str)).to_numpy())
+        self._weights.append(signals["weight"].to_numpy(dtype=np.float32))
+        return self
+
+    def add_keyword_hits(
+        self,
+        keyword_hits: pd.DataFrame,
+        id_col: str = "job_id",
+        feature_col: str = "subcategory",
+        prefix: str = "",
+    ) -> "FeatureMatrixBuilder":
+        """Add keyword hits, eg. the output of keyword_search.py, with one row per
+        sentence and keyword found. Each hit counts once.
+
+        Args:
+            keyword_hits (pd.DataFrame): keyword hits
+            id_col (str, optional): column with the job id. Defaults to "job_id".
+            feature_col (str, optional): column with the feature. Defaults to "subcategory".
+            prefix (str, optional): prefix for the feature names. Defaults to "".
+
+        Returns:
+            FeatureMatrixBuilder: the updated builder
+        """
+        return self.add(keyword_hits[id_col], keyword_hits[feature_col], prefix=prefix)
+
+    def add_ner_spans(
+        self,
+        spans: pd.DataFrame,
+        id_col: str = "job_id",
+        label_col: str = "label",
+        prefix: str = "",
+    ) -> "FeatureMatrixBuilder":
+        """Add NER spans (predicted or labelled in Prodigy), with one row per span.
+        Each span counts once.
+
+        Args:
+            spans (pd.DataFrame): NER spans
+            id_col (str, optional): column with the job id. Defaults to "job_id".
+            label_col (str, optional): column with the span label. Defaults to "label".
+            prefix (str, optional): prefix for the feature names. Defaults to "".
+
+        Returns:
+            FeatureMatrixBuilder: the updated builder
+        """
+        return self.add(spans[id_col], spans[label_col], prefix=prefix)
+
+    def add_classifier_scores(
+        self,
+        scores: pd.DataFrame,
+        id_col: str = "id",
+        score_cols: Optional[List[str]] = None,
+        threshold: float = 0.0,
+        prefix: str = "",
+    ) -> "FeatureMatrixBuilder":
+        """Add classifier outputs, with one row per job advert and one score
+        (eg. probability) column per feature.
+
+        Args:
+            scores (pd.DataFrame): classifier scores
+            id_col (str, optional): column with the job id. Defaults to "id".
+            score_cols (Optional[List[str]], optional): score columns, named
+                after their feature. Defaults to every column except id_col.
+            threshold (float, optional): scores at or below the threshold are
+                left out, to keep the matrix sparse. Defaults to 0.
+            prefix (str, optional): prefix for the feature names. Defaults to "".
+
+        Returns:
+            FeatureMatrixBuilder: the updated builder
+        """
+        score_cols = score_cols or [col for col in scores.columns if col != id_col]
+        long_scores = scores.melt(
+            id_vars=id_col,
+            value_vars=score_cols,
+            var_name="feature",
+            value_name="score",
+        )
+        long_scores = long_scores[long_scores["score"] > threshold]
+        return self.add(
+            long_scores[id_col],
+            long_scores["feature"],
+            long_scores["score"],
+            prefix=prefix,
+        )
+
+    def build(
+        self,
+        ids: Optional[Iterable[Hashable]] = None,
+        features: Optional[List[str]] = None,
+    ) -> FeatureMatrix:
+        """Build the matrix, summing the weights of the same job id and feature.
+
+        Args:
+            ids (Optional[Iterable[Hashable]], optional): job ids of the rows, eg.
+                every job advert in the sample, so job adverts without signals
+                get empty rows. Defaults to the job ids with signals, in the order
+                they were added.
+            features (Optional[List[str]], optional): features of the columns.
+                Defaults to every feature added, sorted.
+
+        Returns:
+            FeatureMatrix: the job advert x feature matrix
+        """
+        signal_ids = pd.Series(
+            np.concatenate(self._ids) if self._ids else np.empty(0, dtype=object)
+        )
+        signal_features = (
+            np.concatenate(self._features) if self._features else np.empty(0, object)
+        )
+        weights = (
+            np.concatenate(self._weights)
+            if self._weights
+            else np.empty(0, dtype=np.float32)
+        )
+        ids = pd.Index(signal_ids.unique() if ids is None else ids)
+        features = sorted(set(signal_features)) if features is None else features
+
+        rows = ids.get_indexer(signal_ids)
+        columns = pd.Index(features).get_indexer(signal_features)
+        keep = (rows >= 0) & (columns >= 0)
+        matrix = coo_matrix(
+            (weights[keep], (rows[keep], columns[keep])),
+            shape=(len(ids), len(features)),
+        ).tocsr()
+        matrix.sum_duplicates()
+        return FeatureMatrix(matrix, ids, features)
@@ -0,0 +1,124 @@
+"""
+Check that importing the package stays fast, so CLI tools and worker processes
+don't pay for S3 clients, models or config files they may never use.
+
+Each module is imported in a fresh interpreter with `python -X importtime`, and
+the check fails if the import takes longer than its budget (best of a few runs)
+or imports a module that should only be imported when it is used (eg. boto3).
+
+To run the check, run the following command from the root directory:
+
+make import-time
+
+or
+
+python -m dap_job_quality.utils.import_time
+"""
+import plac
+
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Seconds each module may take to import, including the modules it imports
+IMPORT_BUDGETS = {
+    "dap_job_quality": 0.05,
+    "dap_job_quality.getters.data_getters": 1.0,
+    "dap_job_quality.getters.ojo_getters": 1.0,
+    "dap_job_quality.utils.incremental": 1.0,
+    "dap_job_quality.utils.text_cleaning": 0.25,
+    "dap_job_quality.utils.bert_vectorizer": 1.0,
+}
+# Modules that are only imported when they are used
+LAZY_MODULES = ["boto3", "botocore", "torch", "sentence_transformers"]
+
+compiled_importtime_pattern = re.compile(
+    r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$"
+)
+
+
+def parse_importtime(stderr: str, package: str) -> float:
+    """Get the time taken to import a package's modules from `-X importtime` output.
+
+    Args:
+        stderr (str): output of `python -X importtime`
+        package (str): top level package, eg. "dap_job_quality"
+
+    Returns:
+        float: seconds, including the modules they import
+    """
+    microseconds = 0
+    for line in stderr.splitlines():
+        match = compiled_importtime_pattern.match(line)
+        # the package's modules are imported one after another at the top level
+        if match and match.group(3) == " " and match.group(4).startswith(package):
+            microseconds += int(match.group(2))
+    return microseconds / 1e6
+
+
+def time_import(module: str) -> Tuple[float, List[str]]:
+    """Import a module in a fresh interpreter.
+
+    Args:
+        module (str): module to import
+
+    Returns:
+        Tuple[float, List[str]]: seconds taken and the LAZY_MODULES it imported
+    """
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            f"import sys, {module}; "
+            f"print(','.join(m for m in {LAZY_MODULES} if m in sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    lazy_modules_imported = [m for m in result.stdout.strip().split(",") if m]
+    return parse_importtime(result.stderr, module.split(".")[0]), lazy_modules_imported
+
+
+def check_import_times(
+    budgets: Dict[str, float] = IMPORT_BUDGETS, repeats: int = 3
+) -> List[str]:
+    """Check the import time of each module against its budget.
+
+    Args:
+        budgets (Dict[str, float], optional): module to seconds.
+            Defaults to IMPORT_BUDGETS.
+        repeats (int, optional): number of imports of each module, of which the
+            fastest is compared to the budget. Defaults to 3.
+
+    Returns:
+        List[str]: the failures, empty if every module is within budget
+    """
+    failures = []
+    for module, budget in budgets.items():
+        timings = [time_import(module) for _ in range(repeats)]
+        seconds = min(seconds for seconds, _ in timings)
+        lazy_modules_imported = timings[0][1]
+        print(f"{module}: {seconds:.3f}s (budget {budget:.3f}s)")
+        if seconds > budget:
+            failures.append(f"{module} took {seconds:.3f}s to import (> {budget}s)")
+        if lazy_modules_imported:
+            failures.append(f"{module} imports {', '.join(lazy_modules_imported)}")
+    return failures
+
+
+@plac.annotations(
+    repeats=("repeats", "option", "r", int),
+)
+def main(repeats: int = 3):
+    failures = check_import_times(repeats=repeats)
+    if failures:
+        print("\n".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    plac.call(main)
@@ -0,0 +1,237 @@
+"""
+Functions to process job adverts incrementally, one date partition at a time.
+
+Job adverts are partitioned by their `created` date, and a manifest saved next
+to the outputs records a hash of the input rows of every partition a stage has
+processed. When the stage is run again, only the partitions that are new or
+whose inputs have changed are processed, and the outputs of the other
+partitions are reused. Changing the stage version (eg. a hash of the keyword
+list or of the stage's parameters) reprocesses every partition.
+
+Outputs and manifests can be saved locally or to S3 (with an "s3://" prefix).
+"""
+from datetime import datetime
+from hashlib import blake2b
+import json
+import posixpath
+from typing import Callable, Dict, Iterable, List, Optional
+
+import fsspec
+import pandas as pd
+
+from dap_job_quality import logger
+
+MANIFEST_FILE = "_manifest.json"
+UNKNOWN_PARTITION = "unknown"
+
+
+def hash_dataframe(df: pd.DataFrame) -> str:
+    """Hash the rows of a dataframe. The hash does not depend on the order of
+    the rows, so a partition that is read back in a different order is unchanged.
+
+    Args:
+        df (pd.DataFrame): dataframe to hash
+
+    Returns:
+        str: hex digest
+    """
+    try:
+        row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    except TypeError:
+        # columns of unhashable objects, eg. dicts read from structured parquet
+        row_hashes = pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy()
+    digest = blake2b(digest_size=16)
+    digest.update(str(list(df.columns)).encode())
+    digest.update(str(len(row_hashes)).encode())
+    # uint64 sums wrap around, which keeps the hash order independent
+    digest.update(int(row_hashes.sum()).to_bytes(8, "big"))
+    digest.update(int(((row_hashes >> 1) ** 2).sum()).to_bytes(8, "big"))
+    return digest.hexdigest()
+
+
+def hash_object(obj) -> str:
+    """Hash a JSON serialisable object, eg. a stage's parameters or keyword list.
+
+    Args:
+        obj: JSON serialisable object
+
+    Returns:
+        str: hex digest
+    """
+    return blake2b(
+        json.dumps(obj, sort_keys=True, default=str).encode(), digest_size=16
+    ).hexdigest()
+
+
+def date_partitions(
+    dates: pd.Series, freq: str = "D", unknown: str = UNKNOWN_PARTITION
+) -> pd.Series:
+    """Label dates with the partition they fall in.
+
+    Args:
+        dates (pd.Series): dates, eg. the created column of the OJO data
+        freq (str, optional): pandas period frequency of the partitions, eg.
+            "D" for days or "M" for months. Defaults to "D".
+        unknown (str, optional): partition of missing or unparseable dates.
+            Defaults to UNKNOWN_PARTITION.
+
+    Returns:
+        pd.Series: partition labels, eg. "2023-01-31" for days or "2023-01" for months
+    """
+    periods = pd.to_datetime(dates, errors="coerce").dt.to_period(freq)
+    return periods.astype(str).where(periods.notna(), unknown)
+
+
+class PartitionManifest:
+    """
+    Record of the partitions a stage has processed and the hashes of their inputs.
+    """
+
+    def __init__(self, output_dir: str, stage: str, version: str = ""):
+        """
+        Args:
+            output_dir (str): local or s3:// directory of the stage's outputs
+            stage (str): name of the stage
+            version (str, optional): version of the stage. Partitions processed
+                by another version are out of date. Defaults to "".
+        """
+        self.path = f"{str(output_dir).rstrip('/')}/{MANIFEST_FILE}"
+        self.stage = stage
+        self.version = version
+        self.partitions: Dict[str, dict] = {}
+
+        fs, fs_path = fsspec.core.url_to_fs(self.path)
+        if fs.exists(fs_path):
+            with fs.open(fs_path, "r") as f:
+                manifest = json.load(f)
+            if manifest.get("stage") == stage and manifest.get("version") == version:
+                self.partitions = manifest["partitions"]
+            else:
+                logger.info(
+                    f"{stage} version has changed - all partitions will be reprocessed"
+                )
+
+    def is_current(self, partition: str, input_hash: str) -> bool:
+        """Whether a partition has been processed with the same inputs."""
+        return self.partitions.get(partition, {}).get("input_hash") == input_hash
+
+    def record(self, partition: str, input_hash: str, n_rows: int):
+        """Record that a partition has been processed."""
+        self.partitions[partition] = {
+            "input_hash": input_hash,
+            "n_rows": n_rows,
+            "processed_at": datetime.now().isoformat(timespec="seconds"),
+        }
+
+    def save(self):
+        """Save the manifest next to the stage's outputs."""
+        fs, fs_path = fsspec.core.url_to_fs(self.path)
+        fs.makedirs(posixpath.dirname(fs_path), exist_ok=True)
+        with fs.open(fs_path, "w") as f:
+            json.dump(
+                {
+                    "stage": self.stage,
+                    "version": self.version,
+                    "partitions": dict(sorted(self.partitions.items())),
+                },
+                f,
+                indent=2,
+            )
+
+
+def partition_path(output_dir: str, partition: str) -> str:
+    """Path to the output of a partition."""
+    return f"{str(output_dir).rstrip('/')}/{partition}.parquet"
+
+
+def run_incremental(
+    df: pd.DataFrame,
+    process_fn: Callable[[pd.DataFrame], pd.DataFrame],
+    output_dir: str,
+    stage: str,
+    version: str = "",
+    date_col: str = "created",
+    freq: str = "D",
+    hash_fn: Callable[[pd.DataFrame], str] = hash_dataframe,
+) -> List[str]:
+    """Process the new or changed date partitions of a dataframe and save the
+    output of each one to output_dir.
+
+    Args:
+        df (pd.DataFrame): input rows, eg. OJO job adverts
+        process_fn (Callable[[pd.DataFrame], pd.DataFrame]): stage to run on
+            the rows of a partition
+        output_dir (str): local or s3:// directory for the outputs and manifest
+        stage (str): name of the stage
+        version (str, optional): version of the stage, eg. hash_object() of its
+            parameters. Defaults to "".
+        date_col (str, optional): date column to partition on. Defaults to "created".
+        freq (str, optional): pandas period frequency of the partitions.
+            Defaults to "D".
+        hash_fn (Callable[[pd.DataFrame], str], optional): function hashing the
+            inputs of a partition, which can also hash any inputs joined to it.
+            Defaults to hash_dataframe.
+
+    Returns:
+        List[str]: the partitions that were processed
+    """
+    manifest = PartitionManifest(output_dir, stage, version)
+    processed = []
+    for partition, partition_df in df.groupby(
+        date_partitions(df[date_col], freq).to_numpy(), sort=True
+    ):
+        input_hash = hash_fn(partition_df)
+        if manifest.is_current(partition, input_hash):
+            continue
+        output = process_fn(partition_df)
+        path = partition_path(output_dir, partition)
+        fs, fs_path = fsspec.core.url_to_fs(path)
+        fs.makedirs(posixpath.dirname(fs_path), exist_ok=True)
+        output.to_parquet(path, index=False)
+        manifest.record(partition, input_hash, len(partition_df))
+        # save as we go, so an interrupted run resumes where it stopped
+        manifest.save()
+        processed.append(partition)
+    # also when there were no partitions, so that load_partitions() finds it
+    manifest.save()
+
+    logger.info(
+        f"{stage}: processed {len(processed)} new or changed partitions, "
+        f"reused {len(manifest.partitions) - len(processed)}"
+    )
+    return processed
+
+
+def load_partitions(
+    output_dir: str,
+    partitions: Optional[Iterable[str]] = None,
+    columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """Load and concatenate the outputs of a stage's partitions.
+
+    Args:
+        output_dir (str): local or s3:// directory of the stage's outputs
+        partitions (Optional[Iterable[str]], optional): partitions to load.
+            Defaults to every partition in the manifest.
+        columns (Optional[List[str]], optional): columns of the stage's outputs,
+            for the empty dataframe returned if there are no partitions.
+            Defaults to None.
+
+    Returns:
+        pd.DataFrame: the outputs of the partitions
+    """
+    if partitions is None:
+        fs, fs_path = fsspec.core.url_to_fs(
+            f"{str(output_dir).rstrip('/')}/{MANIFEST_FILE}"
+        )
+        with fs.open(fs_path, "r") as f:
+            partitions = json.load(f)["partitions"]
+    if not partitions:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(
+        [
+            pd.read_parquet(partition_path(output_dir, partition))
+            for partition in sorted(partitions)
+        ],
+        ignore_index=True,
+    )
@@ -0,0 +1,350 @@
+"""
+Lightweight instrumentation of the pipeline's stages, reported through the package logger.
+
+- stage(): context manager and decorator timing a stage (eg. loading the OJO sample or
+    merging the salary tables), logging its wall time and peak RSS
+- timed(): decorator for functions called many times (eg. clean_text on every job
+    advert), which only accumulates their calls and time
+- increment(): counters, eg. rows in and out, cache hits and S3 bytes transferred
+- run_report(): context manager around a whole run, which samples the peak RSS in
+    the background and saves a JSON report of every stage and counter to
+    outputs/reports/runs/
+
+Metrics are recorded per process. map_chunks(executor="process") returns the
+stages and counters recorded in its worker processes with each chunk's result
+and merges them into the parent's (with collect_metrics() and merge_metrics()),
+so eg. clean_text timings and text_cache counters of a process pool are in the
+run report. The peak RSS of a stage run in a worker is the worker's, and the
+run's peak RSS is the parent's only.
+
+Set the DAP_JOB_QUALITY_PROFILE environment variable to "cprofile" or "pyinstrument"
+to also profile the run, eg.
+
+DAP_JOB_QUALITY_PROFILE=cprofile python dap_job_quality/pipeline/keyword_search.py
+
+which saves the profile next to the report (a .prof file to open with snakeviz or
+pstats, or an .html file for pyinstrument).
+"""
+from collections import defaultdict
+from contextlib import ContextDecorator, contextmanager
+from datetime import datetime
+import functools
+import json
+import os
+from pathlib import Path
+import resource
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterator, Optional
+
+from dap_job_quality import PROJECT_DIR, logger
+
+REPORTS_DIR = PROJECT_DIR / "outputs/reports/runs"
+PROFILE_ENV_VAR = "DAP_JOB_QUALITY_PROFILE"
+
+_lock = threading.Lock()
+_stages: Dict[str, dict] = defaultdict(
+    lambda: {"calls": 0, "seconds": 0.0, "peak_rss_mb": 0.0}
+)
+_counters: Dict[str, float] = defaultdict(int)
+
+
+def current_rss_mb() -> float:
+    """Get the resident set size of this process in MB, or its peak RSS where
+    the current one isn't available (eg. macOS)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """Get the peak resident set size of this process so far in MB."""
+    # ru_maxrss is in kilobytes on linux (and bytes on macOS)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_rss /= 1024
+    return peak_rss / 1024
+
+
+class _RSSSampler:
+    """
+    Background thread sampling the RSS, to get the peak RSS of each active stage.
+    """
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.active: Dict[int, float] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self) -> float:
+        rss = current_rss_mb()
+        with _lock:
+            for key, peak in self.active.items():
+                self.active[key] = max(peak, rss)
+        return rss
+
+    def enter(self, key: int):
+        rss = current_rss_mb()
+        with _lock:
+            self.active[key] = rss
+
+    def exit(self, key: int) -> float:
+        rss = current_rss_mb()
+        with _lock:
+            return max(self.active.pop(key, rss), rss)
+
+
+_sampler = _RSSSampler()
+
+
+class stage(ContextDecorator):
+    """
+    Time a stage and record its peak RSS, as a context manager or a decorator:
+
+        with stage("load_ojo_sample"):
+            ...
+
+        @stage("merge_ojo_df")
+        def merge_ojo_df(...):
+    """
+
+    def __init__(self, name: str, log: bool = True):
+        """
+        Args:
+            name (str): name of the stage
+            log (bool, optional): whether to log the stage's time and peak RSS
+                when it finishes. Defaults to True.
+        """
+        self.name = name
+        self.log = log
+        self._starts = threading.local()
+
+    def __enter__(self):
+        starts = getattr(self._starts, "stack", None)
+        if starts is None:
+            starts = self._starts.stack = []
+        key = id(object())
+        starts.append((time.perf_counter(), key))
+        _sampler.enter(key)
+        return self
+
+    def __exit__(self, *exc):
+        start_time, key = self._starts.stack.pop()
+        seconds = time.perf_counter() - start_time
+        rss = _sampler.exit(key)
+        with _lock:
+            record = _stages[self.name]
+            record["calls"] += 1
+            record["seconds"] += seconds
+            record["peak_rss_mb"] = max(record["peak_rss_mb"], rss)
+        if self.log:
+            logger.info(f"{self.name} took {seconds:.1f}s, peak RSS {rss:.0f}MB")
+        return False
+
+
+def timed(name: str) -> Callable:
+    """Decorator accumulating the calls and time of a function that is called
+    many times, without logging or sampling the RSS.
+
+    Args:
+        name (str): name of the stage
+
+    Returns:
+        Callable: decorator
+    """
+
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                # not locked, as this is called in hot loops: the counts are
+                # approximate if the function runs in several threads at once
+                record = _stages[name]
+                record["calls"] += 1
+                record["seconds"] += time.perf_counter() - start_time
+
+        return wrapper
+
+    return decorator
+
+
+def increment(name: str, value: float = 1):
+    """Add to a counter, eg. increment("keyword_search.rows_in", len(df)).
+
+    Args:
+        name (str): name of the counter
+        value (float, optional): amount to add. Defaults to 1.
+    """
+    with _lock:
+        _counters[name] += value
+
+
+def get_metrics() -> dict:
+    """Get the stages and counters recorded so far.
+
+    Returns:
+        dict: stages (calls, seconds and, except for timed() functions, peak
+            RSS of each) and counters
+    """
+    with _lock:
+        return {
+            "stages": {
+                name: {
+                    "calls": record["calls"],
+                    "seconds": round(record["seconds"], 3),
+                    # timed() functions don't sample the RSS
+                    **(
+                        {"peak_rss_mb": round(record["peak_rss_mb"], 1)}
+                        if record["peak_rss_mb"]
+                        else {}
+                    ),
+                }
+                for name, record in _stages.items()
+            },
+            "counters": dict(_counters),
+        }
+
+
+def reset_metrics():
+    """Forget the stages and counters recorded so far."""
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+
+def collect_metrics() -> dict:
+    """Get and forget the stages and counters recorded so far, eg. in a worker
+    process, to send them to the parent with merge_metrics().
+
+    Returns:
+        dict: stages (calls, seconds and peak RSS of each) and counters
+    """
+    with _lock:
+        metrics = {
+            "stages": {name: dict(record) for name, record in _stages.items()},
+            "counters": dict(_counters),
+        }
+        _stages.clear()
+        _counters.clear()
+    return metrics
+
+
+def merge_metrics(metrics: dict):
+    """Add the stages and counters collected with collect_metrics(), eg. in a
+    worker process, to those recorded in this one.
+
+    Args:
+        metrics (dict): stages and counters from collect_metrics()
+    """
+    with _lock:
+        for name, record in metrics["stages"].items():
+            merged = _stages[name]
+            merged["calls"] += record["calls"]
+            merged["seconds"] += record["seconds"]
+            merged["peak_rss_mb"] = max(merged["peak_rss_mb"], record["peak_rss_mb"])
+        for name, value in metrics["counters"].items():
+            _counters[name] += value
+
+
+@contextmanager
+def _profiler(profile_path: Path) -> Iterator[None]:
+    """Profile the block with the profiler named in PROFILE_ENV_VAR, if any."""
+    profiler_name = os.environ.get(PROFILE_ENV_VAR, "").lower()
+    if profiler_name == "cprofile":
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(profile_path.with_suffix(".prof"))
+            logger.info(f"Saved profile to {profile_path.with_suffix('.prof')}")
+    elif profiler_name == "pyinstrument":
+        from pyinstrument import Profiler
+
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            profile_path.with_suffix(".html").write_text(profiler.output_html())
+            logger.info(f"Saved profile to {profile_path.with_suffix('.html')}")
+    else:
+        if profiler_name:
+            logger.warning(f"Unknown profiler {profiler_name}, not profiling")
+        yield
+
+
+@contextmanager
+def run_report(
+    run_name: str, reports_dir: Path = REPORTS_DIR, sample_interval: float = 0.1
+) -> Iterator[dict]:
+    """Record the stages and counters of a run and save them as a JSON report.
+
+    Args:
+        run_name (str): name of the run, eg. the script's name
+        reports_dir (Path, optional): where to save the report. Defaults to REPORTS_DIR.
+        sample_interval (float, optional): seconds between RSS samples. Defaults to 0.1.
+
+    Yields:
+        Iterator[dict]: the report, which is filled in when the run finishes
+    """
+    started_at = datetime.now()
+    report_path = (
+        Path(reports_dir) / f"{run_name}_{started_at.strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    report = {"run": run_name, "started_at": started_at.isoformat(timespec="seconds")}
+
+    reset_metrics()
+    _sampler.interval = sample_interval
+    _sampler.start()
+    start_time = time.perf_counter()
+    status = "failed"
+    try:
+        with _profiler(report_path), stage(run_name, log=False):
+            yield report
+        status = "succeeded"
+    finally:
+        _sampler.stop()
+        report.update(
+            {
+                "status": status,
+                "command": " ".join(sys.argv),
+                "seconds": round(time.perf_counter() - start_time, 3),
+                "peak_rss_mb": round(peak_rss_mb(), 1),
+                **get_metrics(),
+            }
+        )
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info(
+            f"{run_name} {status} in {report['seconds']:.1f}s, peak RSS "
+            f"{report['peak_rss_mb']:.0f}MB - report saved to {report_path}"
+        )
@@ -0,0 +1,349 @@
+"""
+Functions and an index to find near-duplicate job adverts (eg. reposts with
+small edits) with MinHash signatures and locality sensitive hashing (LSH).
+
+Cleaned job descriptions are split into word shingles, each job advert gets a
+MinHash signature whose agreement with another signature estimates the Jaccard
+similarity of their shingles, and signatures are split into bands so that only
+job adverts sharing a band are compared. Signatures and band hashes are held in
+numpy arrays rather than Python objects, so the index scales to millions of job
+adverts on one machine.
+"""
+from pathlib import Path
+import re
+from typing import Hashable, Iterable, List, Optional, Tuple, Union
+from zlib import crc32
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from dap_job_quality.utils.text_cleaning import clean_text
+
+compiled_token_pattern = re.compile(r"[a-z0-9]+")
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def shingle_hashes(text: str, shingle_size: int = 3) -> np.ndarray:
+    """Hash the word shingles of a cleaned job description.
+
+    Args:
+        text (str): job description, cleaned with clean_text()
+        shingle_size (int, optional): number of words per shingle. Defaults to 3.
+
+    Returns:
+        np.ndarray: unique 32 bit shingle hashes
+    """
+    tokens = compiled_token_pattern.findall(str(text).lower())
+    if len(tokens) < shingle_size:
+        shingles = [" ".join(tokens)]
+    else:
+        shingles = [
+            " ".join(tokens[i : i + shingle_size])
+            for i in range(len(tokens) - shingle_size + 1)
+        ]
+    return np.unique(
+        np.fromiter(
+            (crc32(shingle.encode()) for shingle in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+    )
+
+
+def lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """Choose the number of bands and rows per band that minimise the sum of
+    the false positive and false negative probabilities at a Jaccard threshold.
+
+    Args:
+        threshold (float): Jaccard similarity threshold
+        num_perm (int): number of MinHash permutations
+
+    Returns:
+        Tuple[int, int]: number of bands, number of rows per band
+    """
+    similarities, step = np.linspace(0, 1, 1001, retstep=True)
+    best, best_error = (1, num_perm), np.inf
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands:
+            continue
+        rows = num_perm // bands
+        candidate_prob = 1 - (1 - similarities**rows) ** bands
+        below = similarities < threshold
+        false_positive = candidate_prob[below].sum() * step
+        false_negative = (1 - candidate_prob[~below]).sum() * step
+        if false_positive + false_negative < best_error:
+            best, best_error = (bands, rows), false_positive + false_negative
+    return best
+
+
+class MinHashLSH:
+    """
+    Incremental MinHash LSH index of job adverts.
+
+    Memory is roughly (4 x num_perm + 8 x bands) bytes per job advert, ie.
+    about 600MB for a million job adverts with the defaults.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_perm: int = 128,
+        shingle_size: int = 3,
+        seed: int = 1,
+        clean: bool = True,
+    ):
+        """
+        Args:
+            threshold (float, optional): Jaccard similarity above which two job
+                adverts are near-duplicates. Defaults to 0.8.
+            num_perm (int, optional): number of MinHash permutations. Defaults to 128.
+            shingle_size (int, optional): number of words per shingle. Defaults to 3.
+            seed (int, optional): seed for the MinHash permutations. Defaults to 1.
+            clean (bool, optional): whether to apply clean_text() to descriptions
+                before shingling. Defaults to True.
+        """
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+        self.clean = clean
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._band_multipliers = rng.randint(
+            1, 1 << 62, size=self.rows, dtype=np.uint64
+        )
+
+        self.keys: List[Hashable] = []
+        self._signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self._band_hashes = np.empty((0, self.bands), dtype=np.uint64)
+        self._sorted_order: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def signature(self, text: str) -> np.ndarray:
+        """Get the MinHash signature of a job description.
+
+        Args:
+            text (str): job description
+
+        Returns:
+            np.ndarray: (num_perm,) uint32 signature
+        """
+        if self.clean:
+            text = clean_text(text)
+        hashes = shingle_hashes(text, self.shingle_size)
+        # universal hashing (a * x + b) mod p of every shingle for every permutation
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME
+        return (permuted & _MAX_HASH).min(axis=1).astype(np.uint32)
+
+    def signatures(self, texts: Iterable[str]) -> np.ndarray:
+        """Get the MinHash signatures of job descriptions.
+
+        Args:
+            texts (Iterable[str]): job descriptions
+
+        Returns:
+            np.ndarray: (n, num_perm) uint32 signatures
+        """
+        signatures = [self.signature(text) for text in texts]
+        if not signatures:
+            return np.empty((0, self.num_perm), dtype=np.uint32)
+        return np.stack(signatures)
+
+    def _hash_bands(self, signatures: np.ndarray) -> np.ndarray:
+        """Hash each band of rows of the signatures to a single 64 bit value."""
+        bands = signatures[:, : self.bands * self.rows].reshape(
+            len(signatures), self.bands, self.rows
+        )
+        return (bands.astype(np.uint64) * self._band_multipliers).sum(axis=2)
+
+    def _sorted_index(self) -> np.ndarray:
+        """Per band order of the indexed job adverts by band hash, rebuilt lazily."""
+        if self._sorted_order is None:
+            self._sorted_order = np.argsort(self._band_hashes, axis=0, kind="stable")
+        return self._sorted_order
+
+    def _verify(
+        self, left: np.ndarray, right: np.ndarray, batch_size: int = 100000
+    ) -> np.ndarray:
+        """Estimate the Jaccard similarity of pairs of indexed job adverts."""
+        similarities = np.empty(len(left), dtype=np.float32)
+        for start in range(0, len(left), batch_size):
+            end = start + batch_size
+            similarities[start:end] = (
+                self._signatures[left[start:end]] == self._signatures[right[start:end]]
+            ).mean(axis=1)
+        return similarities
+
+    def _candidates(self, band_hashes: np.ndarray) -> List[np.ndarray]:
+        """Indices of the indexed job adverts sharing a band with each query."""
+        order = self._sorted_index()
+        candidates = [[] for _ in range(len(band_hashes))]
+        for band in range(self.bands):
+            sorted_hashes = self._band_hashes[order[:, band], band]
+            starts = np.searchsorted(sorted_hashes, band_hashes[:, band], "left")
+            ends = np.searchsorted(sorted_hashes, band_hashes[:, band], "right")
+            for query in np.flatnonzero(ends > starts):
+                candidates[query].append(order[starts[query] : ends[query], band])
+        return [
+            np.unique(np.concatenate(c)) if c else np.empty(0, dtype=int)
+            for c in candidates
+        ]
+
+    def query(self, texts: Iterable[str]) -> List[List[Tuple[Hashable, float]]]:
+        """Find the indexed near-duplicates of job descriptions.
+
+        Args:
+            texts (Iterable[str]): job descriptions
+
+        Returns:
+            List[List[Tuple[Hashable, float]]]: for each description, the keys
+                of the indexed near-duplicates and their estimated Jaccard similarity
+        """
+        signatures = self.signatures(texts)
+        if len(self) == 0:
+            return [[] for _ in range(len(signatures))]
+        results = []
+        for signature, candidates in zip(
+            signatures, self._candidates(self._hash_bands(signatures))
+        ):
+            similarities = (self._signatures[candidates] == signature).mean(axis=1)
+            keep = similarities >= self.threshold
+            results.append(
+                [
+                    (self.keys[index], float(similarity))
+                    for index, similarity in zip(candidates[keep], similarities[keep])
+                ]
+            )
+        return results
+
+    def insert(self, keys: Iterable[Hashable], texts: Iterable[str]) -> "MinHashLSH":
+        """Add job adverts to the index.
+
+        Args:
+            keys (Iterable[Hashable]): job advert ids
+            texts (Iterable[str]): job descriptions
+
+        Returns:
+            MinHashLSH: the updated index
+        """
+        keys = list(keys)
+        signatures = self.signatures(texts)
+        if len(keys) != len(signatures):
+            raise ValueError("keys and texts must be the same length")
+        self.keys.extend(keys)
+        self._signatures = np.concatenate([self._signatures, signatures])
+        self._band_hashes = np.concatenate(
+            [self._band_hashes, self._hash_bands(signatures)]
+        )
+        self._sorted_order = None
+        return self
+
+    def duplicate_clusters(self, max_bucket_size: int = 100) -> List[List[Hashable]]:
+        """Group the indexed job adverts into clusters of near-duplicates.
+
+        Every pair of job adverts sharing a band bucket is compared, and pairs
+        above the threshold are linked. Clusters are the connected components of
+        those links. In buckets of more than max_bucket_size job adverts (eg. of
+        a template posted thousands of times), each is only compared with the
+        next max_bucket_size - 1 in the bucket, which bounds the number of
+        comparisons but can miss pairs, and so split a cluster.
+
+        Args:
+            max_bucket_size (int, optional): largest bucket whose pairs are all
+                compared. Defaults to 100.
+
+        Returns:
+            List[List[Hashable]]: clusters of two or more job advert keys,
+                largest first
+        """
+        n = len(self)
+        if n < 2:
+            return []
+        order = self._sorted_index()
+        left, right = [], []
+        for band in range(self.bands):
+            band_order = order[:, band]
+            sorted_hashes = self._band_hashes[band_order, band]
+            # buckets are contiguous in sorted order, so the adverts still in a
+            # bucket with the one `offset` after them shrink as offset grows
+            in_bucket = np.flatnonzero(sorted_hashes[1:] == sorted_hashes[:-1])
+            offset = 1
+            while len(in_bucket) and offset < max_bucket_size:
+                left.append(band_order[in_bucket])
+                right.append(band_order[in_bucket + offset])
+                offset += 1
+                in_bucket = in_bucket[in_bucket + offset < n]
+                in_bucket = in_bucket[
+                    sorted_hashes[in_bucket + offset] == sorted_hashes[in_bucket]
+                ]
+        if not left:
+            return []
+        # pairs sharing several bands are verified once
+        left, right = np.concatenate(left), np.concatenate(right)
+        pairs = np.unique(np.minimum(left, right) * n + np.maximum(left, right))
+        left, right = pairs // n, pairs % n
+        keep = self._verify(left, right) >= self.threshold
+        graph = coo_matrix(
+            (np.ones(keep.sum(), dtype=np.int8), (left[keep], right[keep])),
+            shape=(n, n),
+        )
+        _, labels = connected_components(graph, directed=False)
+        cluster_sizes = np.bincount(labels)
+        clusters = {}
+        for index in np.flatnonzero(cluster_sizes[labels] > 1):
+            clusters.setdefault(labels[index], []).append(self.keys[index])
+        return sorted(clusters.values(), key=len, reverse=True)
+
+    def save(self, file_path: Union[str, Path]):
+        """Save the index to a .npz file.
+
+        Args:
+            file_path (Union[str, Path]): path to the .npz file
+        """
+        Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            file_path,
+            keys=np.array(self.keys, dtype=object),
+            signatures=self._signatures,
+            params=np.array(
+                [
+                    self.threshold,
+                    self.num_perm,
+                    self.shingle_size,
+                    self.seed,
+                    self.clean,
+                ]
+            ),
+        )
+
+    @classmethod
+    def load(cls, file_path: Union[str, Path]) -> "MinHashLSH":
+        """Load an index saved with save().
+
+        Args:
+            file_path (Union[str, Path]): path to the .npz file
+
+        Returns:
+            MinHashLSH: the loaded index
+        """
+        saved = np.load(file_path, allow_pickle=True)
+        threshold, num_perm, shingle_size, seed, clean = saved["params"]
+        index = cls(
+            threshold=float(threshold),
+            num_perm=int(num_perm),
+            shingle_size=int(shingle_size),
+            seed=int(seed),
+            clean=bool(clean),
+        )
+        index.keys = saved["keys"].tolist()
+        index._signatures = saved["signatures"]
+        index._band_hashes = index._hash_bands(index._signatures)
+        return index
@@ -0,0 +1,322 @@
+"""
+An n-gram counter that tokenizes each text once and counts n-grams of several
+lengths for every category in a single pass, so it can be used both on
+labelled spans and to mine n-grams from the whole job advert corpus.
+
+Tokens are mapped to integer ids, and each n-gram is packed into a single
+64 bit key (bits_per_token bits per token), so n-grams are counted with numpy
+and scipy sparse matrices rather than Python tuples and Counters. Texts can be
+added in chunks, and rare n-grams pruned as they are, to keep memory bounded.
+"""
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix, csr_matrix
+
+from dap_job_quality.utils import text_cleaning as tc
+
+
+class NgramCounter:
+    """
+    Counts of n-grams of several lengths per category.
+    """
+
+    def __init__(
+        self,
+        ns: Sequence[int] = (1, 2, 3),
+        tokenizer: Callable[[str], List[str]] = tc.tokenize_words,
+    ):
+        """
+        Args:
+            ns (Sequence[int], optional): lengths of the n-grams to count.
+                Defaults to (1, 2, 3).
+            tokenizer (Callable[[str], List[str]], optional): function splitting
+                a text into tokens. Defaults to text_cleaning.tokenize_words,
+                which lowercases and removes stopwords and non-alphabetic tokens.
+        """
+        self.ns = sorted(set(ns))
+        self.tokenizer = tokenizer
+        self.bits_per_token = 63 // max(self.ns)
+        self.vocabulary: Dict[str, int] = {}
+        self.tokens: List[str] = []
+        self.categories: Dict[Hashable, int] = {}
+        # per n, the n-gram keys, category ids and counts, with
+        # uncompacted chunks waiting in _pending
+        self._counts = {
+            n: (
+                np.empty(0, dtype=np.int64),
+                np.empty(0, dtype=np.int64),
+                np.empty(0, dtype=np.int64),
+            )
+            for n in self.ns
+        }
+        self._pending: Dict[int, list] = {n: [] for n in self.ns}
+
+    def _token_ids(self, texts: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Tokenize texts and map the tokens to ids.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: the token ids of all the texts
+                concatenated, and the index of the text each token belongs to
+        """
+        token_ids, text_index = [], []
+        for i, text in enumerate(texts):
+            for token in self.tokenizer(text):
+                token_id = self.vocabulary.get(token)
+                if token_id is None:
+                    token_id = self.vocabulary[token] = len(self.tokens)
+                    self.tokens.append(token)
+                token_ids.append(token_id)
+                text_index.append(i)
+        # token ids from 0 to 2^bits_per_token - 1 fit in bits_per_token bits
+        if len(self.tokens) > 1 << self.bits_per_token:
+            raise ValueError(
+                f"Vocabulary of {len(self.tokens)} tokens is too large to pack "
+                f"{max(self.ns)}-grams into 64 bit keys"
+            )
+        return np.array(token_ids, dtype=np.int64), np.array(text_index, dtype=np.int64)
+
+    def update(
+        self, texts: Iterable[str], categories: Optional[Iterable[Hashable]] = None
+    ) -> "NgramCounter":
+        """Count the n-grams of a chunk of texts.
+
+        Args:
+            texts (Iterable[str]): texts, eg. cleaned labelled spans or sentences
+            categories (Optional[Iterable[Hashable]], optional): category of each
+                text, eg. its label. If None, every text is in one category.
+
+        Returns:
+            NgramCounter: the updated counter
+        """
+        texts = list(texts)
+        categories = [None] * len(texts) if categories is None else list(categories)
+        category_ids = np.array(
+            [self.categories.setdefault(c, len(self.categories)) for c in categories],
+            dtype=np.int64,
+        )
+        token_ids, text_index = self._token_ids(texts)
+
+        for n in self.ns:
+            if len(token_ids) < n:
+                continue
+            starts = np.arange(len(token_ids) - n + 1)
+            # keep the n-grams that do not cross from one text to the next
+            starts = starts[text_index[starts] == text_index[starts + n - 1]]
+            keys = np.zeros(len(starts), dtype=np.int64)
+            for offset in range(n):
+                keys = (keys << self.bits_per_token) | token_ids[starts + offset]
+            self._pending[n].append(
+                (keys, category_ids[text_index[starts]], np.ones(len(keys), np.int64))
+            )
+            pending_size = sum(len(chunk[0]) for chunk in self._pending[n])
+            if pending_size > max(len(self._counts[n][0]), 1000000):
+                self._compact(n)
+        return self
+
+    def _compact(self, n: int):
+        """Sum the counts of the same n-gram and category."""
+        if not self._pending[n]:
+            return
+        keys, category_ids, counts = (
+            np.concatenate(arrays) for arrays in zip(self._counts[n], *self._pending[n])
+        )
+        self._pending[n] = []
+        unique_keys, key_index = np.unique(keys, return_inverse=True)
+        matrix = coo_matrix(
+            (counts, (category_ids, key_index)),
+            shape=(len(self.categories), len(unique_keys)),
+        ).tocsr()
+        matrix.sum_duplicates()
+        matrix = matrix.tocoo()
+        self._counts[n] = (
+            unique_keys[matrix.col],
+            matrix.row.astype(np.int64),
+            matrix.data.astype(np.int64),
+        )
+
+    def prune(self, min_count: int) -> "NgramCounter":
+        """Drop the n-grams counted fewer than min_count times across all categories.
+
+        Args:
+            min_count (int): minimum total count of the n-grams to keep
+
+        Returns:
+            NgramCounter: the pruned counter
+        """
+        for n in self.ns:
+            self._compact(n)
+            keys, category_ids, counts = self._counts[n]
+            unique_keys, key_index = np.unique(keys, return_inverse=True)
+            totals = np.bincount(key_index, weights=counts, minlength=len(unique_keys))
+            keep = totals[key_index] >= min_count
+            self._counts[n] = (keys[keep], category_ids[keep], counts[keep])
+        return self
+
+    def decode(self, key: int, n: int) -> Tuple[str, ...]:
+        """Convert an n-gram key back to its tokens."""
+        mask = (1 << self.bits_per_token) - 1
+        return tuple(
+            self.tokens[(int(key) >> (self.bits_per_token * (n - 1 - i))) & mask]
+            for i in range(n)
+        )
+
+    def count_matrix(self, n: int) -> Tuple[csr_matrix, np.ndarray]:
+        """Get the counts of the n-grams of length n in each category.
+
+        Args:
+            n (int): length of the n-grams
+
+        Returns:
+            Tuple[csr_matrix, np.ndarray]: (n_categories, n_ngrams) sparse
+                matrix of counts, and the n-gram key of each column
+        """
+        self._compact(n)
+        keys, category_ids, counts = self._counts[n]
+        unique_keys, key_index = np.unique(keys, return_inverse=True)
+        matrix = csr_matrix(
+            (counts, (category_ids, key_index)),
+            shape=(len(self.categories), len(unique_keys)),
+        )
+        return matrix, unique_keys
+
+    def ngram_counts(self, n: int) -> pd.Series:
+        """Get the total count of each n-gram of length n across all categories.
+
+        Args:
+            n (int): length of the n-grams
+
+        Returns:
+            pd.Series: counts indexed by n-gram (joined with spaces), most common first
+        """
+        matrix, keys = self.count_matrix(n)
+        totals = np.asarray(matrix.sum(axis=0)).ravel()
+        order = np.argsort(-totals, kind="stable")
+        return pd.Series(
+            totals[order],
+            index=[" ".join(self.decode(key, n)) for key in keys[order]],
+            name="count",
+        )
+
+    def most_common(
+        self, n: int, n_most_common: int = 10
+    ) -> Dict[Hashable, List[Tuple[Tuple[str, ...], int]]]:
+        """Get the most common n-grams of length n in each category.
+
+        Args:
+            n (int): length of the n-grams
+            n_most_common (int, optional): number of n-grams to return per
+                category. Defaults to 10.
+
+        Returns:
+            Dict[Hashable, List[Tuple[Tuple[str, ...], int]]]: category to a list
+                of (n-gram, count) tuples, sorted by count in descending order
+        """
+        matrix, keys = self.count_matrix(n)
+        most_common = {}
+        for category, row in self.categories.items():
+            start, end = matrix.indptr[row], matrix.indptr[row + 1]
+            columns, counts = matrix.indices[start:end], matrix.data[start:end]
+            # sort by count, breaking ties by n-gram key so the order is deterministic
+            top = np.lexsort((keys[columns], -counts))[:n_most_common]
+            most_common[category] = [
+                (self.decode(keys[columns[i]], n), int(counts[i])) for i in top
+            ]
+        return most_common
+
+
+def _lookup_counts(
+    matrix: csr_matrix, keys: np.ndarray, query_keys: np.ndarray
+) -> np.ndarray:
+    """Total counts of query n-gram keys, 0 for keys that are not counted (eg. pruned)."""
+    totals = np.asarray(matrix.sum(axis=0)).ravel()
+    positions = np.clip(np.searchsorted(keys, query_keys), 0, max(len(keys) - 1, 0))
+    found = (len(keys) > 0) & (keys[positions] == query_keys)
+    return np.where(found, totals[positions] if len(keys) else 0, 0)
+
+
+def collocation_scores(counter: NgramCounter, n: int) -> pd.DataFrame:
+    """Score how strongly the words of each n-gram (n > 1) go together.
+
+    The pointwise mutual information (PMI) of an n-gram compares its probability
+    to the probability of its two parts occurring independently, taking the split
+    into two parts that explains the n-gram best (eg. "flexible working hours"
+    is compared to both "flexible" x "working hours" and "flexible working" x
+    "hours"). The normalised PMI (NPMI) divides PMI by -log p(n-gram), and is
+    between -1 (never together) and 1 (only ever together).
+
+    Args:
+        counter (NgramCounter): counter of every n-gram length from 1 to n
+        n (int): length of the n-grams to score
+
+    Returns:
+        pd.DataFrame: one row per n-gram with the key, ngram, count, pmi and npmi
+    """
+    missing = set(range(1, n + 1)) - set(counter.ns)
+    if n < 2 or missing:
+        raise ValueError(f"Scoring {n}-grams needs the counts of {missing} grams")
+    matrix, keys = counter.count_matrix(n)
+    counts = np.asarray(matrix.sum(axis=0)).ravel().astype(np.float64)
+    # every probability is relative to the number of tokens, which keeps NPMI within [-1, 1]
+    n_tokens = max(counter.count_matrix(1)[0].sum(), 1)
+    log_p = np.log(counts / n_tokens)
+
+    best_split_log_p = np.full(len(keys), -np.inf)
+    for split in range(1, n):
+        right_bits = counter.bits_per_token * (n - split)
+        parts_log_p = np.zeros(len(keys))
+        for length, part_keys in [
+            (split, keys >> right_bits),
+            (n - split, keys & ((1 << right_bits) - 1)),
+        ]:
+            part_matrix, part_keys_counted = counter.count_matrix(length)
+            part_counts = _lookup_counts(part_matrix, part_keys_counted, part_keys)
+            # a pruned part occurred at least as often as the n-gram containing it
+            part_counts = np.maximum(part_counts, counts)
+            parts_log_p += np.log(part_counts / n_tokens)
+        best_split_log_p = np.maximum(best_split_log_p, parts_log_p)
+
+    pmi = log_p - best_split_log_p
+    with np.errstate(divide="ignore", invalid="ignore"):
+        npmi = np.where(log_p < 0, pmi / -log_p, 1.0)
+    return pd.DataFrame(
+        {
+            "key": keys,
+            "ngram": [" ".join(counter.decode(key, n)) for key in keys],
+            "count": counts.astype(np.int64),
+            "pmi": pmi,
+            "npmi": npmi,
+        }
+    )
+
+
+def category_association(counter: NgramCounter, n: int) -> pd.DataFrame:
+    """Score how strongly each n-gram is associated with each category, with the
+    NPMI of the n-gram and the category of the texts it occurs in.
+
+    Args:
+        counter (NgramCounter): counter updated with categories
+        n (int): length of the n-grams to score
+
+    Returns:
+        pd.DataFrame: (n_ngrams, n_categories) NPMI scores indexed by n-gram key,
+            with a column per category
+    """
+    matrix, keys = counter.count_matrix(n)
+    counts = matrix.toarray().astype(np.float64)
+    total = counts.sum()
+    p_joint = counts / total
+    p_ngram = counts.sum(axis=0, keepdims=True) / total
+    p_category = counts.sum(axis=1, keepdims=True) / total
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_p_joint = np.log(p_joint)
+        npmi = (log_p_joint - np.log(p_ngram * p_category)) / -log_p_joint
+    # n-grams never seen in a category are never together with it
+    npmi = np.where(counts > 0, npmi, -1.0)
+    npmi = np.where(np.isfinite(npmi), npmi, 1.0)
+    return pd.DataFrame(
+        npmi.T,
+        index=pd.Index(keys, name="key"),
+        columns=list(counter.categories),
+    )
@@ -2,12 +2,18 @@
 Helper functions for handling data that has been labelled in Prodigy.
 """
 
+from functools import lru_cache
 from spacy.tokens import Span, Doc
 import spacy
-import srsly
 from typing import List, Dict, Any
 
-nlp = spacy.load("en_core_web_sm")
+from dap_job_quality.getters.data_getters import scan_jsonl
+
+
+@lru_cache(maxsize=None)
+def get_nlp() -> spacy.language.Language:
+    """Load the spaCy model used to find the sentences of labelled spans, once."""
+    return spacy.load("en_core_web_sm")
 
 
 def read_accepted_lines(file: str) -> List[Dict[str, Any]]:
@@ -20,13 +26,8 @@ def read_accepted_lines(file: str) -> List[Dict[str, Any]]:
     Returns:
         List[Dict[str, Any]]: A list of dictionaries, each representing an accepted record.
     """
-    records = []
-
-    for line in srsly.read_jsonl(file):
-        if line["answer"] == "accept":
-            records.append(line)
-
-    return records
+    # the other answers are skipped before being parsed
+    return scan_jsonl(file, where={"answer": "accept"})
 
 
 def get_spans_and_sentences(
@@ -44,6 +45,7 @@ def get_spans_and_sentences(
                                          the whole sentence it belongs to, the label, and the full text of the record.
     """
     training_data = {}
+    nlp = get_nlp()
 
     for record in records:
         # convert each text to a spacy document
@@ -0,0 +1,315 @@
+"""
+Mergeable quantile sketches to estimate salary percentiles over data that is
+streamed in chunks, or split across partitions and processes.
+
+KLLSketch is a KLL sketch (Karnin, Lang and Liberty, 2016): values are kept in
+a hierarchy of compactors, where a value at level h stands for 2^h original
+values. When a level is full it is sorted and every other value (starting at
+a random offset) is promoted to the next level. Memory is O(k) whatever the
+number of values, and two sketches are merged by concatenating their levels.
+
+Error bounds: the rank of an estimated quantile is within
+normalised_rank_error(k) x n of the rank of the true quantile with 99%
+confidence. This is about 1.3% of the values for the default k=200, eg. the
+estimated 10th percentile is between the true 8.7th and 11.3th percentiles.
+Sketches that have seen fewer than about k values are exact.
+
+GroupedQuantileSketches keeps a count, sum and sketch per group and column, so
+percentile tables (eg. per occupation and region) can be built chunk by chunk
+and merged as new data arrives.
+"""
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def normalised_rank_error(k: int) -> float:
+    """Normalised rank error of a single quantile estimate from a KLL sketch,
+    with 99% confidence. Uses the empirical fit of Apache DataSketches.
+
+    Args:
+        k (int): size parameter of the sketch
+
+    Returns:
+        float: maximum error in the rank of a quantile, as a fraction of n
+    """
+    return 2.296 / k**0.9723
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch of a stream of numbers.
+    """
+
+    def __init__(self, k: int = 200, seed: Optional[int] = None):
+        """
+        Args:
+            k (int, optional): size parameter, controlling the trade off
+                between memory and accuracy. Defaults to 200.
+            seed (Optional[int], optional): seed for the random compaction
+                offsets. Defaults to None.
+        """
+        self.k = k
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.levels: List[np.ndarray] = [np.empty(0, dtype=np.float64)]
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def _capacity(self, level: int) -> int:
+        """Capacity of a level, which shrinks geometrically below the top level."""
+        depth = len(self.levels) - level - 1
+        return max(int(np.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _compress(self):
+        """Compact levels, bottom up, until every level is within its capacity."""
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0, dtype=np.float64))
+                items = np.sort(items)
+                # keep one item at this level if there is an odd number of them
+                kept, items = items[: len(items) % 2], items[len(items) % 2 :]
+                promoted = items[self._rng.integers(2) :: 2]
+                self.levels[level] = kept
+                self.levels[level + 1] = np.concatenate(
+                    [self.levels[level + 1], promoted]
+                )
+            level += 1
+
+    def update(self, values: Iterable[float]) -> "KLLSketch":
+        """Add values to the sketch. Missing values are ignored.
+
+        Args:
+            values (Iterable[float]): values to add
+
+        Returns:
+            KLLSketch: the updated sketch
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.n += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other: "KLLSketch") -> "KLLSketch":
+        """Merge another sketch into this one.
+
+        Args:
+            other (KLLSketch): sketch to merge
+
+        Returns:
+            KLLSketch: the updated sketch
+        """
+        if other.k != self.k:
+            raise ValueError("Only sketches with the same k can be merged")
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0, dtype=np.float64))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _weighted_items(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Sorted items of the sketch and their cumulative weights."""
+        items = np.concatenate(self.levels)
+        weights = np.concatenate(
+            [
+                np.full(len(level_items), 2**level, dtype=np.int64)
+                for level, level_items in enumerate(self.levels)
+            ]
+        )
+        order = np.argsort(items, kind="stable")
+        return items[order], np.cumsum(weights[order])
+
+    def quantile(self, q: Iterable[float]) -> np.ndarray:
+        """Estimate quantiles of the values added so far.
+
+        Args:
+            q (Iterable[float]): quantiles between 0 and 1
+
+        Returns:
+            np.ndarray: estimated quantiles, nan if the sketch is empty
+        """
+        q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        if self.n == 0:
+            return np.full(len(q), np.nan)
+        items, cumulative_weights = self._weighted_items()
+        ranks = np.clip(np.ceil(q * cumulative_weights[-1]), 1, None)
+        estimates = items[
+            np.minimum(
+                np.searchsorted(cumulative_weights, ranks), len(cumulative_weights) - 1
+            )
+        ]
+        estimates[q <= 0] = self.min
+        estimates[q >= 1] = self.max
+        return estimates
+
+    def rank(self, value: float) -> float:
+        """Estimate the fraction of values added so far that are <= value.
+
+        Args:
+            value (float): value
+
+        Returns:
+            float: estimated normalised rank
+        """
+        if self.n == 0:
+            return np.nan
+        items, cumulative_weights = self._weighted_items()
+        position = np.searchsorted(items, value, side="right")
+        return (
+            cumulative_weights[position - 1] / cumulative_weights[-1]
+            if position
+            else 0.0
+        )
+
+    @property
+    def rank_error(self) -> float:
+        """Normalised rank error of quantile estimates, with 99% confidence."""
+        return normalised_rank_error(self.k)
+
+    def to_dict(self) -> dict:
+        """Serialise the sketch, eg. to save it alongside a partition's outputs."""
+        return {
+            "k": self.k,
+            "n": self.n,
+            "min": float(self.min),
+            "max": float(self.max),
+            "levels": [level.tolist() for level in self.levels],
+        }
+
+    @classmethod
+    def from_dict(cls, sketch_dict: dict, seed: Optional[int] = None) -> "KLLSketch":
+        """Load a sketch serialised with to_dict().
+
+        Args:
+            sketch_dict (dict): serialised sketch
+            seed (Optional[int], optional): seed for the random compaction
+                offsets. Defaults to None.
+
+        Returns:
+            KLLSketch: the sketch
+        """
+        sketch = cls(k=sketch_dict["k"], seed=seed)
+        sketch.n = sketch_dict["n"]
+        sketch.min = sketch_dict["min"]
+        sketch.max = sketch_dict["max"]
+        sketch.levels = [
+            np.asarray(level, dtype=np.float64) for level in sketch_dict["levels"]
+        ]
+        return sketch
+
+
+class GroupedQuantileSketches:
+    """
+    Streaming count, mean and percentiles of columns per group.
+
+    Memory is O(k) per group and column, however many rows are added.
+    """
+
+    def __init__(
+        self,
+        group_cols: List[str],
+        value_cols: List[str],
+        k: int = 200,
+        seed: Optional[int] = None,
+    ):
+        """
+        Args:
+            group_cols (List[str]): columns to group by
+            value_cols (List[str]): columns to summarise
+            k (int, optional): size parameter of the sketches. Defaults to 200.
+            seed (Optional[int], optional): seed for the sketches. Defaults to None.
+        """
+        self.group_cols = group_cols
+        self.value_cols = value_cols
+        self.k = k
+        self.seed = seed
+        self.sketches: Dict[Tuple[Hashable, str], KLLSketch] = {}
+        self.sums: Dict[Tuple[Hashable, str], float] = {}
+
+    def _sketch(self, key: Tuple[Hashable, str]) -> KLLSketch:
+        if key not in self.sketches:
+            self.sketches[key] = KLLSketch(k=self.k, seed=self.seed)
+            self.sums[key] = 0.0
+        return self.sketches[key]
+
+    def update(self, df: pd.DataFrame) -> "GroupedQuantileSketches":
+        """Add a chunk of rows.
+
+        Args:
+            df (pd.DataFrame): chunk with the group and value columns
+
+        Returns:
+            GroupedQuantileSketches: the updated sketches
+        """
+        if self.group_cols:
+            groups = df.groupby(self.group_cols, observed=True)[self.value_cols]
+        else:
+            groups = [((), df[self.value_cols])]
+        for group, group_df in groups:
+            group = group if isinstance(group, tuple) else (group,)
+            for col in self.value_cols:
+                values = group_df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+                self._sketch((group, col)).update(values)
+                self.sums[(group, col)] += np.nansum(values)
+        return self
+
+    def merge(self, other: "GroupedQuantileSketches") -> "GroupedQuantileSketches":
+        """Merge sketches of another partition into these ones.
+
+        Args:
+            other (GroupedQuantileSketches): sketches with the same columns
+
+        Returns:
+            GroupedQuantileSketches: the updated sketches
+        """
+        if (other.group_cols, other.value_cols) != (self.group_cols, self.value_cols):
+            raise ValueError("Only sketches of the same columns can be merged")
+        for key, sketch in other.sketches.items():
+            self._sketch(key).merge(sketch)
+            self.sums[key] += other.sums[key]
+        return self
+
+    def to_frame(self, percentiles: Iterable[int]) -> pd.DataFrame:
+        """Summarise every group.
+
+        Args:
+            percentiles (Iterable[int]): percentiles to estimate, eg. [10, 50, 90]
+
+        Returns:
+            pd.DataFrame: one row per group with the group columns and a
+                {col}_count, {col}_mean and {col}_p{percentile} column per value column
+        """
+        percentiles = list(percentiles)
+        rows = {}
+        for (group, col), sketch in self.sketches.items():
+            row = rows.setdefault(group, dict(zip(self.group_cols, group)))
+            row[f"{col}_count"] = sketch.n
+            row[f"{col}_mean"] = (
+                self.sums[(group, col)] / sketch.n if sketch.n else np.nan
+            )
+            estimates = sketch.quantile(np.array(percentiles) / 100)
+            for percentile, estimate in zip(percentiles, estimates):
+                row[f"{col}_p{percentile}"] = estimate
+        columns = self.group_cols + [
+            f"{col}_{stat}"
+            for stat in ["count", "mean"] + [f"p{p}" for p in percentiles]
+            for col in self.value_cols
+        ]
+        return pd.DataFrame(list(rows.values()), columns=columns)
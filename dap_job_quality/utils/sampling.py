@@ -0,0 +1,287 @@
+"""
+Functions to draw reproducible, stratified samples of job adverts from a
+streamed source.
+
+Every advert is given a priority by hashing a fingerprint of its description
+with the random seed, and each stratum keeps only the adverts with the lowest
+priorities in a bounded heap. Because the priority only depends on the
+description and the seed, the sample is the same however the source is
+chunked or ordered, and adverts with (near-)identical descriptions share a
+priority so at most one of them can be selected.
+"""
+
+from hashlib import blake2b
+import heapq
+import re
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+
+import pandas as pd
+
+# Characters that are dropped before fingerprinting a description, so that
+# reposts differing only by salary figures, dates or punctuation collide
+compiled_fingerprint_strip_pattern = re.compile(r"[^a-z]+")
+
+
+def text_fingerprint(text: str) -> bytes:
+    """Create a fingerprint of a job description that is robust to small edits
+    (case, whitespace, punctuation and numbers).
+
+    Args:
+        text (str): job description
+
+    Returns:
+        bytes: 16 byte fingerprint of the normalised description
+    """
+    normalised = compiled_fingerprint_strip_pattern.sub(" ", str(text).lower())
+    return blake2b(" ".join(normalised.split()).encode(), digest_size=16).digest()
+
+
+def hash_priority(fingerprint: bytes, random_seed: int = 42) -> int:
+    """Map a fingerprint to a pseudo-random 64 bit priority for a given seed.
+
+    Args:
+        fingerprint (bytes): fingerprint of the job description
+        random_seed (int, optional): random seed. Defaults to 42.
+
+    Returns:
+        int: priority, the lowest priorities are sampled first
+    """
+    seeded_hash = blake2b(fingerprint, digest_size=8, key=str(random_seed).encode())
+    return int.from_bytes(seeded_hash.digest(), "big")
+
+
+class StratifiedHashSampler:
+    """
+    Bottom-k hash sampler that can be updated with chunks of job adverts.
+
+    Memory is bounded by (number of strata x sample_size) adverts, as each
+    stratum only ever keeps the sample_size adverts with the lowest priority.
+    """
+
+    def __init__(
+        self,
+        sample_size: int = 1000,
+        random_seed: int = 42,
+        id_col: str = "id",
+        text_col: str = "description",
+        strata_fn: Optional[Callable[[pd.DataFrame], Iterable[Hashable]]] = None,
+        fingerprint_fn: Callable[[str], bytes] = text_fingerprint,
+    ):
+        """
+        Args:
+            sample_size (int, optional): number of adverts to sample. Defaults to 1000.
+            random_seed (int, optional): random seed for reproducibility. Defaults to 42.
+            id_col (str, optional): column with the job advert id. Defaults to "id".
+            text_col (str, optional): column with the job description. Defaults to "description".
+            strata_fn (Optional[Callable], optional): function mapping a chunk to one stratum
+                per row. If None, the sample is not stratified.
+            fingerprint_fn (Callable, optional): function used to fingerprint descriptions.
+                Defaults to text_fingerprint.
+        """
+        self.sample_size = sample_size
+        self.random_seed = random_seed
+        self.id_col = id_col
+        self.text_col = text_col
+        self.strata_fn = strata_fn
+        self.fingerprint_fn = fingerprint_fn
+        self.stratum_counts: Dict[Hashable, int] = {}
+        self._heaps: Dict[Hashable, list] = {}
+        self._heap_fingerprints: Dict[Hashable, set] = {}
+
+    def update(self, chunk: pd.DataFrame) -> "StratifiedHashSampler":
+        """Add a chunk of job adverts to the sampler.
+
+        Args:
+            chunk (pd.DataFrame): chunk of job adverts
+
+        Returns:
+            StratifiedHashSampler: the updated sampler
+        """
+        chunk = chunk.dropna(subset=[self.text_col])
+        if self.strata_fn is None:
+            strata = [None] * len(chunk)
+        else:
+            strata = self.strata_fn(chunk)
+
+        for job_id, text, stratum in zip(
+            chunk[self.id_col], chunk[self.text_col], strata
+        ):
+            self.stratum_counts[stratum] = self.stratum_counts.get(stratum, 0) + 1
+            fingerprint = self.fingerprint_fn(text)
+            priority = hash_priority(fingerprint, self.random_seed)
+            heap = self._heaps.setdefault(stratum, [])
+            fingerprints = self._heap_fingerprints.setdefault(stratum, set())
+            if fingerprint in fingerprints:
+                continue
+            # heapq is a min-heap, so store negated priorities to pop the largest
+            entry = (-priority, fingerprint, job_id, text)
+            if len(heap) < self.sample_size:
+                heapq.heappush(heap, entry)
+                fingerprints.add(fingerprint)
+            elif priority < -heap[0][0]:
+                evicted = heapq.heapreplace(heap, entry)
+                fingerprints.discard(evicted[1])
+                fingerprints.add(fingerprint)
+        return self
+
+    def _allocate(self) -> Dict[Hashable, int]:
+        """Allocate the sample size across strata in proportion to the number of
+        adverts seen in each stratum, using the largest remainder method.
+        """
+        total = sum(self.stratum_counts.values())
+        if total == 0:
+            return {}
+        quotas = {
+            stratum: self.sample_size * count / total
+            for stratum, count in self.stratum_counts.items()
+        }
+        allocation = {stratum: int(quota) for stratum, quota in quotas.items()}
+        remainder = self.sample_size - sum(allocation.values())
+        for stratum in sorted(
+            quotas, key=lambda s: quotas[s] - allocation[s], reverse=True
+        )[:remainder]:
+            allocation[stratum] += 1
+        return allocation
+
+    def sample(self) -> pd.DataFrame:
+        """Draw the stratified sample from the adverts seen so far.
+
+        Strata are allocated in proportion to their size. If a stratum does not
+        have enough unique adverts to fill its allocation, the shortfall is
+        filled with the lowest priority adverts from the remaining strata.
+
+        Returns:
+            pd.DataFrame: sampled adverts with the id, description and stratum
+                columns, ordered by priority
+        """
+        allocation = self._allocate()
+        candidates = []
+        for stratum, heap in self._heaps.items():
+            for neg_priority, fingerprint, job_id, text in heap:
+                candidates.append((-neg_priority, fingerprint, job_id, text, stratum))
+        candidates.sort(key=lambda candidate: candidate[0])
+
+        selected, leftovers = [], []
+        seen_fingerprints = set()
+        for candidate in candidates:
+            fingerprint, stratum = candidate[1], candidate[4]
+            if fingerprint in seen_fingerprints:
+                continue
+            if allocation.get(stratum, 0) > 0:
+                allocation[stratum] -= 1
+                selected.append(candidate)
+                seen_fingerprints.add(fingerprint)
+            else:
+                leftovers.append(candidate)
+        for candidate in leftovers:
+            if len(selected) >= self.sample_size:
+                break
+            if candidate[1] not in seen_fingerprints:
+                selected.append(candidate)
+                seen_fingerprints.add(candidate[1])
+        selected.sort(key=lambda candidate: candidate[0])
+
+        return pd.DataFrame(
+            [
+                {
+                    self.id_col: job_id,
+                    self.text_col: text,
+                    "stratum": stratum,
+                }
+                for _, _, job_id, text, stratum in selected
+            ],
+            columns=[self.id_col, self.text_col, "stratum"],
+        )
+
+
+def stratified_hash_sample(
+    chunks: Iterable[pd.DataFrame],
+    sample_size: int = 1000,
+    random_seed: int = 42,
+    **sampler_kwargs,
+) -> pd.DataFrame:
+    """Draw a reproducible, de-duplicated and optionally stratified sample from
+    a stream of job advert chunks.
+
+    Args:
+        chunks (Iterable[pd.DataFrame]): stream of job advert chunks,
+            eg. from get_ojo_sample_chunks()
+        sample_size (int, optional): number of adverts to sample. Defaults to 1000.
+        random_seed (int, optional): random seed for reproducibility. Defaults to 42.
+        **sampler_kwargs: passed on to StratifiedHashSampler
+
+    Returns:
+        pd.DataFrame: sampled adverts
+    """
+    sampler = StratifiedHashSampler(
+        sample_size=sample_size, random_seed=random_seed, **sampler_kwargs
+    )
+    for chunk in chunks:
+        sampler.update(chunk)
+    return sampler.sample()
+
+
+def column_strata(column: str) -> Callable[[pd.DataFrame], List[Hashable]]:
+    """Stratify job adverts by the value of a column in the streamed data
+    (eg. "itl_3_code").
+
+    Args:
+        column (str): name of the column to stratify by
+
+    Returns:
+        Callable[[pd.DataFrame], List[Hashable]]: strata function for StratifiedHashSampler
+    """
+
+    def strata_fn(chunk: pd.DataFrame) -> List[Hashable]:
+        return chunk[column].fillna("unknown").tolist()
+
+    return strata_fn
+
+
+def lookup_strata(
+    lookup: Dict[Hashable, Hashable], id_col: str = "id"
+) -> Callable[[pd.DataFrame], List[Hashable]]:
+    """Stratify job adverts by a value looked up from their id (eg. the sector
+    from get_ojo_job_title_sample()).
+
+    Args:
+        lookup (Dict[Hashable, Hashable]): job advert id to stratum
+        id_col (str, optional): column with the job advert id. Defaults to "id".
+
+    Returns:
+        Callable[[pd.DataFrame], List[Hashable]]: strata function for StratifiedHashSampler
+    """
+
+    def strata_fn(chunk: pd.DataFrame) -> List[Hashable]:
+        return [lookup.get(job_id, "unknown") for job_id in chunk[id_col]]
+
+    return strata_fn
+
+
+def keyword_strata(
+    search_terms: dict, text_col: str = "description"
+) -> Callable[[pd.DataFrame], List[Hashable]]:
+    """Stratify job adverts by the job quality dimension of the first keyword
+    found in the description.
+
+    Args:
+        search_terms (dict): target phrase to a dict with a "dimension" key,
+            as read from the keyword lookup in keyword_search.py
+        text_col (str, optional): column with the job description. Defaults to "description".
+
+    Returns:
+        Callable[[pd.DataFrame], List[Hashable]]: strata function for StratifiedHashSampler
+    """
+
+    def strata_fn(chunk: pd.DataFrame) -> List[Hashable]:
+        strata = []
+        for text in chunk[text_col].str.lower():
+            dimension = "none"
+            for phrase, terms in search_terms.items():
+                if phrase in text:
+                    dimension = terms["dimension"]
+                    break
+            strata.append(dimension)
+        return strata
+
+    return strata_fn
@@ -0,0 +1,246 @@
+"""
+A dictionary of the unique sentences of a corpus of job adverts, so that
+per-sentence work (keyword search, embeddings, NER) is done once per unique
+sentence rather than once per occurrence.
+
+Job adverts repeat a lot of boilerplate ("We are an equal opportunities
+employer", pension and holiday blurbs), so a corpus has many fewer unique
+sentences than sentences. Each cleaned sentence is hashed (a 64 bit hash, so
+collisions are vanishingly unlikely below billions of sentences) and each
+unique sentence gets an integer key: its index in `sentences`. The sentences of
+each job advert are stored as keys in a compact CSR-like layout:
+
+    sentence_keys[offsets[i]:offsets[i + 1]]
+
+are the keys of the sentences of the i-th job advert (ad_ids[i]), in the order
+split_sentences() returns them. Results computed for the unique sentences are
+broadcast back to every occurrence with broadcast().
+
+A SentenceDictionary is saved as a single .npz file.
+"""
+from functools import partial
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from dap_job_quality import logger
+from dap_job_quality.utils.chunk import map_chunks
+from dap_job_quality.utils.instrumentation import increment, stage
+from dap_job_quality.utils.text_cleaning import clean_text, split_sentences
+
+
+class SentenceDictionary:
+    """
+    Unique sentences of a corpus of job adverts, and the sentences of each job advert as keys.
+    """
+
+    def __init__(
+        self,
+        sentences: Iterable[str],
+        ad_ids: Iterable,
+        offsets: Iterable[int],
+        sentence_keys: Iterable[int],
+    ):
+        """
+        Args:
+            sentences (Iterable[str]): unique sentences, whose index is their key
+            ad_ids (Iterable): job id of each job advert
+            offsets (Iterable[int]): (n_ads + 1) start of the sentences of each
+                job advert in sentence_keys
+            sentence_keys (Iterable[int]): key of every sentence occurrence
+        """
+        self.sentences = np.asarray(sentences, dtype=object)
+        self.ad_ids = np.asarray(ad_ids)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.sentence_keys = np.asarray(sentence_keys, dtype=np.int64)
+        if len(self.offsets) != len(self.ad_ids) + 1:
+            raise ValueError("offsets must have one more element than ad_ids")
+        if self.offsets[-1] != len(self.sentence_keys):
+            raise ValueError("offsets do not match the number of sentence keys")
+
+    def __len__(self) -> int:
+        return len(self.sentences)
+
+    @property
+    def n_occurrences(self) -> int:
+        """Number of sentences in the corpus, counting repeats."""
+        return len(self.sentence_keys)
+
+    def counts(self) -> np.ndarray:
+        """Get the number of occurrences of each unique sentence."""
+        return np.bincount(self.sentence_keys, minlength=len(self))
+
+    def ad_sentence_keys(self, i: int) -> np.ndarray:
+        """Get the keys of the sentences of the i-th job advert."""
+        return self.sentence_keys[self.offsets[i] : self.offsets[i + 1]]
+
+    def broadcast(
+        self, values: Union[np.ndarray, List, pd.Series, pd.DataFrame]
+    ) -> Union[np.ndarray, pd.DataFrame]:
+        """Broadcast values of the unique sentences back to every occurrence.
+
+        Args:
+            values (Union[np.ndarray, List, pd.Series, pd.DataFrame]): one value
+                (or row) per unique sentence, eg. embeddings or keywords found
+
+        Returns:
+            Union[np.ndarray, pd.DataFrame]: one value (or row) per occurrence,
+                in the order of to_frame()
+        """
+        if len(values) != len(self):
+            raise ValueError(f"Expected {len(self)} values, got {len(values)}")
+        if isinstance(values, pd.DataFrame):
+            return values.iloc[self.sentence_keys].reset_index(drop=True)
+        if not isinstance(values, np.ndarray):
+            # via a series, so that lists of lists stay 1d
+            values = pd.Series(values, dtype=object).to_numpy()
+        return values[self.sentence_keys]
+
+    def to_frame(self, id_col: str = "job_id") -> pd.DataFrame:
+        """Get one row per sentence occurrence, like get_analysis_sample() in
+        keyword_search.py.
+
+        Args:
+            id_col (str, optional): name of the job id column. Defaults to "job_id".
+
+        Returns:
+            pd.DataFrame: job id, sentence_id (position of the sentence in its job
+                advert), sentence and sentence_key columns
+        """
+        n_sentences = np.diff(self.offsets)
+        return pd.DataFrame(
+            {
+                id_col: np.repeat(self.ad_ids, n_sentences),
+                "sentence_id": np.arange(self.n_occurrences)
+                - np.repeat(self.offsets[:-1], n_sentences),
+                "sentence": self.sentences[self.sentence_keys],
+                "sentence_key": self.sentence_keys,
+            }
+        )
+
+    def save(self, file_path: Union[str, Path]):
+        """Save the dictionary to a .npz file.
+
+        Args:
+            file_path (Union[str, Path]): path to the .npz file
+        """
+        Path(file_path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            file_path,
+            sentences=self.sentences,
+            ad_ids=self.ad_ids,
+            offsets=self.offsets,
+            sentence_keys=self.sentence_keys,
+        )
+
+    @classmethod
+    def load(cls, file_path: Union[str, Path]) -> "SentenceDictionary":
+        """Load a dictionary saved with save().
+
+        Args:
+            file_path (Union[str, Path]): path to the .npz file
+
+        Returns:
+            SentenceDictionary: the loaded dictionary
+        """
+        arrays = np.load(file_path, allow_pickle=True)
+        return cls(
+            arrays["sentences"],
+            arrays["ad_ids"],
+            arrays["offsets"],
+            arrays["sentence_keys"],
+        )
+
+
+def _split_chunk(
+    job_ads: pd.DataFrame, id_col: str, text_col: str
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Clean and split a chunk of job adverts and hash their sentences, in a worker process.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]: the job
+            ids, number of sentences of each job advert, hash of every sentence,
+            and the unique hashes of the chunk with their sentences
+    """
+    sentences, n_sentences = [], []
+    for description in job_ads[text_col]:
+        ad_sentences = split_sentences(clean_text(description))
+        sentences.extend(ad_sentences)
+        n_sentences.append(len(ad_sentences))
+    sentences = pd.Series(sentences, dtype=object).to_numpy()
+    hashes = pd.util.hash_array(sentences)
+    unique_hashes, first_positions = np.unique(hashes, return_index=True)
+    return (
+        job_ads[id_col].to_numpy(),
+        np.array(n_sentences, dtype=np.int64),
+        hashes,
+        unique_hashes,
+        sentences[first_positions],
+    )
+
+
+@stage("sentence_dictionary", log=False)
+def build_sentence_dictionary(
+    job_ads: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+    id_col: str = "id",
+    text_col: str = "description",
+    n_jobs: Optional[int] = 1,
+    chunk_size: int = 10000,
+) -> SentenceDictionary:
+    """Clean job descriptions, split them into sentences and build the
+    dictionary of their unique sentences.
+
+    Args:
+        job_ads (Union[pd.DataFrame, Iterable[pd.DataFrame]]): job adverts, or
+            chunks of them (eg. get_ojo_sample_chunks())
+        id_col (str, optional): job id column. Defaults to "id".
+        text_col (str, optional): raw job description column. Defaults to "description".
+        n_jobs (Optional[int], optional): number of processes cleaning and
+            splitting chunks of job adverts, where None is the number of cores.
+            Defaults to 1.
+        chunk_size (int, optional): number of job adverts in each chunk of a
+            dataframe. Defaults to 10000.
+
+    Returns:
+        SentenceDictionary: the dictionary
+    """
+    chunks = list(
+        map_chunks(
+            partial(_split_chunk, id_col=id_col, text_col=text_col),
+            job_ads,
+            chunk_size if isinstance(job_ads, pd.DataFrame) else None,
+            n_jobs=n_jobs,
+            executor="process",
+        )
+    )
+    ad_ids, n_sentences, hashes, chunk_hashes, chunk_sentences = (
+        [chunk[i] for chunk in chunks] for i in range(5)
+    )
+    hashes = np.concatenate(hashes) if hashes else np.empty(0, dtype=np.uint64)
+    # keys in order of first occurrence
+    sentence_keys, unique_hashes = pd.factorize(hashes)
+
+    # the sentence of each unique hash, from the unique sentences of each chunk
+    chunk_hashes = np.concatenate(chunk_hashes or [np.empty(0, dtype=np.uint64)])
+    sorted_hashes, first_positions = np.unique(chunk_hashes, return_index=True)
+    chunk_sentences = np.concatenate(chunk_sentences or [np.empty(0, dtype=object)])
+    sentences = chunk_sentences[first_positions][
+        np.searchsorted(sorted_hashes, unique_hashes)
+    ]
+
+    n_sentences = np.concatenate(n_sentences or [np.empty(0, dtype=np.int64)])
+    dictionary = SentenceDictionary(
+        sentences,
+        np.concatenate(ad_ids) if ad_ids else np.empty(0),
+        np.concatenate([[0], np.cumsum(n_sentences)]),
+        sentence_keys,
+    )
+    increment("sentence_dictionary.sentences", dictionary.n_occurrences)
+    increment("sentence_dictionary.unique_sentences", len(dictionary))
+    logger.info(
+        f"{len(dictionary)} unique sentences out of {dictionary.n_occurrences} "
+        f"in {len(dictionary.ad_ids)} job ads"
+    )
+    return dictionary
@@ -0,0 +1,261 @@
+"""
+Functions to generate seeded synthetic OJO data, so that the pipeline can be
+benchmarked offline and at any scale (see pipeline/run_benchmarks.py).
+
+The synthetic job adverts imitate the quirks of the real descriptions that the
+cleaning functions deal with: bullet points, sentences run together in camelcase
+("teamWe offer"), non-breaking spaces, ampersands and salaries. The lookup
+tables have the same columns and formats as the OJO location, occupation
+(serialised SOC dicts) and salary tables used by create_df_for_salary_analysis.py.
+The same seed always gives the same data.
+"""
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+ITL1_REGIONS = {
+    "TLC": "North East (England)",
+    "TLD": "North West (England)",
+    "TLE": "Yorkshire and The Humber",
+    "TLF": "East Midlands (England)",
+    "TLG": "West Midlands (England)",
+    "TLH": "East",
+    "TLI": "London",
+    "TLJ": "South East (England)",
+    "TLK": "South West (England)",
+    "TLL": "Wales",
+    "TLM": "Scotland",
+    "TLN": "Northern Ireland",
+}
+JOB_TITLES = [
+    "Care Assistant",
+    "Registered Nurse",
+    "Software Engineer",
+    "Warehouse Operative",
+    "Accounts Assistant",
+    "Sales Executive",
+    "Teaching Assistant",
+    "HGV Driver",
+    "Project Manager",
+    "Customer Service Advisor",
+]
+INTRO_SENTENCES = [
+    "We are looking for a {title} to join our friendly team",
+    "An exciting opportunity has arisen for a {title} in {region}",
+    "Our client, a leading employer in {region}, is recruiting a {title}",
+    "Join us as a {title} and make a real difference",
+]
+DUTY_SENTENCES = [
+    "Managing the rota and supporting the team",
+    "Preparing financial & internal reports",
+    "Working closely with customers to resolve queries",
+    "Using JavaScript, PowerPoint and GitHub day to day",
+    "Delivering high quality care to residents",
+    "Maintaining accurate records in line with company policy",
+    "Loading and unloading deliveries safely",
+]
+BULLETS = ["•", "•\xa0", "*", ";• ", "\n- "]
+SALARY_SENTENCES = [
+    "Salary: £{low:,} - £{high:,} per annum",
+    "We pay £{hourly:.2f} per hour",
+    "Up to £{high:,} DOE",
+]
+# Phrases of each job quality subcategory, which also make up the synthetic keyword lookup
+KEYWORD_PHRASES = {
+    ("2_pay", "pay"): ["competitive salary", "annual bonus", "overtime"],
+    ("2_entitlements", "pension"): ["company pension", "pension scheme"],
+    ("2_entitlements", "leave"): ["annual leave", "holiday allowance"],
+    ("2_entitlements", "sick pay"): ["sick pay", "enhanced maternity pay"],
+    ("4_job_design_nature_of_work", "training"): [
+        "full training",
+        "career progression",
+    ],
+    ("7_work_life_balance", "flexible working"): [
+        "flexible working",
+        "hybrid working",
+        "part time hours",
+    ],
+    ("3_health_safety_wellbeing", "wellbeing"): [
+        "employee assistance programme",
+        "free parking",
+    ],
+}
+BENEFIT_SENTENCES = [
+    "We offer {phrase} and {other_phrase}",
+    "Benefits include {phrase}",
+    "You will receive {phrase}, {other_phrase} & more",
+    "The role comes with {phrase}",
+]
+PHRASES = [phrase for phrases in KEYWORD_PHRASES.values() for phrase in phrases]
+CLOSING_SENTENCES = [
+    "Apply now",
+    "To apply please send your CV",
+    "We are an equal opportunities employer!",
+    "Interviews will be held next week?",
+]
+# Separators between sentences, the first of which runs them together
+SEPARATORS = ["", ". ", ".\n", " ", ". "]
+
+
+def make_keyword_lookup() -> pd.DataFrame:
+    """Make a keyword lookup of the phrases used in the synthetic descriptions,
+    with the same columns as inputs/keyword_lookup.csv.
+
+    Returns:
+        pd.DataFrame: target_phrase, dimension and subcategory columns
+    """
+    return pd.DataFrame(
+        [
+            {
+                "target_phrase": phrase,
+                "dimension": dimension,
+                "subcategory": subcategory,
+            }
+            for (dimension, subcategory), phrases in KEYWORD_PHRASES.items()
+            for phrase in phrases
+        ]
+    )
+
+
+def make_salaries(n: int, rng: np.random.Generator) -> pd.DataFrame:
+    """Make annualised salary ranges.
+
+    Args:
+        n (int): number of salaries
+        rng (np.random.Generator): random generator
+
+    Returns:
+        pd.DataFrame: min_annualised_salary and max_annualised_salary columns
+    """
+    low = np.round(rng.lognormal(np.log(28000), 0.4, size=n), -2)
+    high = np.round(low * rng.uniform(1.0, 1.3, size=n), -2)
+    return pd.DataFrame({"min_annualised_salary": low, "max_annualised_salary": high})
+
+
+def make_soc_strings(
+    n: int, rng: np.random.Generator, missing_share: float = 0.1
+) -> pd.Series:
+    """Make a SOC column of serialised dicts, like the OJO occupation measures.
+
+    Args:
+        n (int): number of rows
+        rng (np.random.Generator): random generator
+        missing_share (float, optional): share of missing SOC codes. Defaults to 0.1.
+
+    Returns:
+        pd.Series: serialised SOC dicts, missing for missing_share of the rows
+    """
+    codes = rng.integers(1111, 9269, size=n).astype(str)
+    soc = pd.Series(
+        [
+            f"{{'SOC_2020_EXT': '{code}/99', 'SOC_2020': '{code}', 'SOC_2010': '{code}', 'name': ['Job title']}}"
+            for code in codes
+        ]
+    )
+    soc[rng.random(n) < missing_share] = np.nan
+    return soc
+
+
+def make_description(
+    rng: np.random.Generator, title: str, region: str, low: float, high: float
+) -> str:
+    """Make one job description.
+
+    Args:
+        rng (np.random.Generator): random generator
+        title (str): job title
+        region (str): ITL1 region name
+        low (float): minimum annualised salary
+        high (float): maximum annualised salary
+
+    Returns:
+        str: job description
+    """
+    # one draw of random integers per description, as drawing them one at a
+    # time makes generating a million descriptions slow
+    draws = iter(rng.integers(0, 2**31, size=32))
+
+    def pick(options: list):
+        return options[next(draws) % len(options)]
+
+    sentences = [pick(INTRO_SENTENCES).format(title=title, region=region)]
+    # duties as a bulleted list, with a random bullet style
+    bullet = pick(BULLETS)
+    n_duties = 2 + next(draws) % 4
+    duties = [pick(DUTY_SENTENCES) for _ in range(n_duties)]
+    sentences.append("Duties include:" + "".join(bullet + duty for duty in duties))
+    sentences.append(
+        pick(SALARY_SENTENCES).format(low=int(low), high=int(high), hourly=low / 1950)
+    )
+    for _ in range(next(draws) % 4):
+        sentences.append(
+            pick(BENEFIT_SENTENCES).format(
+                phrase=pick(PHRASES), other_phrase=pick(PHRASES)
+            )
+        )
+    sentences.append(pick(CLOSING_SENTENCES))
+
+    # some sentences run together without punctuation, eg. "teamWe offer"
+    return sentences[0] + "".join(pick(SEPARATORS) + s for s in sentences[1:])
+
+
+def make_ojo_tables(n_ads: int, seed: int = 42) -> Dict[str, pd.DataFrame]:
+    """Make synthetic OJO job adverts and their location, occupation and salary tables.
+
+    Args:
+        n_ads (int): number of job adverts
+        seed (int, optional): random seed. Defaults to 42.
+
+    Returns:
+        Dict[str, pd.DataFrame]:
+            - ojo_df: id, job_title_raw, created, description
+            - ojo_loc: id, itl_1_code, itl_1_name
+            - ojo_occ: job_id, SOC
+            - ojo_sal: id, min_annualised_salary, max_annualised_salary
+    """
+    rng = np.random.default_rng(seed)
+    ids = rng.choice(
+        np.arange(10**7, 10**7 + 10 * n_ads), size=n_ads, replace=False
+    )
+    titles = rng.choice(JOB_TITLES, size=n_ads)
+    itl_codes = rng.choice(list(ITL1_REGIONS), size=n_ads)
+    itl_names = pd.Series(itl_codes).map(ITL1_REGIONS)
+    salaries = make_salaries(n_ads, rng)
+    created = pd.Timestamp("2022-01-01") + pd.to_timedelta(
+        rng.integers(0, 730, size=n_ads), unit="D"
+    )
+
+    descriptions: List[str] = [
+        make_description(rng, title, region, low, high)
+        for title, region, low, high in zip(
+            titles,
+            itl_names,
+            salaries["min_annualised_salary"],
+            salaries["max_annualised_salary"],
+        )
+    ]
+    ojo_df = pd.DataFrame(
+        {
+            "id": ids,
+            "job_title_raw": titles,
+            "created": created.strftime("%Y-%m-%d"),
+            "description": descriptions,
+        }
+    )
+    ojo_loc = pd.DataFrame(
+        {"id": ids, "itl_1_code": itl_codes, "itl_1_name": itl_names}
+    )
+    ojo_occ = pd.DataFrame({"job_id": ids, "SOC": make_soc_strings(n_ads, rng)})
+    # not every job advert has a salary
+    has_salary = rng.random(n_ads) < 0.7
+    ojo_sal = salaries[has_salary].assign(id=ids[has_salary])[
+        ["id", "min_annualised_salary", "max_annualised_salary"]
+    ]
+    # the lookup tables are not in the same order as the job adverts
+    return {
+        "ojo_df": ojo_df,
+        "ojo_loc": ojo_loc.sample(frac=1, random_state=seed).reset_index(drop=True),
+        "ojo_occ": ojo_occ.sample(frac=1, random_state=seed).reset_index(drop=True),
+        "ojo_sal": ojo_sal.sample(frac=1, random_state=seed).reset_index(drop=True),
+    }
@@ -0,0 +1,196 @@
+"""
+A cache of the results of text cleaning functions, so that reposted and
+duplicated job descriptions are only cleaned once.
+
+TextCache keeps the most recently used results in memory (a bounded LRU) and,
+optionally, every result in a sqlite file so they are reused by later runs and
+by other processes. Results are keyed by a hash of the function name, the text
+and a version of the cleaning rules, so changing the rules (see
+text_cleaning.cleaner_version()) invalidates them without deleting the file.
+New results are written to the file in batches (of write_batch_size, and when
+the cache is closed or a worker process exits), as committing each one made a
+first run slower than not caching at all.
+
+The cache is switched on for clean_text() and split_sentences() with
+text_cleaning.enable_text_cache(), and its hit rates are counted with
+instrumentation.increment() (text_cache.hits, text_cache.store_hits and
+text_cache.misses) so they appear in run reports.
+"""
+from collections import OrderedDict
+from hashlib import blake2b
+import json
+from multiprocessing.util import Finalize
+import os
+from pathlib import Path
+import sqlite3
+from threading import Lock
+from typing import Any, Callable, Optional, Union
+
+from dap_job_quality import PROJECT_DIR
+from dap_job_quality.utils.instrumentation import increment
+
+TEXT_CACHE_PATH = PROJECT_DIR / "outputs/cache/text_cleaning.sqlite"
+
+_MISSING = object()
+
+
+class TextCache:
+    """
+    Bounded in-memory LRU of function results, optionally backed by a sqlite file.
+    """
+
+    def __init__(
+        self,
+        version: str,
+        maxsize: int = 100000,
+        path: Optional[Union[str, Path]] = None,
+        write_batch_size: int = 1000,
+    ):
+        """
+        Args:
+            version (str): version of the cached functions, part of every key
+            maxsize (int, optional): maximum number of results kept in memory.
+                Defaults to 100000.
+            path (Optional[Union[str, Path]], optional): sqlite file of the
+                persistent store, or None to only cache in memory. Defaults to None.
+            write_batch_size (int, optional): number of new results written to
+                the persistent store at a time. Defaults to 1000.
+        """
+        self.version = version
+        self.maxsize = maxsize
+        self.path = Path(path) if path else None
+        self.write_batch_size = write_batch_size
+        self.hits, self.store_hits, self.misses = 0, 0, 0
+        self._results = OrderedDict()
+        self._lock = Lock()
+        self._connection, self._connection_pid = None, None
+        # new results not yet written to the persistent store, by this process
+        self._pending, self._pending_pid = {}, None
+        self._finalizer = None
+
+    def key(self, fn_name: str, text: str) -> str:
+        """Hash a function name and text with the version."""
+        return blake2b(
+            f"{self.version}\0{fn_name}\0{text}".encode(), digest_size=16
+        ).hexdigest()
+
+    def get_or_compute(self, fn: Callable[[str], Any], text: str) -> Any:
+        """Get the result of fn(text) from the cache, or compute and cache it.
+
+        Args:
+            fn (Callable[[str], Any]): function of a text whose results are JSON
+                serialisable (tuples come back as lists from the persistent store)
+            text (str): text
+
+        Returns:
+            Any: fn(text)
+        """
+        key = self.key(fn.__name__, text)
+        with self._lock:
+            result = self._results.get(key, _MISSING)
+            if result is not _MISSING:
+                self._results.move_to_end(key)
+                self.hits += 1
+        if result is not _MISSING:
+            increment("text_cache.hits")
+            return result
+
+        if self.path:
+            result = self._load(key)
+            if result is not _MISSING:
+                self.store_hits += 1
+                increment("text_cache.store_hits")
+                self._remember(key, result)
+                return result
+
+        result = fn(text)
+        self.misses += 1
+        increment("text_cache.misses")
+        self._remember(key, result)
+        if self.path:
+            self._save(key, result)
+        return result
+
+    def _remember(self, key: str, result: Any):
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite connections can't be shared with forked worker processes, so
+        # each process opens its own
+        if self._connection is None or self._connection_pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            # in WAL mode, NORMAL doesn't sync the file on every commit
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            self._connection, self._connection_pid = connection, os.getpid()
+            # write the pending results when the process exits, including
+            # worker processes, which don't close the cache
+            self._finalizer = Finalize(self, self.flush, exitpriority=10)
+        return self._connection
+
+    def _load(self, key: str) -> Any:
+        with self._lock:
+            if self._pending_pid == os.getpid() and key in self._pending:
+                return json.loads(self._pending[key])
+            row = (
+                self._connect()
+                .execute("SELECT value FROM results WHERE key = ?", (key,))
+                .fetchone()
+            )
+        return _MISSING if row is None else json.loads(row[0])
+
+    def _save(self, key: str, result: Any):
+        with self._lock:
+            if self._pending_pid != os.getpid():
+                # a forked worker leaves the parent's pending results to it
+                self._pending, self._pending_pid = {}, os.getpid()
+            self._pending[key] = json.dumps(result)
+            if len(self._pending) >= self.write_batch_size:
+                self._write_pending()
+
+    def _write_pending(self):
+        if self._pending and self._pending_pid == os.getpid():
+            connection = self._connect()
+            connection.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?)", self._pending.items()
+            )
+            connection.commit()
+        self._pending = {}
+
+    def flush(self):
+        """Write the new results to the persistent store."""
+        with self._lock:
+            self._write_pending()
+
+    def info(self) -> dict:
+        """Get the number of hits and misses, and the hit rate.
+
+        Returns:
+            dict: hits (in memory), store_hits (in the sqlite file), misses,
+                hit_rate and the number of results in memory
+        """
+        lookups = self.hits + self.store_hits + self.misses
+        return {
+            "hits": self.hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.store_hits) / lookups if lookups else None,
+            "size": len(self._results),
+        }
+
+    def close(self):
+        """Write the new results to the persistent store, and close the connection to it."""
+        self.flush()
+        if self._finalizer is not None:
+            self._finalizer.cancel()
+        if self._connection is not None and self._connection_pid == os.getpid():
+            self._connection.close()
+        self._connection, self._connection_pid, self._finalizer = None, None, None
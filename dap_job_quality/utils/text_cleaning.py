@@ -1,13 +1,22 @@
 """
 Functions to minimally clean job advertisements.
+
+clean_text() and split_sentences() can cache their results, so that reposted
+and duplicated job descriptions are only cleaned once: call enable_text_cache()
+(optionally with a sqlite file, to reuse the results across runs) before
+cleaning. The cached results are invalidated when the cleaning rules below
+change, see cleaner_version(). Worker processes started by fork (the default on
+Linux) inherit the cache; their hit rates are only counted in their own process.
 """
+from functools import lru_cache
 from hashlib import md5
-import nltk
-from nltk.corpus import stopwords
-from nltk.util import ngrams
+from pathlib import Path
 import re
 from toolz import pipe
-from typing import List, Tuple
+from typing import FrozenSet, Iterable, List, Optional, Tuple, Union
+
+from dap_job_quality.utils.chunk import map_chunks
+from dap_job_quality.utils.instrumentation import timed
 
 # Pattern for fixing a missing space between enumerations, for
 # split_sentences()
@@ -106,6 +115,15 @@ def replacements(text):
     return text.strip()
 
 
+# The cache of clean_text() and split_sentences(), see enable_text_cache()
+_text_cache = None
+
+
+def _clean_text(text: str) -> str:
+    return pipe(text, detect_camelcase, replacements)
+
+
+@timed("clean_text")
 def clean_text(text: str) -> List[str]:
     """Clean a job description by:
         - detecting camelcase
@@ -118,9 +136,42 @@ def clean_text(text: str) -> List[str]:
     Returns:
         List[str]: List of cleaned job description sentences
     """
-    return pipe(text, detect_camelcase, replacements)
+    if _text_cache is not None:
+        return _text_cache.get_or_compute(_clean_text, str(text))
+    return _clean_text(text)
+
+
+def _clean_chunk(texts: List[str]) -> List[str]:
+    return [clean_text(text) for text in texts]
+
 
+def clean_texts(
+    texts: Iterable[str], n_jobs: Optional[int] = 1, chunk_size: int = 10000
+) -> List[str]:
+    """Clean many job descriptions with clean_text(), in parallel processes.
 
+    Args:
+        texts (Iterable[str]): job descriptions, eg. a column of the ojo sample
+        n_jobs (Optional[int], optional): number of processes, where None is the
+            number of cores and 1 cleans in the current process. Defaults to 1.
+        chunk_size (int, optional): number of descriptions cleaned at a time by
+            each process. Defaults to 10000.
+
+    Returns:
+        List[str]: cleaned job descriptions, in the same order
+    """
+    if hasattr(texts, "tolist"):
+        texts = texts.tolist()
+    return [
+        clean
+        for chunk in map_chunks(
+            _clean_chunk, texts, chunk_size, n_jobs=n_jobs, executor="process"
+        )
+        for clean in chunk
+    ]
+
+
+@timed("split_sentences")
 def split_sentences(text: str) -> List[str]:
     """Splits job adverts into sentences.
 
@@ -133,6 +184,13 @@ def split_sentences(text: str) -> List[str]:
     Returns:
         List[str]: A list of sentences
     """
+    if _text_cache is not None:
+        # a copy, so the cached sentences can't be changed by the caller
+        return list(_text_cache.get_or_compute(_split_sentences, text))
+    return _split_sentences(text)
+
+
+def _split_sentences(text: str) -> List[str]:
     # split phrases on .?!
     pattern = re.compile(r"([.?!])\s*")
     # Split the text into sentences using the pattern
@@ -141,6 +199,66 @@ def split_sentences(text: str) -> List[str]:
     return list(set(sentences))
 
 
+def cleaner_version() -> str:
+    """Hash the cleaning rules and the source of the cleaning functions, so that
+    cached results are invalidated when any of them change.
+
+    Returns:
+        str: hex digest
+    """
+    import inspect
+
+    rules = [
+        exception_camelcases,
+        punctuation_replacement_rules,
+        compiled_missing_space_pattern.pattern,
+    ] + [
+        inspect.getsource(fn)
+        for fn in (detect_camelcase, replacements, _clean_text, _split_sentences)
+    ]
+    return md5(repr(rules).encode()).hexdigest()
+
+
+def enable_text_cache(
+    maxsize: int = 100000, path: Optional[Union[str, Path]] = None
+) -> "TextCache":
+    """Cache the results of clean_text() and split_sentences().
+
+    Args:
+        maxsize (int, optional): maximum number of results kept in memory.
+            Defaults to 100000.
+        path (Optional[Union[str, Path]], optional): sqlite file to also keep
+            every result in (eg. text_cache.TEXT_CACHE_PATH), or None to only
+            cache in memory. Defaults to None.
+
+    Returns:
+        TextCache: the cache, whose info() gives its hit rate
+    """
+    # imported here as the cache is optional
+    from dap_job_quality.utils.text_cache import TextCache
+
+    global _text_cache
+    disable_text_cache()
+    _text_cache = TextCache(cleaner_version(), maxsize=maxsize, path=path)
+    return _text_cache
+
+
+def disable_text_cache() -> Optional[dict]:
+    """Stop caching the results of clean_text() and split_sentences().
+
+    Returns:
+        Optional[dict]: the hit rate of the cache (see TextCache.info()), or
+            None if it wasn't enabled
+    """
+    global _text_cache
+    if _text_cache is None:
+        return None
+    info = _text_cache.info()
+    _text_cache.close()
+    _text_cache = None
+    return info
+
+
 def short_hash(text: str) -> int:
     """Create a short hash from a string
 
@@ -157,6 +275,41 @@ def short_hash(text: str) -> int:
     return int(short_code)
 
 
+@lru_cache(maxsize=None)
+def get_stop_words() -> FrozenSet[str]:
+    """Get the nltk English stopwords, loading them only once.
+
+    Returns:
+        FrozenSet[str]: stopwords
+    """
+    from nltk.corpus import stopwords
+
+    return frozenset(stopwords.words("english"))
+
+
+def tokenize_words(text: str) -> List[str]:
+    """
+    Tokenize the input text into lowercase words, removing non-alphabetic tokens and stopwords.
+
+    **Use `clean_text()` before using this function**
+
+    Args:
+        text (str): The text to be tokenized.
+
+    Returns:
+        List[str]: A list of tokens.
+    """
+    # nltk is imported here as it takes about a second to import
+    import nltk
+
+    stop_words = get_stop_words()
+    return [
+        word
+        for word in (token.lower() for token in nltk.word_tokenize(text))
+        if word.isalpha() and word not in stop_words
+    ]
+
+
 def tokenize(text: str, n: int = 2) -> List[Tuple[str, ...]]:
     """
     Tokenize the input text into n-grams.
@@ -175,11 +328,6 @@ def tokenize(text: str, n: int = 2) -> List[Tuple[str, ...]]:
     Returns:
         List[Tuple[str, ...]]: A list of n-grams, where each n-gram is represented as a tuple of strings.
     """
-    tokens = nltk.word_tokenize(text)
-    tokens = [
-        word.lower() for word in tokens if word.isalpha()
-    ]  # Remove non-alphabetic tokens
-    stop_words = set(stopwords.words("english"))
-    tokens = [word for word in tokens if word not in stop_words]
-    n_grams = list(ngrams(tokens, n))
-    return n_grams
+    from nltk.util import ngrams
+
+    return list(ngrams(tokenize_words(text), n))
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.sparse import csr_matrix
+
+from dap_job_quality.utils.aggregation import IndicatorCube, wilson_interval
+from dap_job_quality.utils.feature_matrix import FeatureMatrix
+
+
+def test_wilson_interval_known_values():
+    lower, upper = wilson_interval([5, 0, 10, 0], [10, 10, 10, 0])
+    assert lower[:3] == pytest.approx([0.2366, 0.0, 0.7225], abs=1e-4)
+    assert upper[:3] == pytest.approx([0.7634, 0.2775, 1.0], abs=1e-4)
+    assert np.isnan(lower[3]) and np.isnan(upper[3])
+
+
+@pytest.fixture
+def ads() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    n = 500
+    return pd.DataFrame(
+        {
+            "itl_1_name": rng.choice(["Wales", "Scotland", None], n),
+            "SOC_2digit": rng.choice(["11", "21", "32"], n),
+            "created": rng.choice(
+                pd.date_range("2023-01-01", "2023-12-31").astype(str), n
+            ),
+            "flexible_working": rng.random(n) < 0.3,
+            "pension": rng.random(n) < 0.6,
+        },
+        index=pd.Index([f"job{i}" for i in range(n)], name="id"),
+    )
+
+
+@pytest.fixture
+def cube(ads) -> IndicatorCube:
+    features = ["flexible_working", "pension"]
+    # counts rather than 0/1, as any non-zero entry counts
+    matrix = csr_matrix(ads[features].to_numpy(dtype=float) * 2)
+    return IndicatorCube(
+        FeatureMatrix(matrix, ads.index, features),
+        ads[["itl_1_name", "SOC_2digit", "created"]],
+    )
+
+
+@pytest.mark.parametrize(
+    "by", [[], ["itl_1_name"], ["itl_1_name", "SOC_2digit", "quarter"]]
+)
+def test_prevalence_matches_groupby_mean(ads, cube, by):
+    ads = ads.assign(
+        quarter=pd.to_datetime(ads["created"]).dt.to_period("Q").astype(str)
+    )
+    prevalence = cube.prevalence(by)
+    for feature in ["flexible_working", "pension"]:
+        shares = prevalence[prevalence["feature"] == feature]
+        if by:
+            expected = ads.dropna(subset=by).groupby(by)[feature].agg(["mean", "size"])
+            shares = shares.set_index(by)
+            assert shares.index.tolist() == expected.index.tolist()
+            assert shares["share"].to_numpy() == pytest.approx(expected["mean"])
+            assert (shares["n_ads"].to_numpy() == expected["size"].to_numpy()).all()
+        else:
+            assert shares["share"].tolist() == pytest.approx([ads[feature].mean()])
+
+
+def test_share_lookup(ads, cube):
+    wales = ads[(ads["itl_1_name"] == "Wales") & (ads["SOC_2digit"] == "11")]
+    share = cube.share("pension", itl_1_name="Wales", SOC_2digit="11")
+    assert share["n_ads"] == len(wales)
+    assert share["share"] == pytest.approx(wales["pension"].mean())
+    lower, upper = wilson_interval(wales["pension"].sum(), len(wales))
+    assert (share["ci_lower"], share["ci_upper"]) == pytest.approx((lower, upper))
+    assert share["ci_lower"] <= share["share"] <= share["ci_upper"]
+
+    assert cube.share("pension", itl_1_name="Narnia")["n_ads"] == 0
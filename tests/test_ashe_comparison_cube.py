@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+from dap_job_quality.pipeline.salary.ashe_comparison_cube import (
+    ASHE_COLUMNS,
+    ALL,
+    build_comparison_cube,
+    clean_ashe_table,
+    tidy_ashe_tables,
+)
+
+
+def ashe_sheet(median: float, trailing_nan_column: bool = True) -> pd.DataFrame:
+    rows = [
+        ["Description", "Code"] + [None] * (len(ASHE_COLUMNS) - 2),
+        ["All employees", ""] + [1.0, median] + [2.0] * (len(ASHE_COLUMNS) - 4),
+        ["Managers", "11"] + [1.0, median + 1] + [2.0] * (len(ASHE_COLUMNS) - 4),
+    ]
+    df = pd.DataFrame(rows)
+    if trailing_nan_column:
+        df[len(ASHE_COLUMNS)] = np.nan
+        df[len(ASHE_COLUMNS) + 1] = "notes"
+    return df
+
+
+def test_clean_ashe_table_with_and_without_an_all_nan_column():
+    for trailing_nan_column in [True, False]:
+        df = clean_ashe_table(ashe_sheet(30000.0, trailing_nan_column))
+        assert df.columns.tolist() == ASHE_COLUMNS
+        assert df["median"].tolist() == [30000.0, 30001.0]
+
+
+def test_comparison_cube_joins_ashe_of_the_same_financial_year():
+    ashe = pd.concat(
+        [
+            tidy_ashe_tables({"2": clean_ashe_table(ashe_sheet(median))}, year)
+            for year, median in [(2022, 30000.0), (2023, 31000.0)]
+        ]
+    )
+    ojo_aggregates = pd.DataFrame(
+        {
+            "financial_year": ["2022-23", "2023-24", "2024-25"],
+            "soc_level": ["SOC_2digit"] * 3,
+            "soc_code": ["11"] * 3,
+            "region": [ALL] * 3,
+        }
+    )
+    cube = build_comparison_cube(ojo_aggregates, ashe)
+    assert cube["ashe_median"].tolist()[:2] == [30001.0, 31001.0]
+    assert np.isnan(cube["ashe_median"].iloc[2])
+    assert len(cube) == len(ojo_aggregates)
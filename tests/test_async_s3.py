@@ -0,0 +1,93 @@
+import asyncio
+
+import boto3
+from botocore.exceptions import ClientError
+import pandas as pd
+import pytest
+
+moto = pytest.importorskip("moto")
+
+from dap_job_quality.getters.async_s3 import (  # noqa: E402
+    AsyncS3,
+    load_s3_objects,
+    run_sync,
+    save_s3_objects,
+)
+
+BUCKET = "dap-job-quality-test"
+
+
+@pytest.fixture
+def s3_client(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+class FlakyClient:
+    """S3 client whose first get_object calls fail with an error code."""
+
+    def __init__(self, client, code: str, status: int, failures: int):
+        self.client = client
+        self.code, self.status = code, status
+        self.failures = failures
+        self.calls = 0
+
+    def get_object(self, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ClientError(
+                {
+                    "Error": {"Code": self.code},
+                    "ResponseMetadata": {"HTTPStatusCode": self.status},
+                },
+                "GetObject",
+            )
+        return self.client.get_object(**kwargs)
+
+
+def test_save_and_load_round_trip(s3_client):
+    objects = {
+        "day=01/ads.json": {"id": "1", "salary": 25000},
+        "day=02/ads.jsonl": [{"id": "2"}, {"id": "3"}],
+        "day=03/ads.parquet": pd.DataFrame({"id": ["4", "5"], "salary": [1.0, 2.0]}),
+    }
+    save_s3_objects(BUCKET, objects, client=s3_client)
+    loaded = load_s3_objects(BUCKET, list(objects), client=s3_client)
+    assert loaded[:2] == [objects["day=01/ads.json"], objects["day=02/ads.jsonl"]]
+    pd.testing.assert_frame_equal(loaded[2], objects["day=03/ads.parquet"])
+
+
+def test_throttled_requests_are_retried(s3_client):
+    save_s3_objects(BUCKET, {"ads.json": [1, 2]}, client=s3_client)
+    client = FlakyClient(s3_client, "SlowDown", 503, failures=2)
+
+    async def load():
+        async with AsyncS3(retries=2, retry_wait=0, client=client) as s3:
+            return await s3.load(BUCKET, "ads.json")
+
+    assert asyncio.run(load()) == [1, 2]
+    assert client.calls == 3
+
+
+def test_missing_keys_are_not_retried(s3_client):
+    client = FlakyClient(s3_client, "NoSuchKey", 404, failures=0)
+    with pytest.raises(ClientError, match="NoSuchKey"):
+        load_s3_objects(BUCKET, ["missing.json"], client=client)
+    assert client.calls == 1
+
+
+def test_run_sync_in_a_running_event_loop():
+    async def answer():
+        return 42
+
+    async def notebook_cell():
+        # as in a notebook, whose event loop is already running
+        return run_sync(answer())
+
+    assert run_sync(answer()) == 42
+    assert asyncio.run(notebook_cell()) == 42
@@ -0,0 +1,27 @@
+from dap_job_quality.utils import instrumentation
+from dap_job_quality.utils.chunk import map_chunks
+from dap_job_quality.utils.instrumentation import increment, timed
+
+
+@timed("test.square")
+def square(x: int) -> int:
+    return x * x
+
+
+def square_chunk(chunk: list) -> list:
+    increment("test.items", len(chunk))
+    return [square(x) for x in chunk]
+
+
+def test_process_pool_metrics_are_merged():
+    instrumentation.reset_metrics()
+    increment("test.items", 100)
+    results = map_chunks(
+        square_chunk, list(range(10)), chunk_size=3, n_jobs=2, executor="process"
+    )
+    assert [x for chunk in results for x in chunk] == [x * x for x in range(10)]
+
+    metrics = instrumentation.get_metrics()
+    # the parent's count isn't counted again by forked workers
+    assert metrics["counters"]["test.items"] == 110
+    assert metrics["stages"]["test.square"]["calls"] == 10
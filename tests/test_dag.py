@@ -0,0 +1,74 @@
+import pandas as pd
+import pytest
+
+from dap_job_quality.pipeline import run_pipeline
+from dap_job_quality.pipeline.keyword_search import INPUT_PATH
+from dap_job_quality.utils import dag
+from dap_job_quality.utils.dag import Pipeline, Stage, StageCache
+
+
+def exploded() -> pd.DataFrame:
+    return pd.DataFrame({"phrase": ["a", "b", "c"]}, index=[5, 5, 7])
+
+
+def test_cached_output_equals_fresh_output(tmp_path):
+    pipeline = Pipeline([Stage("exploded", exploded)], StageCache(tmp_path))
+    fresh = pipeline.run()["exploded"]
+    assert pipeline.plan() == {"exploded": False}
+    pd.testing.assert_frame_equal(pipeline.run()["exploded"], fresh)
+    assert fresh.index.tolist() == [5, 5, 7]
+
+
+def read_lines(path: str) -> list:
+    with open(path) as f:
+        return f.read().splitlines()
+
+
+def count_lines(lines: list) -> int:
+    return len(lines)
+
+
+def test_only_stages_downstream_of_an_edited_file_run(tmp_path):
+    lookup = tmp_path / "lookup.csv"
+    lookup.write_text("a\n")
+    pipeline = Pipeline(
+        [
+            Stage("lines", read_lines, params={"path": str(lookup)}, files=[lookup]),
+            Stage("n_lines", count_lines, inputs=["lines"]),
+            Stage("other", exploded),
+        ],
+        StageCache(tmp_path / "cache"),
+    )
+    assert pipeline.run()["n_lines"] == 1
+    lookup.write_text("a\nb\n")
+    assert pipeline.plan() == {"lines": True, "n_lines": True, "other": False}
+    assert pipeline.run()["n_lines"] == 2
+
+
+def test_editing_the_keyword_lookup_only_reruns_the_keyword_search(
+    tmp_path, monkeypatch
+):
+    fingerprints = {str(INPUT_PATH): "v1"}
+    monkeypatch.setattr(
+        dag, "fingerprint_file", lambda path: fingerprints.get(str(path), "s3")
+    )
+    pipeline = Pipeline(run_pipeline.make_stages(), StageCache(tmp_path))
+    for name, key in pipeline.cache_keys().items():
+        pipeline.cache.save(name, key, None, {})
+    assert not any(pipeline.plan(run_pipeline.TARGETS).values())
+
+    fingerprints[str(INPUT_PATH)] = "v2"
+    plan = pipeline.plan(run_pipeline.TARGETS)
+    assert [name for name, runs in plan.items() if runs] == ["keyword_search"]
+
+
+def test_cycles_and_unknown_inputs_raise():
+    with pytest.raises(ValueError, match="Cycle"):
+        Pipeline(
+            [
+                Stage("a", count_lines, inputs=["b"]),
+                Stage("b", count_lines, inputs=["a"]),
+            ]
+        )
+    with pytest.raises(ValueError, match="unknown stage"):
+        Pipeline([Stage("a", count_lines, inputs=["missing"])])
@@ -0,0 +1,22 @@
+import json
+
+import pytest
+
+from dap_job_quality.getters.data_getters import decode_object, encode_object
+
+TASKS = [
+    {"text": "hi", "meta": {"job_id": "1"}},
+    {"text": "café", "meta": {"job_id": "2"}},
+]
+
+
+@pytest.mark.parametrize("file_name", ["tasks.jsonl", "tasks.jsonl.gz"])
+def test_jsonl_round_trip_of_records(file_name):
+    assert decode_object(file_name, encode_object(TASKS, file_name)) == TASKS
+
+
+@pytest.mark.parametrize("file_name", ["tasks.jsonl", "tasks.jsonl.gz"])
+def test_jsonl_strings_are_saved_as_they_are(file_name):
+    jsonl = "".join(json.dumps(task, ensure_ascii=False) + "\n" for task in TASKS)
+    assert decode_object(file_name, encode_object(jsonl, file_name)) == TASKS
+    assert decode_object(file_name, encode_object(jsonl.encode(), file_name)) == TASKS
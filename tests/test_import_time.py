@@ -0,0 +1,11 @@
+import pytest
+
+from dap_job_quality.utils.import_time import IMPORT_BUDGETS, time_import
+
+
+# the import times are checked against their budgets by `make import-time`, as
+# they depend on the machine
+@pytest.mark.parametrize("module", IMPORT_BUDGETS)
+def test_imports_are_lazy(module):
+    _, lazy_modules_imported = time_import(module)
+    assert lazy_modules_imported == []
@@ -0,0 +1,39 @@
+import pandas as pd
+
+from dap_job_quality.utils.incremental import (
+    PartitionManifest,
+    load_partitions,
+    run_incremental,
+)
+
+
+def count_rows(partition_df: pd.DataFrame) -> pd.DataFrame:
+    return pd.DataFrame({"n_rows": [len(partition_df)]})
+
+
+def test_run_incremental_reprocesses_changed_partitions(tmp_path):
+    df = pd.DataFrame(
+        {"id": ["1", "2", "3"], "created": ["2023-01-01", "2023-01-01", "2023-01-02"]}
+    )
+    assert run_incremental(df, count_rows, tmp_path, "test") == [
+        "2023-01-01",
+        "2023-01-02",
+    ]
+    df.loc[2, "id"] = "4"
+    assert run_incremental(df, count_rows, tmp_path, "test") == ["2023-01-02"]
+    assert load_partitions(tmp_path)["n_rows"].tolist() == [2, 1]
+
+
+def test_empty_input_writes_manifest_and_loads_empty_frame(tmp_path):
+    df = pd.DataFrame({"id": [], "created": []})
+    assert run_incremental(df, count_rows, tmp_path, "test") == []
+    assert (tmp_path / "_manifest.json").exists()
+
+    output = load_partitions(tmp_path, columns=["n_rows"])
+    assert output.empty
+    assert output.columns.tolist() == ["n_rows"]
+
+
+def test_load_partitions_of_empty_manifest(tmp_path):
+    PartitionManifest(tmp_path, "test").save()
+    assert load_partitions(tmp_path).empty
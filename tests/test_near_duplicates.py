@@ -0,0 +1,32 @@
+import numpy as np
+
+from dap_job_quality.utils.near_duplicates import MinHashLSH
+
+
+def index_of_signatures(signatures: list, **kwargs) -> MinHashLSH:
+    index = MinHashLSH(num_perm=4, **kwargs)
+    index.keys = [chr(ord("A") + i) for i in range(len(signatures))]
+    index._signatures = np.array(signatures, dtype=np.uint32)
+    index._band_hashes = index._hash_bands(index._signatures)
+    return index
+
+
+def test_duplicate_clusters_compare_every_pair_in_a_bucket():
+    # two bands of two rows: A, B and C share the first band, and only A and C
+    # are near-duplicates, so B sorts between them in the bucket
+    index = index_of_signatures(
+        [[1, 1, 2, 3], [1, 1, 5, 6], [1, 1, 2, 4]], threshold=0.6
+    )
+    assert (index.bands, index.rows) == (2, 2)
+    assert index.duplicate_clusters() == [["A", "C"]]
+    # with a bucket size of 2, only neighbours in the bucket are compared
+    assert index.duplicate_clusters(max_bucket_size=2) == []
+
+
+def test_duplicate_clusters_of_near_duplicate_texts():
+    text = "We are looking for a care assistant to join our friendly team in Leeds"
+    index = MinHashLSH(threshold=0.5, clean=False).insert(
+        ["1", "2", "3"],
+        [text, text + " today", "Senior software engineer, remote, python and aws"],
+    )
+    assert index.duplicate_clusters() == [["1", "2"]]
@@ -0,0 +1,69 @@
+from collections import Counter
+
+from nltk import ngrams
+import pytest
+
+from dap_job_quality.utils.ngrams import NgramCounter
+
+TEXTS = [
+    "flexible working hours and flexible working",
+    "competitive salary and flexible working hours",
+    "salary salary salary",
+    "pension",
+]
+LABELS = ["flexibility", "flexibility", "pay", "pay"]
+
+
+def expected_counts(texts, labels, n) -> dict:
+    counts = {label: Counter() for label in labels}
+    for text, label in zip(texts, labels):
+        counts[label].update(ngrams(text.split(), n))
+    return counts
+
+
+@pytest.fixture
+def counter() -> NgramCounter:
+    counter = NgramCounter(ns=(1, 2, 3), tokenizer=str.split)
+    # added in chunks, as from a stream
+    counter.update(TEXTS[:2], LABELS[:2]).update(TEXTS[2:], LABELS[2:])
+    return counter
+
+
+@pytest.mark.parametrize("n", [1, 2, 3])
+def test_counts_match_nltk_ngrams(counter, n):
+    expected = expected_counts(TEXTS, LABELS, n)
+    most_common = counter.most_common(n, n_most_common=100)
+    for label, label_counts in expected.items():
+        assert dict(most_common[label]) == dict(label_counts)
+        # sorted by count
+        assert [count for _, count in most_common[label]] == sorted(
+            label_counts.values(), reverse=True
+        )
+    total = sum(expected.values(), Counter())
+    assert counter.ngram_counts(n).to_dict() == {
+        " ".join(ngram): count for ngram, count in total.items()
+    }
+
+
+def test_prune_drops_rare_ngrams_across_categories(counter):
+    counter.prune(min_count=2)
+    for n in [1, 2, 3]:
+        total = sum(expected_counts(TEXTS, LABELS, n).values(), Counter())
+        assert counter.ngram_counts(n).to_dict() == {
+            " ".join(ngram): count for ngram, count in total.items() if count >= 2
+        }
+
+
+def test_largest_vocabulary_that_fits_the_keys():
+    # 9-grams pack 7 bits per token, so token ids 0 to 127
+    counter = NgramCounter(ns=range(1, 10), tokenizer=str.split)
+    assert counter.bits_per_token == 7
+    tokens = [f"t{i}" for i in range(128)]
+    counter.update([" ".join(tokens)])
+    ngram_counts = counter.ngram_counts(9)
+    assert len(ngram_counts) == 120
+    assert ngram_counts.index[-1] == " ".join(tokens[-9:])
+    assert (ngram_counts.to_numpy() == 1).all()
+
+    with pytest.raises(ValueError, match="too large"):
+        counter.update(["t128"])
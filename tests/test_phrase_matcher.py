@@ -0,0 +1,16 @@
+import pytest
+
+pytest.importorskip("matplotlib")
+pytest.importorskip("wordcloud")
+
+from dap_job_quality.utils.eda_utils import PhraseMatcher  # noqa: E402
+
+
+def test_offsets_point_at_the_phrases():
+    matcher = PhraseMatcher({"flexibility": ["flexible working", "working"]})
+    text = "Based in İstanbul. We offer Flexible Working and more."
+    hits = matcher.find(text)
+    assert {hit["phrase"] for hit in hits} == {"flexible working", "working"}
+    for hit in hits:
+        assert text[hit["phrase_start"] : hit["phrase_end"]].lower() == hit["phrase"]
+        assert hit["sentence"] == "We offer Flexible Working and more."
@@ -0,0 +1,99 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dap_job_quality.utils.quantile_sketch import GroupedQuantileSketches, KLLSketch
+
+QUANTILES = np.linspace(0.01, 0.99, 99)
+
+
+@pytest.fixture(scope="module")
+def salaries() -> np.ndarray:
+    return np.random.default_rng(0).lognormal(10, 0.5, size=200000)
+
+
+def max_rank_error(sketch: KLLSketch, values: np.ndarray) -> float:
+    """Largest difference between each quantile and the true rank of its estimate."""
+    sorted_values = np.sort(values)
+    estimates = sketch.quantile(QUANTILES)
+    true_ranks = np.searchsorted(sorted_values, estimates, side="right") / len(values)
+    return np.abs(true_ranks - QUANTILES).max()
+
+
+def test_streamed_sketch_is_within_its_error_bound(salaries):
+    sketch = KLLSketch(seed=1)
+    for chunk in np.array_split(salaries, 20):
+        sketch.update(chunk)
+    assert sketch.n == len(salaries)
+    assert max_rank_error(sketch, salaries) <= sketch.rank_error
+    assert sketch.quantile([0, 1]).tolist() == [salaries.min(), salaries.max()]
+
+
+def test_merged_sketch_is_within_its_error_bound(salaries):
+    sketches = [
+        KLLSketch(seed=seed).update(chunk)
+        for seed, chunk in enumerate(np.array_split(salaries, 10))
+    ]
+    merged = sketches[0]
+    for sketch in sketches[1:]:
+        merged.merge(sketch)
+    assert merged.n == len(salaries)
+    assert max_rank_error(merged, salaries) <= merged.rank_error
+
+
+def test_small_sketches_are_exact():
+    values = np.array([3.0, 1.0, np.nan, 2.0, 5.0, 4.0])
+    sketch = KLLSketch().update(values)
+    assert sketch.n == 5
+    assert (
+        sketch.quantile([0.2, 0.5, 1]).tolist()
+        == np.nanquantile(values, [0.2, 0.5, 1], method="inverted_cdf").tolist()
+    )
+    assert sketch.rank(2.0) == 0.4
+
+
+def test_to_dict_round_trip(salaries):
+    sketch = KLLSketch(seed=1).update(salaries)
+    loaded = KLLSketch.from_dict(json.loads(json.dumps(sketch.to_dict())))
+    assert loaded.n == sketch.n
+    np.testing.assert_array_equal(
+        loaded.quantile(QUANTILES), sketch.quantile(QUANTILES)
+    )
+    # a loaded sketch can still be updated and merged
+    loaded.merge(KLLSketch(seed=2).update(salaries))
+    assert max_rank_error(loaded, np.concatenate([salaries, salaries])) <= (
+        loaded.rank_error
+    )
+
+
+def test_grouped_sketches_match_groupby(salaries):
+    df = pd.DataFrame(
+        {
+            "region": np.random.default_rng(1).choice(["a", "b", "c"], len(salaries)),
+            "salary": salaries,
+        }
+    )
+    df.loc[::100, "salary"] = np.nan
+    first, second = (
+        GroupedQuantileSketches(["region"], ["salary"], seed=1) for _ in "12"
+    )
+    for start in range(0, len(df) // 2, 20000):
+        first.update(df.iloc[start : min(start + 20000, len(df) // 2)])
+    second.update(df.iloc[len(df) // 2 :])
+    summary = first.merge(second).to_frame([10, 50, 90]).set_index("region")
+
+    grouped = df.groupby("region")["salary"]
+    pd.testing.assert_series_equal(
+        summary["salary_count"], grouped.count(), check_names=False
+    )
+    pd.testing.assert_series_equal(
+        summary["salary_mean"], grouped.mean(), check_names=False
+    )
+    for region, group in grouped:
+        values = np.sort(group.dropna().to_numpy())
+        for percentile in [10, 50, 90]:
+            estimate = summary.loc[region, f"salary_p{percentile}"]
+            true_rank = np.searchsorted(values, estimate, side="right") / len(values)
+            assert abs(true_rank - percentile / 100) <= KLLSketch().rank_error
@@ -0,0 +1,89 @@
+import boto3
+import pytest
+
+moto = pytest.importorskip("moto")
+
+from dap_job_quality.getters import data_getters  # noqa: E402
+
+BUCKET = "dap-job-quality-test"
+
+
+@pytest.fixture
+def s3_client(monkeypatch, tmp_path):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setattr(data_getters, "S3_MANIFEST_DIR", tmp_path / "manifests")
+    with moto.mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=BUCKET)
+        for day in range(5):
+            for part in range(4):
+                extension = "jsonl" if part % 2 else "parquet"
+                put(client, f"ojo/date={day:02d}/part-{part}.{extension}")
+        put(client, "ojo/readme.jsonl")
+        put(client, "ojo_old/part-0.jsonl")
+        yield client
+
+
+def put(client, key: str):
+    client.put_object(Bucket=BUCKET, Key=key, Body=b"{}")
+
+
+def serial_listing(client, root: str, suffix: str = "") -> list:
+    paginator = client.get_paginator("list_objects_v2")
+    return sorted(
+        obj["Key"]
+        for page in paginator.paginate(Bucket=BUCKET, Prefix=root)
+        for obj in page.get("Contents", [])
+        if obj["Key"].endswith(suffix)
+    )
+
+
+def list_keys(client, root: str, **kwargs) -> list:
+    return data_getters.list_s3_objects(BUCKET, root, client=client, **kwargs)[
+        "key"
+    ].tolist()
+
+
+@pytest.mark.parametrize("depth", [0, 1, 2])
+@pytest.mark.parametrize("root", ["ojo", "ojo/"])
+def test_listing_matches_serial_listing(s3_client, depth, root):
+    assert list_keys(s3_client, root, depth=depth) == serial_listing(s3_client, root)
+    assert list_keys(
+        s3_client, root, file_types="*.jsonl", depth=depth
+    ) == serial_listing(s3_client, root, ".jsonl")
+
+
+def test_manifest_delta_matches_full_listing(s3_client):
+    list_keys(s3_client, "ojo/", use_manifest=True)
+    put(s3_client, "ojo/date=04/part-9.jsonl")
+    put(s3_client, "ojo/date=05/part-0.jsonl")
+    put(s3_client, "ojo/new.jsonl")
+
+    delta = list_keys(s3_client, "ojo/", use_manifest=True)
+    assert delta == list_keys(s3_client, "ojo/", refresh=True)
+    assert delta == serial_listing(s3_client, "ojo/")
+
+
+def test_deleted_key_is_listed_until_refresh(s3_client):
+    list_keys(s3_client, "ojo/", use_manifest=True)
+    s3_client.delete_object(Bucket=BUCKET, Key="ojo/date=01/part-0.parquet")
+
+    assert "ojo/date=01/part-0.parquet" in list_keys(
+        s3_client, "ojo/", use_manifest=True
+    )
+    assert "ojo/date=01/part-0.parquet" not in list_keys(
+        s3_client, "ojo/", use_manifest=True, refresh=True
+    )
+    # the refreshed listing is saved to the manifest
+    assert list_keys(s3_client, "ojo/", use_manifest=True) == serial_listing(
+        s3_client, "ojo/"
+    )
+
+
+def test_get_s3_data_paths(s3_client, monkeypatch):
+    monkeypatch.setattr(data_getters, "get_s3_client", lambda: s3_client)
+    assert data_getters.get_s3_data_paths(
+        BUCKET, "ojo/", ["*.jsonl", "*.parquet"]
+    ) == serial_listing(s3_client, "ojo/")
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dap_job_quality.pipeline.salary.salary_internal_tests import (
+    applicable_rules,
+    evaluate_rules,
+    group_outlier_bounds,
+    load_salary_rules,
+    rule_columns,
+)
+
+
+@pytest.fixture
+def salaries() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "id": list("abcdefgh"),
+            "min_annualised_salary": [20000, 30000, np.nan, 10000, 1000, -5, 0, 20000],
+            "max_annualised_salary": [
+                25000,
+                20000,
+                600000,
+                np.nan,
+                50000,
+                10,
+                10,
+                20000,
+            ],
+        }
+    )
+
+
+def violated_ids(violations: pd.DataFrame, rule: str) -> list:
+    return sorted(violations.loc[violations["rule"] == rule, "id"])
+
+
+# the checks of the TestSalary class that the rules replaced
+def old_min_less_max_salaries(df: pd.DataFrame) -> list:
+    sal_diff = (df["max_annualised_salary"] - df["min_annualised_salary"]).fillna(0)
+    return sorted(df[sal_diff < 0]["id"])
+
+
+def old_max_salary_500k(df: pd.DataFrame) -> list:
+    return sorted(df[df["max_annualised_salary"] > 500000]["id"])
+
+
+def old_max_diff_10_times(df: pd.DataFrame) -> list:
+    return sorted(
+        df[df["max_annualised_salary"] > df["min_annualised_salary"] * 10]["id"]
+    )
+
+
+def test_rules_flag_the_same_ids_as_the_old_checks(salaries):
+    rules = applicable_rules(load_salary_rules(), salaries.columns)
+    assert "soc_4digit_outliers" not in rules
+    violations = evaluate_rules(salaries, rules)
+
+    assert violated_ids(violations, "min_less_max_salaries") == (
+        old_min_less_max_salaries(salaries)
+    )
+    assert violated_ids(violations, "max_salary_500k") == old_max_salary_500k(salaries)
+    assert violated_ids(violations, "max_diff_10_times") == (
+        old_max_diff_10_times(salaries)
+    )
+    # missing values are never flagged
+    assert violated_ids(violations, "min_less_max_salaries") == ["b"]
+    assert violated_ids(violations, "positive_salaries") == ["f", "g"]
+
+
+def test_group_outliers_respect_min_group_size():
+    rule = load_salary_rules()["soc_4digit_outliers"]
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        {
+            "id": [f"big{i}" for i in range(40)] + [f"small{i}" for i in range(5)],
+            "SOC_4digit": ["1111"] * 40 + ["2222"] * 5,
+            "mean_salary": np.concatenate(
+                [rng.normal(30000, 1000, 40), rng.normal(30000, 1000, 5)]
+            ),
+        }
+    )
+    df.loc[0, "mean_salary"] = 1000000
+    df.loc[1, "mean_salary"] = np.nan
+    df.loc[40, "mean_salary"] = 1000000
+
+    bounds = group_outlier_bounds(df, rule)
+    assert bounds.index.tolist() == ["1111"]
+    q1, q3 = np.nanquantile(df["mean_salary"][:40], [0.25, 0.75])
+    assert bounds.loc["1111"].tolist() == pytest.approx(
+        [q1 - 3 * (q3 - q1), q3 + 3 * (q3 - q1)]
+    )
+
+    violations = evaluate_rules(df, {"soc_4digit_outliers": rule})
+    # the small group is too small to have bounds
+    assert violated_ids(violations, "soc_4digit_outliers") == ["big0"]
+
+
+def test_rule_columns_ignore_numbers():
+    assert rule_columns({"fail_if": "max_annualised_salary > 1e6"}) == {
+        "max_annualised_salary"
+    }
+    assert rule_columns({"fail_if": "(a2 <= 1.5E+3) | (b > .5e-2 * c)"}) == {
+        "a2",
+        "b",
+        "c",
+    }
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from dap_job_quality.getters.data_getters import load_labelled_spans, scan_jsonl
+
+
+@pytest.fixture
+def prodigy_file(tmp_path):
+    # the first record has no spans, and the last has an extra field
+    records = [
+        {"text": "a", "answer": "accept", "meta": {"job_id": "1"}},
+        {"text": "b", "answer": "reject", "meta": {"job_id": "2"}, "spans": []},
+        {
+            "text": "c",
+            "answer": "accept",
+            "meta": {"job_id": "3"},
+            "spans": [{"start": 0, "end": 1, "label": "pay"}],
+            "_session_id": "x",
+        },
+    ]
+    file_path = tmp_path / "labelled.jsonl"
+    file_path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    return file_path, records
+
+
+def test_table_has_the_keys_of_every_record(prodigy_file):
+    file_path, records = prodigy_file
+    table = scan_jsonl(file_path, as_table=True)
+    assert table.column_names == ["text", "answer", "meta", "spans", "_session_id"]
+    assert table.column("spans").to_pylist() == [
+        None,
+        [],
+        [{"start": 0, "end": 1, "label": "pay"}],
+    ]
+    assert table.column("_session_id").to_pylist() == [None, None, "x"]
+
+
+def test_filter_and_projection(prodigy_file):
+    file_path, records = prodigy_file
+    assert scan_jsonl(
+        file_path, where={"answer": "accept"}, fields=["meta.job_id", "spans"]
+    ) == [
+        {"meta.job_id": "1", "spans": None},
+        {"meta.job_id": "3", "spans": records[2]["spans"]},
+    ]
+
+
+def test_records_match_across_byte_ranges(prodigy_file):
+    file_path, records = prodigy_file
+    assert scan_jsonl(file_path, range_size=1) == records
+
+
+def test_load_labelled_spans(prodigy_file):
+    file_path, records = prodigy_file
+    spans = load_labelled_spans([file_path])
+    assert spans.to_dict("records") == [
+        {"job_id": "3", "text": "c", "span": "c", "label": "pay"}
+    ]
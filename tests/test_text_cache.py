@@ -0,0 +1,28 @@
+import sqlite3
+
+from dap_job_quality.utils.text_cache import TextCache
+
+
+def shout(text: str) -> str:
+    return text.upper()
+
+
+def stored_rows(path) -> int:
+    return sqlite3.connect(path).execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+
+def test_results_are_written_in_batches_and_on_close(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = TextCache("v1", maxsize=1, path=path, write_batch_size=3)
+    assert [cache.get_or_compute(shout, text) for text in "abcde"] == list("ABCDE")
+    assert stored_rows(path) == 3
+    # a pending result evicted from memory is still found
+    assert cache.get_or_compute(shout, "d") == "D"
+    assert (cache.misses, cache.store_hits) == (5, 1)
+    cache.close()
+    assert stored_rows(path) == 5
+
+    cache = TextCache("v1", path=path)
+    assert cache.get_or_compute(shout, "d") == "D"
+    assert cache.info()["store_hits"] == 1
+    cache.close()